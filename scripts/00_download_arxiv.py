@@ -4,6 +4,8 @@ import requests, feedparser, yaml
 from urllib.parse import urlencode
 from tqdm import tqdm
 
+import perf
+
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 CFG_PATH = ROOT / "configs" / "data.yaml"
 
@@ -53,9 +55,13 @@ def build_url(query: str, start: int, max_results: int):
 
 def fetch_page(query: str, start: int, page_size: int, timeout: int):
     url = build_url(query, start, page_size)
-    r = requests.get(url, timeout=timeout, headers={"User-Agent": "AstroRerank/1.0 (mailto:your.email@example.com)"})
-    r.raise_for_status()
-    feed = feedparser.parse(r.text)
+    with perf.span("http_get"):
+        r = requests.get(url, timeout=timeout, headers={"User-Agent": "AstroRerank/1.0 (mailto:your.email@example.com)"})
+        r.raise_for_status()
+    perf.count("bytes_downloaded", len(r.content))
+    with perf.span("parse_feed") as sp:
+        feed = feedparser.parse(r.text)
+        sp.items = len(feed.entries)
     return feed
 
 def parse_entries(feed):
@@ -100,10 +106,14 @@ def harvest_category(cat: str, limit: int, page_size: int, delay_s: int, timeout
         except Exception as e:
             # transient network issue; wait and retry same page
             print(f"[warn] {cat}: HTTP error at start={start}: {e}. retrying in {delay_s}s", file=sys.stderr)
+            perf.count("http_retries")
             time.sleep(delay_s)
             continue
 
-        entries = parse_entries(feed)
+        with perf.span("parse_entries") as sp:
+            entries = parse_entries(feed)
+            sp.items = len(entries)
+        perf.hist("entries_per_page", len(entries))
 
         if not entries:
             empty_skips += 1
@@ -118,25 +128,31 @@ def harvest_category(cat: str, limit: int, page_size: int, delay_s: int, timeout
         empty_skips = 0  # reset after a successful non-empty page
 
         # write new entries
-        for rec in entries:
-            rid = rec["id"]
-            if rid in seen:
-                continue
-            out_f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-            seen.add(rid)
-            written += 1
-            pbar.update(1)
-            if written >= limit:
-                break
+        with perf.span("write") as sp:
+            before = written
+            for rec in entries:
+                rid = rec["id"]
+                if rid in seen:
+                    perf.count("duplicates_skipped")
+                    continue
+                out_f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                seen.add(rid)
+                written += 1
+                pbar.update(1)
+                if written >= limit:
+                    break
+            sp.items = written - before
 
         # next page
         start += page_size
-        time.sleep(delay_s)
+        with perf.span("polite_delay"):
+            time.sleep(delay_s)
 
     pbar.close()
     return written
 
 def main():
+    perf.enable()  # ASTRORAG_TRACE=<path> (this script takes no arguments)
     cfg = load_cfg()
     per_max = cfg["debug_per_category_max"] if cfg["debug"] else cfg["per_category_max"]
     out_path = ROOT / cfg["out_jsonl"]
@@ -1,6 +1,8 @@
 import argparse, json, os, glob, re
 from typing import List
 
+import perf
+
 def clean_text(s: str) -> str:
     if not s: return ""
     # strip LaTeX-y bits and excessive whitespace (light touch)
@@ -25,13 +27,16 @@ def iter_raw(raw_dir_glob: str):
         with open(p, "r") as f:
             for line in f:
                 try:
-                    obj = json.loads(line)
+                    with perf.span("parse_json", items=1):
+                        obj = json.loads(line)
                     yield obj
                 except Exception:
+                    perf.count("bad_json_lines")
                     continue
 
 def main(args):
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    perf.enable(args.trace)
 
     n_written = 0
     with open(args.out, "w") as w:
@@ -47,18 +52,22 @@ def main(args):
             if not paper_url or not text:
                 continue
 
-            chunks = chunk_words(text, args.chunk_size, args.overlap)
-            for i, ch in enumerate(chunks):
-                out_obj = {
-                    # keep schema aligned with your meta.jsonl downstream
-                    "paper_id": paper_url,        # URL form; embedding step will normalize if needed
-                    "title": title,               # for display only (NOT embedded)
-                    "chunk_id": i,
-                    "passage": ch,
-                    "category": cats if cats is not None else None
-                }
-                w.write(json.dumps(out_obj) + "\n")
-                n_written += 1
+            with perf.span("chunk") as sp:
+                chunks = chunk_words(text, args.chunk_size, args.overlap)
+                sp.items = len(chunks)
+            perf.hist("chunks_per_record", len(chunks))
+            with perf.span("write", items=len(chunks)):
+                for i, ch in enumerate(chunks):
+                    out_obj = {
+                        # keep schema aligned with your meta.jsonl downstream
+                        "paper_id": paper_url,        # URL form; embedding step will normalize if needed
+                        "title": title,               # for display only (NOT embedded)
+                        "chunk_id": i,
+                        "passage": ch,
+                        "category": cats if cats is not None else None
+                    }
+                    w.write(json.dumps(out_obj) + "\n")
+                    n_written += 1
 
     print(f"Wrote {n_written} passage chunks to {args.out}")
 
@@ -68,4 +77,5 @@ if __name__ == "__main__":
     ap.add_argument("--out", default="data/passages.jsonl", help="output JSONL of abstract-only chunks")
     ap.add_argument("--chunk_size", type=int, default=100, help="words per chunk (default: 100)")
     ap.add_argument("--overlap", type=int, default=30, help="word overlap between chunks (default: 30)")
+    ap.add_argument("--trace", default=None, help="write a perf trace JSON (perf.py) here")
     main(ap.parse_args())
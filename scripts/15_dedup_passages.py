@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Deduplicate chunked passages between 10_chunk_passages.py and 20_embed_and_index.py.
+
+Two passes over passages.jsonl:
+  1. versions  — arXiv IDs keep their version suffix (2509.26611v1, ...v2); only the newest version
+                 of each base ID is kept.
+  2. near-dups — MinHash signatures over word shingles, banded LSH for candidates, candidates kept
+                 as duplicates when the estimated Jaccard is >= --threshold (cross-listings,
+                 re-harvested records, boilerplate chunks). The first occurrence is canonical.
+
+Every removed passage is written to --dup_map as {"dup", "canonical", "reason", "jaccard"} with
+docids in the "<paper>:<chunk>" form used by runs and qrels. A dropped older version maps to the
+newest version's single most similar chunk, so 35_convert_run.py --dup_map can translate older runs
+one docid for one. For qrels (34_make_qrels.py, 41_eval_run.py, 43_compare_all_chunks.py --dup_map)
+an older version is the same paper: a query about it gets every chunk of the kept version, and a
+query about a paper removed as a near-duplicate gets the canonical chunks.
+
+MinHash is vectorised: shingles are hashed once per block of passages, all permutations are one
+broadcast (a * x + b) >> 32 over [shingles, num_perm], and per-passage minima are a reduceat.
+
+  python scripts/15_dedup_passages.py --in data/passages.jsonl --out data/passages.dedup.jsonl \
+      --dup_map data/passages.dups.jsonl
+"""
+
+import argparse, json, re, time, zlib
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+
+import perf
+from rank_eval import norm_paper
+
+_VERSION = re.compile(r"v(\d+)$")
+
+def split_version(paper: str):
+    """'2509.26611v2' -> ('2509.26611', 2); no suffix -> version 0."""
+    m = _VERSION.search(paper)
+    return (paper[:m.start()], int(m.group(1))) if m else (paper, 0)
+
+class MinHasher:
+    def __init__(self, num_perm=64, shingle=5, seed=13):
+        rng = np.random.default_rng(seed)
+        # odd 64-bit multipliers; the high 32 bits of a * x + b (mod 2^64) are a universal hash of x
+        self.a = (rng.integers(0, 2**63, num_perm, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self.num_perm, self.shingle = num_perm, shingle
+        self.vocab = {}
+
+    def shingles(self, text):
+        """uint64 hashes of the text's word k-grams (the whole text when shorter than k)."""
+        ids = np.fromiter((self.vocab.setdefault(w, zlib.crc32(w.encode())) for w in text.lower().split()),
+                          dtype=np.uint64)
+        if len(ids) == 0:
+            return ids
+        k = min(self.shingle, len(ids))
+        h = np.zeros(len(ids) - k + 1, dtype=np.uint64)
+        for j in range(k):   # polynomial rolling combination of k consecutive word hashes
+            h = h * np.uint64(1_000_003) + ids[j:len(ids) - k + 1 + j]
+        return np.unique(h)
+
+    def signatures(self, texts):
+        """[len(texts), num_perm] uint32 MinHash signatures."""
+        sh = [self.shingles(t) for t in texts]
+        lens = np.array([len(s) for s in sh])
+        sig = np.full((len(texts), self.num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        nz = np.flatnonzero(lens)
+        if len(nz):
+            flat = np.concatenate([sh[i] for i in nz])
+            with np.errstate(over="ignore"):
+                H = ((flat[:, None] * self.a + self.b) >> np.uint64(32)).astype(np.uint32)
+            starts = np.concatenate([[0], np.cumsum(lens[nz])[:-1]])
+            sig[nz] = np.minimum.reduceat(H, starts, axis=0)
+        return sig
+
+def lsh_pairs(sig, bands):
+    """Candidate (i, j) pairs, i < j, that share at least one band of their signatures."""
+    n, num_perm = sig.shape
+    rows = num_perm // bands
+    full = np.ascontiguousarray(sig).view(np.dtype((np.void, 4 * num_perm))).ravel()
+    pairs = set()
+    for b in range(bands):
+        band = np.ascontiguousarray(sig[:, b * rows:(b + 1) * rows]).view(np.dtype((np.void, 4 * rows))).ravel()
+        _, inv, counts = np.unique(band, return_inverse=True, return_counts=True)
+        if (counts == 1).all():
+            continue
+        # rows grouped by bucket, in row order within each bucket
+        order = np.argsort(inv, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        for bucket in np.flatnonzero(counts > 1):
+            members = order[bounds[bucket]:bounds[bucket + 1]]
+            # every pair is checked against --threshold before the union, so a link through one
+            # member is not enough: emit all pairs. Identical signatures (estimated Jaccard 1) pass
+            # any threshold, so those only link to their first copy, which keeps boilerplate
+            # buckets from growing quadratically.
+            _, first, inv = np.unique(full[members], return_index=True, return_inverse=True)
+            rep_of = members[first[inv.ravel()]]
+            pairs.update((int(r), int(m)) for r, m in zip(rep_of, members) if r != m)
+            reps = np.sort(members[first]).tolist()
+            pairs.update(combinations(reps, 2))
+    return pairs
+
+def find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def main(args):
+    perf.enable(args.trace)
+    t0 = time.perf_counter()
+    with perf.span("load") as sp:
+        recs = [json.loads(l) for l in open(args.inp)]
+        sp.items = len(recs)
+    papers = [norm_paper(r.get("paper_id", "")) for r in recs]
+    docids = [f"{p}:{int(r['chunk_id'])}" for p, r in zip(papers, recs)]
+
+    mh = MinHasher(args.num_perm, args.shingle, args.seed)
+    sig = np.empty((len(recs), args.num_perm), dtype=np.uint32)
+    with perf.span("minhash", items=len(recs)):
+        for s in range(0, len(recs), args.block):
+            sig[s:s + args.block] = mh.signatures([r.get("passage", "") for r in recs[s:s + args.block]])
+
+    def jaccard(i, j):
+        return float((sig[i] == sig[j]).mean())
+
+    removed = {}   # row -> (canonical row, reason, jaccard)
+
+    # 1. versions: newest version per base ID; older chunks map to the newest version's closest chunk
+    with perf.span("versions"):
+        newest = {}
+        for p in set(papers):
+            base, v = split_version(p)
+            if base not in newest or v > split_version(newest[base])[1]:
+                newest[base] = p
+        rows_of = defaultdict(list)
+        for i, p in enumerate(papers):
+            rows_of[p].append(i)
+        if not args.keep_versions:
+            for p, rows in rows_of.items():
+                keep = newest[split_version(p)[0]]
+                if p == keep:
+                    continue
+                cand = rows_of[keep]
+                for i in rows:
+                    sims = (sig[cand] == sig[i]).mean(1)
+                    j = cand[int(np.argmax(sims))]
+                    removed[i] = (j, "version", float(sims.max()))
+
+    # 2. near-duplicates among what is left; the earliest row of each cluster is canonical
+    with perf.span("lsh"):
+        alive = np.array([i for i in range(len(recs)) if i not in removed], dtype=np.int64)
+        pairs = lsh_pairs(sig[alive], args.bands)
+    with perf.span("verify", items=len(pairs)):
+        parent = list(range(len(alive)))
+        for a, b in sorted(pairs):
+            if jaccard(alive[a], alive[b]) >= args.threshold:
+                ra, rb = find(parent, a), find(parent, b)
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+        for k in range(len(alive)):
+            root = find(parent, k)
+            if root != k:
+                i, j = int(alive[k]), int(alive[root])
+                removed[i] = (j, "near_dup", jaccard(i, j))
+
+    with perf.span("write", items=len(recs)):
+        with open(args.out, "w") as w:
+            for i, r in enumerate(recs):
+                if i not in removed:
+                    w.write(json.dumps(r) + "\n")
+        with open(args.dup_map, "w") as w:
+            for i in sorted(removed):
+                j, reason, jac = removed[i]
+                while j in removed:   # a version's canonical chunk may itself be a near-duplicate
+                    j = removed[j][0]
+                w.write(json.dumps({"dup": docids[i], "canonical": docids[j], "reason": reason,
+                                    "jaccard": round(jac, 4)}) + "\n")
+
+    by_reason = defaultdict(int)
+    for _, reason, _ in removed.values():
+        by_reason[reason] += 1
+    print(f"[dedup] {len(recs)} passages, {len(pairs)} LSH candidate pairs; removed "
+          f"{by_reason['version']} older-version + {by_reason['near_dup']} near-duplicate chunks "
+          f"({time.perf_counter() - t0:.1f}s)")
+    print(f"✅ {len(recs) - len(removed)} passages → {args.out}, dup map → {args.dup_map}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in", dest="inp", required=True, help="passages.jsonl from 10_chunk_passages.py")
+    ap.add_argument("--out", required=True, help="deduplicated passages.jsonl for 20_embed_and_index.py")
+    ap.add_argument("--dup_map", required=True, help="JSONL of removed docid -> canonical docid")
+    ap.add_argument("--threshold", type=float, default=0.8, help="estimated Jaccard for a near-duplicate")
+    ap.add_argument("--num_perm", type=int, default=64, help="MinHash permutations (bands x rows)")
+    ap.add_argument("--bands", type=int, default=8, help="LSH bands; candidates share >= 1 band")
+    ap.add_argument("--shingle", type=int, default=5, help="words per shingle")
+    ap.add_argument("--block", type=int, default=2000, help="passages hashed per vectorised step")
+    ap.add_argument("--keep_versions", action="store_true", help="skip the version collapse")
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--trace", default=None, help="write a perf trace JSON (perf.py) here")
+    args = ap.parse_args()
+    if args.num_perm % args.bands:
+        ap.error("--num_perm must be a multiple of --bands")
+    main(args)
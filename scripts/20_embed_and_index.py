@@ -1,44 +1,177 @@
-import json, sys, numpy as np
-import torch
+import argparse, json, numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import faiss
 
-IN = Path(sys.argv[1])       # data/passages.jsonl
-INDEX_DIR = Path(sys.argv[2])# indexes/faiss_base
-MODEL = sys.argv[3] if len(sys.argv)>3 else "sentence-transformers/all-MiniLM-L6-v2"
-BATCH = int(sys.argv[4]) if len(sys.argv)>4 else 512
+import perf
+import memory_budget as mb
 
-INDEX_DIR.mkdir(parents=True, exist_ok=True)
-meta_out = (INDEX_DIR / "meta.jsonl").open("w")
+def parse_shard(s):
+    """'i/N' -> (i, N), 0 <= i < N."""
+    try:
+        i, n = (int(x) for x in s.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard wants i/N, got {s!r}")
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"--shard {s}: need 0 <= i < N")
+    return i, n
 
-model = SentenceTransformer(MODEL, device="cuda" if torch.cuda.is_available() else "cpu")
+def shard_rows(n_rows, i, n_shards):
+    """Contiguous line range of shard i, so concatenating shards 0..N-1 is the single-job row order."""
+    return i * n_rows // n_shards, (i + 1) * n_rows // n_shards
 
-# collect passages & map row->metadata
-passages = []
-with IN.open() as fin:
-    for line in fin:
-        rec = json.loads(line)
-        passages.append(rec)
+def iter_blocks(path, size, start=0, stop=None):
+    """Parsed passages of lines [start, stop) in lists of `size` (all of them when size is None)."""
+    block = []
+    with open(path) as fin:
+        for row, line in enumerate(fin):
+            if row < start:
+                continue
+            if stop is not None and row >= stop:
+                break
+            block.append(json.loads(line))
+            if size and len(block) == size:
+                yield block
+                block = []
+    if block:
+        yield block
 
-# embed
-texts = [p["passage"] for p in passages]
-embs = model.encode(texts, batch_size=BATCH, show_progress_bar=True, normalize_embeddings=True)
-embs = np.asarray(embs, dtype="float32")
+def model_item_bytes(model):
+    cfg = model[0].auto_model.config
+    return mb.encode_bytes_per_item(model.get_max_seq_length() or 256, cfg.hidden_size,
+                                    cfg.num_attention_heads, getattr(cfg, "intermediate_size", None))
 
-# FAISS IndexFlatIP (cosine via normalized vectors)
-dim = embs.shape[1]
-index = faiss.IndexFlatIP(dim)
-index.add(embs)
+class IndexSink:
+    """Adds vectors to a FAISS index; SQ8 / PQ are trained on the first vectors, which are buffered."""
 
-faiss.write_index(index, str(INDEX_DIR / "index.faiss"))
+    def __init__(self, factory, dim, n_train):
+        import faiss
+        # cosine via normalized vectors
+        self.index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+        self.n_train, self.pending = (0 if self.index.is_trained else n_train), []
 
-# save metadata
-for p in passages:
-    meta_out.write(json.dumps(p) + "\n")
-meta_out.close()
+    def add(self, embs):
+        if not self.index.is_trained:
+            self.pending.append(embs)
+            if sum(len(e) for e in self.pending) < self.n_train:
+                return
+            embs, self.pending = np.concatenate(self.pending), []
+            with perf.span("index_train", items=self.n_train):
+                self.index.train(embs[:self.n_train])
+        with perf.span("index_add", items=len(embs)):
+            self.index.add(embs)
 
-# save model name for reproducibility
-(INDEX_DIR / "model.txt").write_text(MODEL + "\n")
-print(f"Indexed {len(passages)} passages with dim={dim} using {MODEL}.")
+    def close(self, out_dir):
+        import faiss
+        with perf.span("write_index"):
+            faiss.write_index(self.index, str(out_dir / "index.faiss"))
 
+class ShardSink:
+    """Writes one shard's vectors straight into embeddings.npy (memmap); 23_merge_shards.py builds the index."""
+
+    def __init__(self, out_dir, rows, dim):
+        self.rows, self.done = rows, 0
+        self.embs = np.lib.format.open_memmap(out_dir / "embeddings.npy", mode="w+", dtype=np.float32,
+                                              shape=(rows[1] - rows[0], dim))
+
+    def add(self, embs):
+        with perf.span("write_vectors", items=len(embs)):
+            self.embs[self.done:self.done + len(embs)] = embs
+        self.done += len(embs)
+
+    def close(self, out_dir):
+        self.embs.flush()
+        del self.embs
+
+def main(args):
+    perf.enable(args.trace)
+    IN, INDEX_DIR = Path(args.passages), Path(args.index_dir)
+    budget = mb.budget_from(args.memory_budget)
+
+    rows = None
+    if args.shard is not None:
+        # each shard writes vectors + meta under <index_dir>/shards/; the merge step builds index.faiss
+        i, n_shards = args.shard
+        rows = shard_rows(mb.scan_jsonl(IN)[0], i, n_shards)
+        OUT = INDEX_DIR / "shards" / f"{i:03d}-of-{n_shards:03d}"
+    else:
+        OUT = INDEX_DIR
+    OUT.mkdir(parents=True, exist_ok=True)
+
+    with perf.span("load_model"):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model, device="cuda" if torch.cuda.is_available() else "cpu")
+    dim = model.get_sentence_embedding_dimension()
+
+    # without a budget: one block, flat index, --batch (the whole corpus in memory, as before)
+    batch, block, factory, plan = args.batch, None, "Flat", None
+    if budget is not None:
+        with perf.span("plan"):
+            n, text_bytes = mb.scan_jsonl(IN)
+            if rows is not None:
+                text_bytes, n = text_bytes * (rows[1] - rows[0]) // max(1, n), rows[1] - rows[0]
+            plan = mb.plan_build(budget, n, text_bytes, dim, mb.current_rss(), model_item_bytes(model),
+                                 max_batch=args.batch)
+        batch, block = plan["choices"]["encode_batch"], plan["choices"]["block_passages"]
+        factory = plan["choices"]["faiss_factory"]
+        print(mb.format_plan(plan))
+    elif rows is not None:
+        block = 8 * batch  # shards stream to disk anyway
+
+    if rows is not None:
+        sink = ShardSink(OUT, rows, dim)
+    else:
+        n_train = mb.TRAIN_VECTORS[plan["choices"]["index"]] if plan else 0
+        sink = IndexSink(factory, dim, min(plan["n_passages"], n_train) if plan else 0)
+
+    n_done = 0
+    start, stop = rows or (0, None)
+    with open(OUT / "meta.jsonl", "w") as meta_out:
+        for passages in iter_blocks(IN, block, start, stop):
+            texts = [p["passage"] for p in passages]
+            with perf.span("encode", items=len(texts)):
+                embs = model.encode(texts, batch_size=batch, show_progress_bar=block is None,
+                                    normalize_embeddings=True)
+                embs = np.asarray(embs, dtype="float32")
+            # nominal: the batches model.encode() is asked for, computed from --batch, not observed
+            for _ in range(len(texts) // batch):
+                perf.hist("encode_batch_size_nominal", batch)
+            if len(texts) % batch:
+                perf.hist("encode_batch_size_nominal", len(texts) % batch)
+            sink.add(embs)
+
+            # save metadata
+            with perf.span("write_meta", items=len(passages)):
+                for p in passages:
+                    meta_out.write(json.dumps(p) + "\n")
+            n_done += len(passages)
+            if block is not None:
+                print(f"[embed] {n_done:,} passages")
+    sink.close(OUT)
+
+    # save model name for reproducibility
+    (OUT / "model.txt").write_text(args.model + "\n")
+    if rows is not None:
+        (OUT / "shard.json").write_text(json.dumps({
+            "shard": args.shard[0], "n_shards": args.shard[1], "rows": list(rows), "dim": dim,
+            "model": args.model, "passages": str(IN)}) + "\n")
+        print(f"Embedded rows {rows[0]}-{rows[1]} ({n_done} passages) of {IN} into {OUT}.")
+    else:
+        print(f"Indexed {n_done} passages with dim={dim} using {args.model}.")
+    if plan is not None:
+        mb.check(plan, OUT / "memory_plan.json")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("passages", help="data/passages.jsonl")
+    ap.add_argument("index_dir", help="indexes/faiss_base")
+    ap.add_argument("model", nargs="?", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("batch", nargs="?", type=int, default=512,
+                    help="encode batch size (an upper bound under --memory_budget)")
+    ap.add_argument("--shard", type=parse_shard, default=None,
+                    help="i/N (0-based): embed only the i-th of N contiguous line ranges into "
+                         "<index_dir>/shards/; combine with 23_merge_shards.py")
+    ap.add_argument("--memory_budget", default=None,
+                    help="e.g. 3GB (or $ASTRORAG_MEMORY_BUDGET): stream the build and pick batch / block / "
+                         "index type (flat, SQ8, PQ) to fit; fails with the plan if it cannot")
+    ap.add_argument("--trace", default=None, help="write a perf trace JSON (perf.py) here ($ASTRORAG_TRACE)")
+    main(ap.parse_args())
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Tokenize every passage in meta.jsonl once with the cross-encoder's tokenizer.
+
+Output (see token_cache.py): a ragged int32 array whose row i is meta line i, e.g.
+  indexes/faiss_base/ce_tokens/{ids.npy, offsets.npy, info.json}
+
+32_rerank_cross_encoder.py and 60_rerank.py take --token_cache to reuse it instead of
+re-tokenizing the same passages for every query.
+"""
+
+import argparse, json
+
+from token_cache import tokenize_texts, write_ragged
+
+def iter_meta_texts(meta_path):
+    with open(meta_path) as f:
+        for line in f:
+            o = json.loads(line)
+            yield o.get("passage") or o.get("text") or ""
+
+def main(a):
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(a.model, use_fast=True)
+    texts = list(iter_meta_texts(a.meta))
+    n = write_ragged(a.out, tokenize_texts(tok, texts, a.max_tokens, a.batch),
+                     info={"tokenizer": a.model, "max_tokens": a.max_tokens, "meta": str(a.meta)})
+    print(f"✅ Cached tokens for {n} passages → {a.out}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--meta", required=True)       # indexes/faiss_base/meta.jsonl
+    ap.add_argument("--out", required=True)        # indexes/faiss_base/ce_tokens
+    ap.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2",
+                    help="reranker checkpoint whose tokenizer to use")
+    ap.add_argument("--max_tokens", type=int, default=512,
+                    help="keep at most this many tokens per passage (>= reranker max_len)")
+    ap.add_argument("--batch", type=int, default=1024)
+    main(ap.parse_args())
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Precompute per-token passage embeddings for late-interaction reranking.
+
+Encodes every passage in meta.jsonl with a checkpoint from 52_train_late_interaction.py and
+writes a memory-mapped token store (int8 + per-token scale by default) whose row i is meta
+line i, e.g. indexes/faiss_base/late_tokens/. Used by 60_rerank.py --mode late.
+"""
+
+import argparse, json
+
+def iter_meta_texts(meta_path):
+    with open(meta_path) as f:
+        for line in f:
+            o = json.loads(line)
+            yield o.get("passage") or o.get("text") or ""
+
+def main(a):
+    import torch
+    from late_interaction import LateInteractionEncoder, write_store
+    enc = LateInteractionEncoder.load(a.model)
+    if torch.cuda.is_available():
+        enc = enc.cuda()
+    texts = list(iter_meta_texts(a.meta))
+
+    def batches():
+        for start in range(0, len(texts), a.block):
+            yield enc.encode(texts[start:start + a.block], is_query=False, batch_size=a.batch)
+            print(f"  encoded {min(start + a.block, len(texts))}/{len(texts)}", flush=True)
+
+    n = write_store(a.out, batches(), enc.dim, a.dtype, info={"model": a.model, "meta": str(a.meta)})
+    print(f"✅ Stored token embeddings for {n} passages → {a.out}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--meta", required=True)       # indexes/faiss_base/meta.jsonl
+    ap.add_argument("--model", required=True)      # outputs/reranker/minilm_late
+    ap.add_argument("--out", required=True)        # indexes/faiss_base/late_tokens
+    ap.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--block", type=int, default=8192, help="passages encoded per write block")
+    main(ap.parse_args())
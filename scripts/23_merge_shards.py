@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Merge `20_embed_and_index.py --shard i/N` outputs into one index directory.
+
+Shards cover contiguous line ranges of passages.jsonl, so appending them in shard order gives
+exactly the row order (FAISS ids, meta.jsonl lines) of a single-job build. The merge refuses to
+run unless all N shards are present, agree on model / dim / input, and tile the rows without gaps.
+
+  # locally, N processes
+  for i in 0 1 2 3; do python scripts/20_embed_and_index.py data/passages.jsonl indexes/faiss_base --shard $i/4 & done; wait
+  python scripts/23_merge_shards.py --index_dir indexes/faiss_base
+
+  # SGE array job + dependent merge: see sge/embed_shards.sge
+"""
+
+import argparse, json, shutil
+from pathlib import Path
+
+import numpy as np
+
+import memory_budget as mb
+
+def load_shards(shard_root):
+    infos = []
+    for d in sorted(shard_root.iterdir()):
+        if (d / "shard.json").exists():
+            infos.append(dict(json.loads((d / "shard.json").read_text()), dir=d))
+    if not infos:
+        raise SystemExit(f"no finished shards (shard.json) under {shard_root}")
+    n_shards = infos[0]["n_shards"]
+    for key in ("n_shards", "dim", "model", "passages"):
+        values = {str(s[key]) for s in infos}
+        if len(values) > 1:
+            raise SystemExit(f"shards disagree on {key}: {sorted(values)}")
+    have = {s["shard"] for s in infos}
+    missing = sorted(set(range(n_shards)) - have)
+    if missing:
+        raise SystemExit(f"{len(missing)}/{n_shards} shards missing or unfinished: {missing}")
+    infos.sort(key=lambda s: s["shard"])
+    end = 0
+    for s in infos:
+        if s["rows"][0] != end:
+            raise SystemExit(f"shard {s['shard']} starts at row {s['rows'][0]}, expected {end}")
+        end = s["rows"][1]
+    return infos
+
+def main(args):
+    import faiss
+    index_dir = Path(args.index_dir)
+    shard_root = Path(args.shards) if args.shards else index_dir / "shards"
+    infos = load_shards(shard_root)
+    n, dim = infos[-1]["rows"][1], infos[0]["dim"]
+    print(f"[merge] {len(infos)} shards, {n:,} rows, dim={dim}, model={infos[0]['model']}")
+
+    budget = mb.budget_from(args.memory_budget)
+    plan = None
+    if budget is not None:
+        # no encoder here: only the index and the shard block being copied
+        text_bytes = sum((s["dir"] / "meta.jsonl").stat().st_size for s in infos)
+        plan = mb.plan_build(budget, n, text_bytes, dim, mb.current_rss(), 0)
+        plan["stage"] = "merge"
+        print(mb.format_plan(plan))
+    factory = plan["choices"]["faiss_factory"] if plan else args.factory
+
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        # train on an even sample across shards (first rows of each), deterministic
+        n_train = min(n, mb.TRAIN_VECTORS[plan["choices"]["index"]] if plan else mb.TRAIN_VECTORS["pq"])
+        per = -(-n_train // len(infos))
+        sample = np.concatenate([np.load(s["dir"] / "embeddings.npy", mmap_mode="r")[:per] for s in infos])
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with open(index_dir / "meta.jsonl", "wb") as meta_out:
+        for s in infos:
+            embs = np.load(s["dir"] / "embeddings.npy", mmap_mode="r")
+            if len(embs) != s["rows"][1] - s["rows"][0]:
+                raise SystemExit(f"shard {s['shard']}: {len(embs)} vectors for rows {s['rows']}")
+            for start in range(0, len(embs), args.block):
+                index.add(np.ascontiguousarray(embs[start:start + args.block], dtype=np.float32))
+            with open(s["dir"] / "meta.jsonl", "rb") as f:
+                shutil.copyfileobj(f, meta_out)
+    faiss.write_index(index, str(index_dir / "index.faiss"))
+    (index_dir / "model.txt").write_text(infos[0]["model"] + "\n")
+    (index_dir / "shards.json").write_text(json.dumps({
+        "factory": factory, "rows": n, "dim": dim, "model": infos[0]["model"], "passages": infos[0]["passages"],
+        "shards": [{"shard": s["shard"], "rows": s["rows"], "dir": str(s["dir"])} for s in infos]}, indent=2) + "\n")
+    if args.cleanup:
+        shutil.rmtree(shard_root)
+    print(f"✅ merged {index.ntotal:,} vectors ({factory}) → {index_dir / 'index.faiss'}")
+    if plan is not None:
+        mb.check(plan, index_dir / "memory_plan.json")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index_dir", required=True, help="same index_dir the shards were built with")
+    ap.add_argument("--shards", default=None, help="shard root (default: <index_dir>/shards)")
+    ap.add_argument("--factory", default="Flat", help="FAISS index_factory string, inner product (e.g. Flat, SQ8, PQ48)")
+    ap.add_argument("--block", type=int, default=65536, help="vectors added per step")
+    ap.add_argument("--memory_budget", default=None,
+                    help="e.g. 3GB (or $ASTRORAG_MEMORY_BUDGET): pick the index type to fit, as in 20_embed_and_index.py")
+    ap.add_argument("--cleanup", action="store_true", help="delete the shard directories after merging")
+    main(ap.parse_args())
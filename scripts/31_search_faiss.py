@@ -1,7 +1,11 @@
-import json, argparse, faiss
-from sentence_transformers import SentenceTransformer
+import json, argparse
 import numpy as np
 
+import perf
+import memory_budget as mb
+from exact_search import load_index
+from run_format import RunWriter
+
 def norm_paper(x: str) -> str:
     if not x: return ""
     x = x.strip()
@@ -10,38 +14,65 @@ def norm_paper(x: str) -> str:
     return x
 
 def load_meta(meta_path):
-    docids, texts = [], []
+    docids = []
     with open(meta_path) as f:
         for line in f:
             obj = json.loads(line)
             paper = norm_paper(obj.get("paper_id", ""))
             chunk_id = obj.get("chunk_id")
-            text = obj.get("passage") or obj.get("text") or ""
             if paper == "" or chunk_id is None:
                 continue
             docid = f"{paper}:{int(chunk_id)}"
             docids.append(docid)
-            texts.append(text)
-    return docids, texts
+    return docids
 
 def main(args):
-    index = faiss.read_index(args.index)
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    ids, _ = load_meta(args.meta)
+    perf.enable(args.trace)
+    budget = mb.budget_from(args.memory_budget)
+    with perf.span("load_model"):
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    plan = mb.plan_search(budget, args.index, args.meta, mb.current_rss()) if budget is not None else None
+    with perf.span("load_index"):
+        # embeddings.npy -> NumPy exact search (no faiss needed), else a FAISS index file
+        index = load_index(args.index, threads=args.threads, mmap=args.mmap)
+    with perf.span("load_meta"):
+        ids = load_meta(args.meta)
 
-    with open(args.queries) as qf, open(args.out, "w") as outf:
-        for line in qf:
-            q = json.loads(line)
-            emb = model.encode([q["query"]], normalize_embeddings=True)
-            D, I = index.search(np.array(emb, dtype=np.float32), args.topk)
-            for rank, (sid, score) in enumerate(zip(I[0], D[0]), start=1):
-                outf.write(f'{q["qid"]} Q0 {ids[sid]} {rank} {float(score):.6f} faiss\n')
+    # .npz output = binary run (run_format.py), anything else = TREC text
+    with open(args.queries) as qf:
+        queries = [json.loads(line) for line in qf]
+    outf = RunWriter(args.out, "faiss")
+    try:
+        for s in range(0, len(queries), args.query_batch):
+            batch = queries[s:s + args.query_batch]
+            with perf.span("encode", items=len(batch)):
+                emb = model.encode([q["query"] for q in batch], normalize_embeddings=True)
+            perf.hist("encode_batch_size", len(batch))
+            with perf.span("faiss_search", items=len(batch)):
+                D, I = index.search(np.array(emb, dtype=np.float32), args.topk)
+            for q, d, i in zip(batch, D, I):
+                outf.add(q["qid"], [ids[sid] for sid in i], d, rows=i)
+    finally:
+        # TREC lines are already on disk; .npz keeps the queries finished before an error
+        with perf.span("write_run", items=outf.n):
+            outf.close()
+    if plan is not None:
+        mb.check(plan)
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument("--index", required=True)
+    ap.add_argument("--index", required=True,
+                    help="index.faiss, or embeddings.npy (exact_search.py export) to search without faiss")
     ap.add_argument("--meta", required=True)
     ap.add_argument("--queries", required=True)
-    ap.add_argument("--out", required=True)
+    ap.add_argument("--out", required=True, help="run file; .npz for the binary format")
     ap.add_argument("--topk", type=int, default=100)
+    ap.add_argument("--query_batch", type=int, default=1, help="queries encoded and searched together")
+    ap.add_argument("--threads", type=int, default=None, help="search threads (FAISS OpenMP / NumPy block workers)")
+    ap.add_argument("--mmap", action="store_true",
+                    help="map index.faiss read-only instead of reading it (page cache shared by concurrent jobs)")
+    ap.add_argument("--memory_budget", default=None,
+                    help="e.g. 3GB (or $ASTRORAG_MEMORY_BUDGET): fail up front / after the run if the index does not fit")
+    ap.add_argument("--trace", default=None, help="write a perf trace JSON (perf.py) here")
     main(ap.parse_args())
@@ -1,8 +1,10 @@
 import argparse, json
 from pathlib import Path
-from collections import defaultdict
-import torch
-from sentence_transformers.cross_encoder import CrossEncoder
+
+import perf
+from ce_backend import BACKENDS, load_reranker
+from run_format import RunWriter, read_run
+from token_cache import RaggedTokens, docid_rows, score_cached
 
 def load_queries(p):
     q = {}
@@ -24,45 +26,76 @@ def load_meta_docid2text(meta_path):
             m[docid] = o.get("passage","")
     return m
 
-def parse_trec(run_path):
-    by_q = defaultdict(list)
-    with open(run_path) as f:
+def load_meta_docids(meta_path):
+    """Docids in meta row order (row i <-> token cache row i)."""
+    ids = []
+    with open(meta_path) as f:
         for line in f:
-            qid, _q0, docid, rank, score, tag = line.strip().split()
-            by_q[qid].append((int(rank), float(score), docid))
-    for qid in by_q:
-        by_q[qid].sort(key=lambda x: x[0])  # rank asc
-    return by_q
+            o = json.loads(line)
+            pid = (o.get("paper_id","").replace("http://arxiv.org/abs/","")
+                                   .replace("https://arxiv.org/abs/","")
+                                   .replace("arXiv:",""))
+            ids.append(f"{pid}:{int(o['chunk_id'])}")
+    return ids
+
+def parse_trec(run_path):
+    """qid -> [(rank, score, docid), ...] rank asc; TREC text or .npz (run_format.py)."""
+    return read_run(run_path).ranked()
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in_run", required=True)          # e.g. exp/chunk_300/faiss_top100.trec
     ap.add_argument("--meta", required=True)            # e.g. exp/chunk_300/index/meta.jsonl
     ap.add_argument("--queries", required=True)         # e.g. data/queries/dev.jsonl
-    ap.add_argument("--out", required=True)             # e.g. exp/chunk_300/ce_top100.trec
+    ap.add_argument("--out", required=True)             # e.g. exp/chunk_300/ce_top100.trec (or .npz)
     ap.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
     ap.add_argument("--batch", type=int, default=256)
+    ap.add_argument("--token_cache", default=None,
+                    help="dir from 21_pretokenize_passages.py (same meta + reranker tokenizer)")
+    ap.add_argument("--backend", choices=BACKENDS, default="torch",
+                    help="onnx/onnx-int8 need 51_export_reranker.py output under <model>/onnx")
+    ap.add_argument("--threads", type=int, default=None, help="CPU inference threads")
+    ap.add_argument("--trace", default=None, help="write a perf trace JSON (perf.py) here")
     args = ap.parse_args()
+    perf.enable(args.trace)
 
-    queries = load_queries(args.queries)
-    docid2text = load_meta_docid2text(args.meta)
-    run_by_q = parse_trec(args.in_run)
+    with perf.span("load_inputs"):
+        queries = load_queries(args.queries)
+        run_by_q = parse_trec(args.in_run)
+        if args.token_cache:
+            cache = RaggedTokens.open(args.token_cache)
+            row_of = docid_rows(load_meta_docids(args.meta))
+        else:
+            docid2text = load_meta_docid2text(args.meta)
 
+    import torch
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    ce = CrossEncoder(args.model, device=device)
+    with perf.span("load_model"):
+        ce = load_reranker(args.model, args.backend, threads=args.threads, device=device)
 
-    with open(args.out, "w") as outf:
+    outf = RunWriter(args.out, "ce")
+    try:
         for qid, results in run_by_q.items():
             q = queries.get(qid)
             if not q:
+                perf.count("queries_without_text")
                 continue
             docids = [d for _, _, d in results]
-            pairs = [(q, docid2text.get(d, "")) for d in docids]
-            scores = ce.predict(pairs, batch_size=args.batch)  # higher = more relevant
+            for s in range(0, len(docids), args.batch):
+                perf.hist("score_batch_size", min(args.batch, len(docids) - s))
+            with perf.span("score_pairs", items=len(docids)):
+                if args.token_cache:
+                    q_ids = ce.tokenizer(q, add_special_tokens=False)["input_ids"]
+                    rows = [row_of.get(d, -1) for d in docids]
+                    scores = score_cached(ce, q_ids, rows, cache, batch_size=args.batch)
+                else:
+                    pairs = [(q, docid2text.get(d, "")) for d in docids]
+                    scores = ce.predict(pairs, batch_size=args.batch)  # higher = more relevant
             order = sorted(zip(docids, scores), key=lambda x: x[1], reverse=True)
-
-            for rank, (docid, score) in enumerate(order, start=1):
-                outf.write(f"{qid} Q0 {docid} {rank} {float(score):.6f} ce\n")
+            outf.add(qid, [d for d, _ in order], [s for _, s in order])
+    finally:
+        with perf.span("write_run", items=outf.n):
+            outf.close()
 
     print(f"✅ Wrote reranked run to {args.out}")
 
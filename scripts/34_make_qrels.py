@@ -1,4 +1,4 @@
-import argparse, json, os
+import argparse, json, os, re
 
 def norm_paper(x: str) -> str:
     if not x: return ""
@@ -32,6 +32,20 @@ def main(args):
             docid = f"{paper}:{int(chunk_id)}"
             paper2docids.setdefault(paper, []).append(docid)
 
+    # chunks removed by 15_dedup_passages.py stay relevant through their canonical copy; an older
+    # arXiv version is the same paper, so it gets every chunk of the version that was kept
+    if args.dup_map:
+        in_meta = {p: list(d) for p, d in paper2docids.items()}
+        with open(args.dup_map) as f:
+            for line in f:
+                d = json.loads(line)
+                paper, kept = d["dup"].rsplit(":", 1)[0], d["canonical"].rsplit(":", 1)[0]
+                extra = [d["canonical"]]
+                if kept != paper and re.sub(r"v\d+$", "", kept) == re.sub(r"v\d+$", "", paper):
+                    extra += in_meta.get(kept, [])
+                docids = paper2docids.setdefault(paper, [])
+                docids.extend(x for x in dict.fromkeys(extra) if x not in docids)
+
     written = 0
     with open(args.out, "w") as w:
         for qid, paper in qid2paper.items():
@@ -45,4 +59,6 @@ if __name__ == "__main__":
     ap.add_argument("--queries", required=True)  # data/queries/dev.jsonl
     ap.add_argument("--meta", required=True)     # indexes/faiss_base/meta.jsonl
     ap.add_argument("--out", required=True)      # outputs/qrels/dev.qrels
+    ap.add_argument("--dup_map", default=None,   # data/passages.dups.jsonl from 15_dedup_passages.py
+                    help="map removed duplicate docids to their canonical docids")
     main(ap.parse_args())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Convert runs between TREC text and the binary .npz format (run_format.py); direction by suffix.
+
+  python scripts/35_convert_run.py --in outputs/runs/faiss_dev.trec --out outputs/runs/faiss_dev.npz \
+      --meta indexes/faiss_base/meta.jsonl      # optional: store FAISS row ids for each docid
+  python scripts/35_convert_run.py --in outputs/runs/faiss_dev.npz --out faiss_dev.trec
+
+  python scripts/35_convert_run.py --in faiss_dev.trec --out faiss_dev.dedup.trec \
+      --dup_map data/passages.dups.jsonl        # docids removed by 15_dedup_passages.py -> canonical
+
+TREC -> npz -> TREC is byte-identical for runs written by the scripts in this repo (%.6f scores).
+"""
+
+import argparse, json, time
+
+from rank_eval import norm_paper, read_dup_map
+from run_format import fill_rows, map_docids, read_run, write_run
+
+def load_meta_docids(meta_path):
+    with open(meta_path) as f:
+        return [f"{norm_paper(o.get('paper_id',''))}:{int(o['chunk_id'])}" for o in map(json.loads, f)]
+
+def main(a):
+    t0 = time.perf_counter()
+    run = read_run(a.inp)
+    t_read = time.perf_counter() - t0
+    if a.dup_map:
+        dups = read_dup_map(a.dup_map)
+        hit = sum(d in dups for d in run.docids)
+        dropped = map_docids(run, dups)
+        print(f"[dups] {hit} docids rewritten to canonical, {dropped} repeated entries dropped")
+    if a.meta:
+        fill_rows(run, load_meta_docids(a.meta))
+        print(f"[rows] {int((run.rows < 0).sum())} of {len(run)} entries not found in {a.meta}")
+    if a.tag:
+        run.tag, run.tags, run.tag_idx = a.tag, None, None
+    t0 = time.perf_counter()
+    write_run(a.out, run)
+    print(f"✅ {a.inp} → {a.out}: {len(run.qids)} queries, {len(run)} entries, "
+          f"score {run.score.dtype}  (read {t_read:.3f}s, write {time.perf_counter() - t0:.3f}s)")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in", dest="inp", required=True, help="TREC text or .npz run")
+    ap.add_argument("--out", required=True, help=".npz → binary, anything else → TREC text")
+    ap.add_argument("--meta", default=None, help="meta.jsonl to attach row ids (binary output)")
+    ap.add_argument("--tag", default=None, help="override the run tag")
+    ap.add_argument("--dup_map", default=None,
+                    help="15_dedup_passages.py dup map: rewrite removed docids to their canonical docids")
+    main(ap.parse_args())
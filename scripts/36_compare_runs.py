@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Per-query deltas and paired significance tests between runs (README Phase 5).
+
+For every pair of --runs and every metric@k it reports
+  - the mean delta (b - a) over the qrels queries (a query missing from a run scores 0, as in 33),
+  - a paired bootstrap CI and p-value,
+  - a paired randomization (sign-flip) test p-value,
+  - the queries with the largest wins and losses.
+
+Both tests are matrix products: per-query deltas for all pairs and metrics form D [queries, tests].
+One block of resampling weights W [resamples, queries] (multinomial counts for the bootstrap,
+random ±1 for the sign flips) is applied to every test at once as W @ D / n_queries. The same
+resamples are used for every pair, so 10k+ resamples over thousands of queries take seconds.
+
+  python scripts/36_compare_runs.py --qrels outputs/qrels/dev.qrels \
+      --runs outputs/runs/faiss_top100.trec outputs/runs/ce_top100.trec --out outputs/eval/compare.json
+"""
+
+import argparse, csv, json, time
+from itertools import combinations
+
+import numpy as np
+
+from rank_eval import METRICS, RelevanceTensor, load_run, read_qrels
+
+def _blocks(n_resamples, n_queries, max_bytes=64 << 20):
+    """Resample block sizes whose float64 weight matrix stays under max_bytes."""
+    step = max(1, min(n_resamples, max_bytes // (8 * max(1, n_queries))))
+    for start in range(0, n_resamples, step):
+        yield min(step, n_resamples - start)
+
+def paired_tests(D, n_resamples=10000, alpha=0.05, seed=0):
+    """D: [queries, tests] per-query deltas. Returns mean, bootstrap CI / p and randomization p per test."""
+    D = np.asarray(D, dtype=np.float64)
+    Q, T = D.shape
+    if Q == 0:
+        raise ValueError("paired_tests needs at least one query with deltas")
+    obs = D.mean(0, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+
+    boot = np.empty((n_resamples, T), dtype=np.float64)
+    perm_extreme = np.zeros(T, dtype=np.int64)
+    done = 0
+    for b in _blocks(n_resamples, Q):
+        # bootstrap: resampling queries with replacement == how often each query was drawn
+        draws = rng.integers(0, Q, size=(b, Q)) + (np.arange(b) * Q)[:, None]
+        W = np.bincount(draws.ravel(), minlength=b * Q).reshape(b, Q).astype(np.float64)
+        boot[done:done + b] = (W @ D) / Q
+        # randomization: swap a/b per query == flip the sign of its delta
+        S = rng.integers(0, 2, size=(b, Q), dtype=np.int8).astype(np.float64) * 2 - 1
+        perm = (S @ D) / Q
+        perm_extreme += (np.abs(perm) >= np.abs(obs) - 1e-12).sum(0)
+        done += b
+
+    lo, hi = np.percentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    # bootstrap p: how often the null-centred resampled mean is at least as extreme as observed
+    boot_p = ((np.abs(boot - obs) >= np.abs(obs) - 1e-12).sum(0) + 1) / (n_resamples + 1)
+    rand_p = (perm_extreme + 1) / (n_resamples + 1)
+    return {"mean": obs, "ci_low": lo, "ci_high": hi, "bootstrap_p": boot_p, "randomization_p": rand_p}
+
+def top_changes(delta, a_vals, b_vals, qids, n):
+    """Largest wins (b > a) and losses (b < a) as [{qid, a, b, delta}], most extreme first."""
+    order = np.argsort(delta, kind="stable")
+    def rows(idx):
+        return [{"qid": qids[i], "a": round(float(a_vals[i]), 4), "b": round(float(b_vals[i]), 4),
+                 "delta": round(float(delta[i]), 4)} for i in idx]
+    wins = [i for i in order[::-1][:n] if delta[i] > 0]
+    losses = [i for i in order[:n] if delta[i] < 0]
+    return rows(wins), rows(losses)
+
+def main(args):
+    t0 = time.perf_counter()
+    qrels = read_qrels(args.qrels)
+    runs = {run: load_run(run) for run in args.runs}
+    ks = sorted(set(args.ks))
+    rt = RelevanceTensor(runs, qrels, depth=max(ks), query_set="qrels")
+    pq = rt.per_query(ks)                                  # metric@k -> [runs, queries]
+    names, qids = rt.names, rt.qids
+    keys = [f"{m}@{k}" for k in ks for m in args.metrics]
+    pairs = list(combinations(range(len(names)), 2))
+    if not pairs:
+        raise SystemExit("need at least two --runs to compare")
+    if not qids:
+        raise SystemExit(f"no queries to compare: {args.qrels} has no query with a relevant doc")
+    print(f"[compare] {len(names)} runs, {len(qids)} queries, {len(pairs)} pairs x {len(keys)} metrics "
+          f"({time.perf_counter() - t0:.1f}s to load)")
+
+    # one column per (pair, metric)
+    tests = [(a, b, key) for a, b in pairs for key in keys]
+    D = np.stack([pq[key][b] - pq[key][a] for a, b, key in tests], axis=1)
+    t1 = time.perf_counter()
+    stats = paired_tests(D, args.n_resamples, args.alpha, args.seed)
+    print(f"[compare] {args.n_resamples} bootstrap + randomization resamples in {time.perf_counter() - t1:.1f}s")
+
+    results, rows = [], []
+    for j, (a, b, key) in enumerate(tests):
+        r = {"a": names[a], "b": names[b], "metric": key,
+             "mean_a": round(float(pq[key][a].mean()), 4),
+             "mean_b": round(float(pq[key][b].mean()), 4),
+             "delta": round(float(stats["mean"][j]), 4),
+             "ci_low": round(float(stats["ci_low"][j]), 4), "ci_high": round(float(stats["ci_high"][j]), 4),
+             "bootstrap_p": round(float(stats["bootstrap_p"][j]), 5),
+             "randomization_p": round(float(stats["randomization_p"][j]), 5),
+             "wins": int((D[:, j] > 0).sum()), "losses": int((D[:, j] < 0).sum()), "ties": int((D[:, j] == 0).sum())}
+        rows.append(dict(r))
+        if key == args.rank_by:
+            r["top_wins"], r["top_losses"] = top_changes(D[:, j], pq[key][a], pq[key][b], qids, args.top)
+        results.append(r)
+
+    out = {"qrels": args.qrels, "runs": names, "n_queries": len(qids), "n_resamples": args.n_resamples,
+           "alpha": args.alpha, "seed": args.seed, "comparisons": results}
+    with open(args.out, "w") as f:
+        json.dump(out, f, indent=2)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0]))
+            w.writeheader(); w.writerows(rows)
+
+    ci = int(round(100 * (1 - args.alpha)))
+    for r in results:
+        flag = "*" if r["randomization_p"] < args.alpha else " "
+        print(f"{flag} {r['metric']:10s} {r['a']} → {r['b']}: Δ={r['delta']:+.4f} "
+              f"[{r['ci_low']:+.4f}, {r['ci_high']:+.4f}] {ci}% CI  p_boot={r['bootstrap_p']:.4f} "
+              f"p_rand={r['randomization_p']:.4f}  W/L/T={r['wins']}/{r['losses']}/{r['ties']}")
+    print(f"✅ {len(results)} comparisons → {args.out}" + (f" and {args.csv}" if args.csv else ""))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--qrels", required=True)
+    ap.add_argument("--runs", nargs="+", required=True, help="two or more runs (TREC text or .npz)")
+    ap.add_argument("--out", required=True, help="JSON with CIs, p-values and top wins/losses per pair")
+    ap.add_argument("--csv", default=None, help="optional flat CSV, one row per (pair, metric)")
+    ap.add_argument("--ks", nargs="+", type=int, default=[10])
+    ap.add_argument("--metrics", nargs="+", choices=METRICS, default=list(METRICS))
+    ap.add_argument("--n_resamples", type=int, default=10000)
+    ap.add_argument("--alpha", type=float, default=0.05, help="CI level is 1 - alpha")
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--top", type=int, default=10, help="largest wins/losses listed per pair")
+    ap.add_argument("--rank_by", default="NDCG@10", help="metric@k used for the win/loss lists")
+    args = ap.parse_args()
+    keys = [f"{m}@{k}" for k in sorted(set(args.ks)) for m in args.metrics]
+    if args.rank_by not in keys:
+        ap.error(f"--rank_by {args.rank_by} is not computed; choose one of {', '.join(keys)}")
+    main(args)
@@ -1,73 +1,12 @@
-import argparse, os, subprocess, json, csv, math
+import argparse, os, subprocess, csv
 from pathlib import Path
-from collections import defaultdict
+
+from dag import DAG, Node, link
+from rank_eval import evaluate_runs, load_run, qrels_from_meta
 
 SCRIPTS = Path(__file__).resolve().parent    
 ROOT = SCRIPTS.parent                       
- 
-def parse_run(run_path):
-    by_q = defaultdict(list)
-    with open(run_path) as f:
-        for line in f:
-            qid, _q0, docid, rank, score, _tag = line.strip().split()
-            by_q[qid].append((int(rank), float(score), docid))
-    for qid in by_q:
-        by_q[qid].sort(key=lambda x: x[0])
-    return by_q
-
-def build_qrels_from_meta(queries_path, meta_path): 
-    q2paper = {}
-    with open(queries_path) as f:
-        for line in f:
-            obj = json.loads(line)
-            q2paper[obj["qid"]] = obj["paper_id"]
-
-    paper_to_docids = defaultdict(set)
-    with open(meta_path) as f:
-        for line in f:
-            m = json.loads(line)
-            pid_full = (m.get("paper_id") or "").strip()
-            pid = (
-                pid_full.replace("http://arxiv.org/abs/", "")
-                .replace("https://arxiv.org/abs/", "")
-                .replace("arXiv:", "")
-            )
-            docid = f"{pid}:{int(m['chunk_id'])}"
-            paper_to_docids[pid].add(docid)
-
-    qrels = {}
-    for qid, pid in q2paper.items():
-        qrels[qid] = paper_to_docids.get(pid, set())
-    return qrels
-
-def dcg_at_k(rels, k=10):
-    s = 0.0
-    for i, r in enumerate(rels[:k], start=1):
-        if r:
-            s += 1.0 / math.log2(i + 1)
-    return s
-
-def eval_run(run_by_q, qrels, k=10):
-    ndcg, mrr, recall, n = 0.0, 0.0, 0.0, 0
-    for qid, results in run_by_q.items():
-        gold = qrels.get(qid, set())
-        if not gold:
-            continue
-        n += 1
-        rels = [1 if docid in gold else 0 for _, _, docid in results[:k]]
-
-        dcg = dcg_at_k(rels, k)
-        idcg = dcg_at_k([1] * min(k, len(gold)), k) or 1.0
-        ndcg += dcg / idcg
-
-        rr = next((1.0 / i for i, r in enumerate(rels, start=1) if r), 0.0)
-        mrr += rr
-
-        recall += sum(rels) / max(1, len(gold))
-
-    if n == 0:
-        return 0.0, 0.0, 0.0
-    return ndcg / n, mrr / n, recall / n
+SGE_TEMPLATE = ROOT / "sge" / "dag_array.sge"
  
 def run(cmd):
     print("➤", " ".join(cmd))
@@ -83,6 +22,11 @@ def main():
     ap.add_argument("--topk", type=int, default=100)
     ap.add_argument("--batch", type=int, default=512)
     ap.add_argument("--outdir", default="exp/chunk_sweep")
+    ap.add_argument("--cpus", type=int, default=os.cpu_count() or 4, help="CPU slots for concurrent stages")
+    ap.add_argument("--mem_gb", type=float, default=16, help="memory slots for concurrent stages")
+    ap.add_argument("--force", action="store_true", help="rerun every stage even if cached")
+    ap.add_argument("--dry_run", action="store_true", help="print which stages are cached / would run")
+    ap.add_argument("--sge", action="store_true", help="submit stages as SGE array jobs (sge/dag_array.sge)")
     args = ap.parse_args()
 
     outdir = ROOT / args.outdir
@@ -97,36 +41,54 @@ def main():
              "--out", str(qpath),
              "--n", "500", "--seed", "42"])
 
+    # chunk → embed → search per size, as a content-hashed DAG: unchanged stages are reused from
+    # <outdir>/.cache, independent sizes run concurrently within --cpus / --mem_gb
+    raw_dir = ROOT / args.raw_dir
+    nodes = []
+    for size in args.sizes:
+        overlap = max(0, int(size * args.overlap_frac))
+        nodes += [
+            Node(f"chunk_{size}", ["python", str(SCRIPTS / "10_chunk_passages.py"),
+                                   "--raw_dir", str(raw_dir), "--out", "{out}/passages.jsonl",
+                                   "--chunk_size", str(size), "--overlap", str(overlap)],
+                 inputs=[raw_dir, SCRIPTS / "10_chunk_passages.py"], cpus=1, mem_gb=2),
+            Node(f"embed_{size}", ["python", str(SCRIPTS / "20_embed_and_index.py"),
+                                   f"{{chunk_{size}}}/passages.jsonl", "{out}/index", args.model, str(args.batch)],
+                 inputs=[SCRIPTS / "20_embed_and_index.py"], deps=[f"chunk_{size}"], cpus=4, mem_gb=8,
+                 qsub_args=["-l", "gpus=1"]),
+            Node(f"search_{size}", ["python", str(SCRIPTS / "31_search_faiss.py"),
+                                    "--index", f"{{embed_{size}}}/index/index.faiss",
+                                    "--meta", f"{{embed_{size}}}/index/meta.jsonl",
+                                    "--queries", str(qpath), "--out", "{out}/faiss_top100.trec",
+                                    "--topk", str(args.topk)],
+                 inputs=[qpath, SCRIPTS / "31_search_faiss.py"], deps=[f"embed_{size}"], cpus=2, mem_gb=4),
+        ]
+    dag = DAG(nodes, outdir / ".cache")
+    if args.dry_run or args.sge:
+        for name, state in dag.plan(args.force).items():
+            print(f"[dag] {state:6s}  {name}")
+    if args.sge:
+        dag.submit_sge(SGE_TEMPLATE, force=args.force, dry_run=args.dry_run)
+        print("Submitted; rerun without --sge once the jobs finish to link outputs and evaluate.")
+        return
+    if args.dry_run:
+        return
+    dag.run_local(args.cpus, args.mem_gb, force=args.force)
+
     results = []
     for size in args.sizes:
         overlap = max(0, int(size * args.overlap_frac))
         exp_dir = outdir / f"chunk_{size}"
-        exp_dir.mkdir(parents=True, exist_ok=True)
-
-        passages = exp_dir / "passages.jsonl"
+        # friendly paths (used by 32/43) point into the cache
+        link(dag.nodes[f"chunk_{size}"].out / "passages.jsonl", exp_dir / "passages.jsonl")
+        link(dag.nodes[f"embed_{size}"].out / "index", exp_dir / "index")
+        link(dag.nodes[f"search_{size}"].out / "faiss_top100.trec", exp_dir / "faiss_top100.trec")
         index_dir = exp_dir / "index"
         runfile = exp_dir / "faiss_top100.trec"
- 
-        run(["python", str(SCRIPTS / "10_chunk_passages.py"),
-             "--raw_dir", str(ROOT / args.raw_dir),
-             "--out", str(passages),
-             "--chunk_size", str(size),
-             "--overlap", str(overlap)])
- 
-        run(["python", str(SCRIPTS / "20_embed_and_index.py"),
-             str(passages), str(index_dir),
-             args.model, str(args.batch)])
- 
-        run(["python", str(SCRIPTS / "31_search_faiss.py"),
-             "--index", str(index_dir / "index.faiss"),
-             "--meta", str(index_dir / "meta.jsonl"),
-             "--queries", str(qpath),
-             "--out", str(runfile),
-             "--topk", str(args.topk)])
- 
-        qrels = build_qrels_from_meta(qpath, index_dir / "meta.jsonl")
-        run_by_q = parse_run(runfile)
-        ndcg, mrr, rec = eval_run(run_by_q, qrels, k=10)
+
+        qrels = qrels_from_meta(qpath, index_dir / "meta.jsonl")
+        m = evaluate_runs({"faiss": load_run(runfile)}, qrels, ks=[10], query_set="run", ties="file")["faiss"]
+        ndcg, mrr, rec = m["NDCG@10"], m["MRR@10"], m["Recall@10"]
 
         results.append({
             "chunk_size": size,
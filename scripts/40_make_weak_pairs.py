@@ -3,6 +3,8 @@ import argparse, json, os, re
 from collections import defaultdict
 from typing import Dict, List, Tuple
 
+from run_format import group_ranked, is_binary, read_run
+
 def norm_paper(x: str) -> str:
     return (x or "").replace("http://arxiv.org/abs/","").replace("https://arxiv.org/abs/","").replace("arXiv:","").strip()
 
@@ -18,6 +20,8 @@ def load_qrels(path: str) -> Dict[str, set]:
     return qrels
 
 def load_run(path: str) -> Dict[str, List[Tuple[int, str, float]]]:
+    if is_binary(path):
+        return group_ranked(read_run(path))
     run = defaultdict(list)
     with open(path) as f:
         for line in f:
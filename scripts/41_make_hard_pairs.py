@@ -3,7 +3,7 @@
 Build hard-negative training pairs for the cross-encoder.
 
 Inputs:
-  --run     : TREC run from 31_search_faiss.py  (e.g., outputs/runs/faiss_dev.trec)
+  --run     : TREC run from 31_search_faiss.py  (e.g., outputs/runs/faiss_dev.trec, or a .npz run)
   --qrels   : TREC qrels from 34_make_qrels.py  (e.g., outputs/qrels/dev.qrels)
   --queries : JSONL with {"qid","query","paper_id"} (same file used by 31/34)
   --meta    : JSONL with {"paper_id","chunk_id","passage"| "text"} (same file used to build FAISS index)
@@ -21,6 +21,8 @@ import argparse, json
 from collections import defaultdict
 from pathlib import Path
 
+from run_format import is_binary, read_run
+
 def norm_paper(x: str) -> str:
     return (x or "").replace("http://arxiv.org/abs/","").replace(
         "https://arxiv.org/abs/","").replace("arXiv:","").strip()
@@ -81,6 +83,8 @@ def load_qrels_trec(path):
 
 def load_run_trec(path, topk):
     """Return run as: qid -> [docid,...] limited to topk (keeps original rank order)."""
+    if is_binary(path):
+        return read_run(path).ranked_docids(depth=topk)
     run = defaultdict(list)
     with open(path) as f:
         for line in f:
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Mine hard-negative training pairs directly against the FAISS index, in one pass.
+
+Same output as 41_make_hard_pairs.py ({"qid","query","pos","negs"} per row), but instead of
+reading a TREC run written by 31_search_faiss.py it:
+  - encodes the queries in batches and searches the index in memory,
+  - applies the qrels and same-paper exclusions as vectorized masks over FAISS row ids,
+  - serializes the training rows in a process pool.
+
+Positives come from --qrels if given, else every chunk of the query's paper (like 34_make_qrels.py).
+"""
+
+import argparse, json, os
+import multiprocessing as mp
+from pathlib import Path
+
+import numpy as np
+
+from rank_eval import norm_paper
+
+def load_meta(meta_path):
+    """Row-aligned docids, paper ids, chunk ids and texts."""
+    docids, papers, chunks, texts = [], [], [], []
+    with open(meta_path) as f:
+        for line in f:
+            o = json.loads(line)
+            paper = norm_paper(o.get("paper_id", ""))
+            cid = int(o.get("chunk_id") or 0)
+            docids.append(f"{paper}:{cid}")
+            papers.append(paper)
+            chunks.append(cid)
+            texts.append(o.get("passage") or o.get("text") or "")
+    return docids, papers, np.asarray(chunks, dtype=np.int64), texts
+
+def load_queries(path):
+    qids, qtext, qpaper = [], [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            o = json.loads(line)
+            qids.append(o["qid"]); qtext.append(o.get("query", "")); qpaper.append(norm_paper(o.get("paper_id", "")))
+    return qids, qtext, qpaper
+
+def positive_keys(qids, qpaper, docids, paper_code, code_of, qrels_path):
+    """int64 keys q_index * n_rows + row for every (query, relevant row)."""
+    n_rows = len(docids)
+    if qrels_path:
+        row_of = {d: i for i, d in reversed(list(enumerate(docids)))}
+        q_index = {q: i for i, q in enumerate(qids)}
+        keys = []
+        with open(qrels_path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 4 or int(parts[3]) <= 0:
+                    continue
+                qi, r = q_index.get(parts[0]), row_of.get(parts[2])
+                if qi is not None and r is not None:
+                    keys.append(qi * n_rows + r)
+        return np.unique(np.asarray(keys, dtype=np.int64))
+    # relevant = every chunk of the query's paper
+    order = np.argsort(paper_code, kind="stable")
+    bounds = np.searchsorted(paper_code[order], np.arange(len(code_of) + 1))
+    keys = [qi * n_rows + order[bounds[c]:bounds[c + 1]]
+            for qi, c in enumerate(code_of.get(p, -1) for p in qpaper) if c >= 0]
+    return np.unique(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+
+# --- row serialization (runs in worker processes; fork shares the big lists) ---
+_SHARED = {}
+
+def _serialize(job):
+    qis, pos_lists, neg_lists = job
+    s = _SHARED
+    out = []
+    for qi, pos_rows, neg_rows in zip(qis, pos_lists, neg_lists):
+        negs = [s["texts"][r] for r in neg_rows]
+        for p in pos_rows:
+            out.append(json.dumps({"qid": s["qids"][qi], "query": s["qtext"][qi],
+                                   "pos": s["texts"][p], "negs": negs}) + "\n")
+    return "".join(out)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", required=True, help="indexes/faiss_base/index.faiss")
+    ap.add_argument("--meta", required=True, help="indexes/faiss_base/meta.jsonl")
+    ap.add_argument("--queries", required=True, help="data/queries/train.jsonl")
+    ap.add_argument("--out", required=True, help="outputs/pairs/hard_pairs.jsonl")
+    ap.add_argument("--qrels", default=None, help="optional TREC qrels; default = same-paper chunks")
+    ap.add_argument("--model", default=None, help="bi-encoder; default = <index dir>/model.txt")
+    ap.add_argument("--topk", type=int, default=100, help="mine negatives from top-K retriever results")
+    ap.add_argument("--negs_per_row", type=int, default=4)
+    ap.add_argument("--exclude_same_paper", action=argparse.BooleanOptionalAction, default=True,
+                    help="skip negatives from the same paper_id as the query")
+    ap.add_argument("--rows_per_query", choices=["one", "per_positive"], default="one")
+    ap.add_argument("--batch", type=int, default=256, help="queries per encode/search batch")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    args = ap.parse_args()
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+
+    docids, papers, chunk_ids, texts = load_meta(args.meta)
+    qids, qtext, qpaper = load_queries(args.queries)
+    uniq, paper_code = np.unique(np.asarray(papers, dtype=object), return_inverse=True)
+    code_of = {p: i for i, p in enumerate(uniq)}
+    q_code = np.asarray([code_of.get(p, -1) if p else -1 for p in qpaper], dtype=np.int64)
+    n_rows = len(docids)
+    pos_keys = positive_keys(qids, qpaper, docids, paper_code, code_of, args.qrels)
+
+    model_name = args.model
+    if model_name is None:
+        mt = Path(args.index).parent / "model.txt"
+        model_name = mt.read_text().strip() if mt.exists() else "sentence-transformers/all-MiniLM-L6-v2"
+    import faiss
+    from sentence_transformers import SentenceTransformer
+    index = faiss.read_index(args.index)
+    model = SentenceTransformer(model_name)
+
+    # --- batched search + vectorized masks ---
+    pos_per_q, neg_per_q = [], []
+    for start in range(0, len(qids), args.batch):
+        qs = slice(start, start + args.batch)
+        emb = model.encode(qtext[qs], batch_size=args.batch, normalize_embeddings=True)
+        _D, I = index.search(np.asarray(emb, dtype=np.float32), args.topk)
+        qi = np.arange(start, start + len(I), dtype=np.int64)[:, None]
+
+        valid = I >= 0
+        rows = np.where(valid, I, 0)
+        relevant = np.isin(qi * n_rows + rows, pos_keys)
+        keep = valid & ~relevant
+        if args.exclude_same_paper:
+            keep &= ~((paper_code[rows] == q_code[qs][:, None]) & (q_code[qs][:, None] >= 0))
+        # first negs_per_row kept hits per query, in rank order
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :args.negs_per_row]
+        n_keep = np.minimum(keep.sum(1), args.negs_per_row)
+        for j in range(len(I)):
+            neg_per_q.append(rows[j, order[j, :n_keep[j]]].tolist())
+
+    # positives per query (from the key set), lowest chunk_id first
+    q_of_key, row_of_key = np.divmod(pos_keys, n_rows)
+    by_q = np.split(row_of_key, np.searchsorted(q_of_key, np.arange(1, len(qids))))
+    for pos_rows in by_q:
+        pos_rows = pos_rows[np.argsort(chunk_ids[pos_rows], kind="stable")].tolist()
+        pos_per_q.append(pos_rows[:1] if args.rows_per_query == "one" else pos_rows)
+
+    # --- parallel serialization, written in query order ---
+    todo = [qi for qi in range(len(qids)) if pos_per_q[qi]]
+    skipped = len(qids) - len(todo)
+    chunk = max(1, len(todo) // (args.workers * 8) + 1)
+    jobs = [(todo[s:s + chunk], [pos_per_q[q] for q in todo[s:s + chunk]],
+             [neg_per_q[q] for q in todo[s:s + chunk]]) for s in range(0, len(todo), chunk)]
+    _SHARED.update(texts=texts, qids=qids, qtext=qtext)
+    written = 0
+    with open(args.out, "w") as w:
+        if args.workers > 1 and "fork" in mp.get_all_start_methods():
+            with mp.get_context("fork").Pool(args.workers) as pool:
+                for blob in pool.imap(_serialize, jobs):
+                    w.write(blob); written += blob.count("\n")
+        else:
+            for job in jobs:
+                blob = _serialize(job)
+                w.write(blob); written += blob.count("\n")
+
+    print(f"[mine] searched {len(qids)} queries (top{args.topk}) against {index.ntotal} rows")
+    print(f"[mine] wrote {written} rows → {args.out}  (skipped {skipped} queries without positives)")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
-import json, csv, subprocess, glob, os
+"""
+FAISS vs cross-encoder comparison over every chunk_* dir of a chunk-size sweep.
+
+Reranks missing ce runs (32_rerank_cross_encoder.py), then evaluates all dirs in a process pool
+with rank_eval.py: each worker builds the qrels for its meta.jsonl once and scores both runs at
+every --ks cutoff in one pass. The CSV keeps the original @10 columns first.
+"""
+import argparse, csv, subprocess
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from rank_eval import METRICS, evaluate_runs, load_run, qrels_from_meta, query_papers
+
 ROOT = Path(__file__).resolve().parents[1]
 BASE = ROOT / "exp" / "chunk_sweep_fine"
 
@@ -9,24 +19,20 @@ def run(cmd):
     print("➤", " ".join(cmd))
     subprocess.run(cmd, check=True)
 
-def eval_run(run_path, meta, queries, k=10):
-    out = subprocess.check_output([
-        "python", "scripts/41_eval_run.py",
-        "--run", str(run_path),
-        "--meta", str(meta),
-        "--queries", str(queries),
-        "--k", str(k)
-    ], cwd=str(ROOT)).decode().strip()
-    # expects: NDCG@10=0.6502  MRR@10=0.6054  Recall@10=0.8000
-    parts = dict(x.split("=") for x in out.replace("NDCG@10","NDCG").replace("MRR@10","MRR").replace("Recall@10","Recall").split())
-    return float(parts["NDCG"]), float(parts["MRR"]), float(parts["Recall"])
+def eval_dir(job):
+    """(chunk_size, {"faiss": metrics, "ce": metrics}) for one chunk dir."""
+    d, q2paper, ks, dup_name = job
+    dup_map = d / dup_name if dup_name and (d / dup_name).exists() else None
+    qrels = qrels_from_meta(q2paper, d / "index" / "meta.jsonl", dup_map)
+    runs = {"faiss": load_run(d / "faiss_top100.trec"), "ce": load_run(d / "ce_top100.trec")}
+    return int(d.name.split("_")[1]), evaluate_runs(runs, qrels, ks=ks, query_set="run", ties="file")
 
-def main():
-    rows = []
-    for d in sorted(BASE.glob("chunk_*")):
-        size = int(d.name.split("_")[1])
+def main(a):
+    base = Path(a.base)
+    queries = Path(a.queries)
+    dirs = sorted(base.glob("chunk_*"))
+    for d in dirs:
         meta = d / "index" / "meta.jsonl"
-        queries = ROOT / "data" / "queries" / "dev.jsonl"
         faiss_run = d / "faiss_top100.trec"
         ce_run = d / "ce_top100.trec"
 
@@ -38,30 +44,49 @@ def main():
                 "--meta", str(meta),
                 "--queries", str(queries),
                 "--out", str(ce_run),
-                "--model", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+                "--model", a.model
             ],)
 
-        # evaluate both
-        n1,m1,r1 = eval_run(faiss_run, meta, queries, k=10)
-        n2,m2,r2 = eval_run(ce_run, meta, queries, k=10)
+    # evaluate both runs of every dir concurrently
+    ks = sorted(set(a.ks) | {10})
+    q2paper = query_papers(queries)
+    jobs = [(d, q2paper, ks, a.dup_map) for d in dirs]
+    with ProcessPoolExecutor(max_workers=a.workers) as pool:
+        results = list(pool.map(eval_dir, jobs))
 
-        rows.append({
-            "chunk_size": size,
-            "NDCG@10_faiss": round(n1,4), "MRR@10_faiss": round(m1,4), "Recall@10_faiss": round(r1,4),
-            "NDCG@10_ce":    round(n2,4), "MRR@10_ce":    round(m2,4), "Recall@10_ce":    round(r2,4),
-            "ΔNDCG": round(n2-n1,4), "ΔMRR": round(m2-m1,4), "ΔRecall": round(r2-r1,4)
-        })
-        print(f"[chunk {size}] ΔNDCG={n2-n1:.4f} ΔMRR={m2-m1:.4f} ΔRecall={r2-r1:.4f}")
+    rows = []
+    for size, m in results:
+        f, c = m["faiss"], m["ce"]
+        row = {"chunk_size": size}
+        for k in [10] + [k for k in ks if k != 10]:
+            for tag, src in (("faiss", f), ("ce", c)):
+                for metric in METRICS:
+                    row[f"{metric}@{k}_{tag}"] = round(src[f"{metric}@{k}"], 4)
+            for metric in METRICS:  # deltas of the rounded values, as before
+                delta = round(round(c[f"{metric}@{k}"], 4) - round(f[f"{metric}@{k}"], 4), 4)
+                row[f"Δ{metric}" if k == 10 else f"Δ{metric}@{k}"] = delta
+        rows.append(row)
+        print(f"[chunk {size}] ΔNDCG={row['ΔNDCG']:.4f} ΔMRR={row['ΔMRR']:.4f} ΔRecall={row['ΔRecall']:.4f}")
 
-    out_csv = BASE / "metrics_faiss_vs_ce.csv"
-    with open(out_csv, "w", newline="") as f:
+    out_csv = base / "metrics_faiss_vs_ce.csv"
+    with open(out_csv, "w", newline="") as fh:
         cols = ["chunk_size",
                 "NDCG@10_faiss","MRR@10_faiss","Recall@10_faiss",
                 "NDCG@10_ce","MRR@10_ce","Recall@10_ce",
                 "ΔNDCG","ΔMRR","ΔRecall"]
-        writer = csv.DictWriter(f, fieldnames=cols); writer.writeheader()
+        cols += [c for c in (rows[0] if rows else {}) if c not in cols]
+        writer = csv.DictWriter(fh, fieldnames=cols); writer.writeheader()
         for r in sorted(rows, key=lambda x: x["chunk_size"]): writer.writerow(r)
     print(f"\n✅ Wrote comparison: {out_csv}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default=str(BASE), help="sweep dir with chunk_*/{index/meta.jsonl,faiss_top100.trec}")
+    ap.add_argument("--queries", default=str(ROOT / "data" / "queries" / "dev.jsonl"))
+    ap.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    ap.add_argument("--ks", nargs="+", type=int, default=[1, 5, 10, 20, 100], help="cutoffs (10 is always included)")
+    ap.add_argument("--workers", type=int, default=None, help="evaluation processes (default: CPU count)")
+    ap.add_argument("--dup_map", default=None,
+                    help="dup map file name inside each chunk_* dir (15_dedup_passages.py --dup_map); "
+                         "dirs without one are scored without it")
+    main(ap.parse_args())
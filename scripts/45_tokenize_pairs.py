@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tokenize training pairs offline into memory-mapped shards for 50_train_reranker.py --train_shards.
+
+Input: the pair JSONL from 40_make_weak_pairs.py / 41_make_hard_pairs.py / 42_mine_pairs_from_index.py.
+Each row expands to (query, pos) -> 1.0 and (query, neg) -> 0.0, like load_pairs() in the trainer.
+
+Output layout:
+  <out>/manifest.json                     tokenizer, max_len, shard list per split
+  <out>/{train,dev}/shard_00000/
+      q/, p/        ragged token ids (see token_cache.py); q has one entry per JSONL row
+      qrow.npy      int32 [n_examples] -> row in q/
+      labels.npy    float32 [n_examples]
+"""
+
+import argparse, json, random
+from pathlib import Path
+
+import numpy as np
+
+from token_cache import tokenize_texts, write_ragged
+
+class ShardWriter:
+    def __init__(self, root: Path, split: str, shard_size: int, tok, max_len: int):
+        self.root, self.split, self.shard_size = root, split, shard_size
+        self.tok, self.max_len = tok, max_len
+        self.shards = []
+        self._reset()
+
+    def _reset(self):
+        self.queries, self.passages, self.qrow, self.labels = [], [], [], []
+
+    def add(self, query: str, pos: str, negs):
+        qi = len(self.queries)
+        self.queries.append(query)
+        for text, label in [(pos, 1.0)] + [(n, 0.0) for n in negs]:
+            self.passages.append(text); self.qrow.append(qi); self.labels.append(label)
+        if len(self.labels) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self.labels:
+            return
+        d = self.root / self.split / f"shard_{len(self.shards):05d}"
+        write_ragged(d / "q", tokenize_texts(self.tok, self.queries, self.max_len))
+        write_ragged(d / "p", tokenize_texts(self.tok, self.passages, self.max_len))
+        np.save(d / "qrow.npy", np.asarray(self.qrow, dtype=np.int32))
+        np.save(d / "labels.npy", np.asarray(self.labels, dtype=np.float32))
+        self.shards.append({"dir": str(d.relative_to(self.root)), "n": len(self.labels)})
+        print(f"  {self.split}: wrote {d.name} ({len(self.labels)} examples)", flush=True)
+        self._reset()
+
+def main(a):
+    root = Path(a.out)
+    root.mkdir(parents=True, exist_ok=True)
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(a.model, use_fast=True)
+    rng = random.Random(a.seed)
+    writers = {s: ShardWriter(root, s, a.shard_size, tok, a.max_len) for s in ("train", "dev")}
+
+    n_rows = 0
+    with open(a.train) as f:
+        for line in f:
+            o = json.loads(line)
+            negs = o.get("negs", [])
+            if a.max_negs_per_row is not None:
+                negs = negs[:a.max_negs_per_row]
+            split = "dev" if rng.random() < a.dev_ratio else "train"
+            writers[split].add(o["query"], o["pos"], negs)
+            n_rows += 1
+    for w in writers.values():
+        w.flush()
+
+    manifest = {
+        "tokenizer": a.model, "max_len": a.max_len, "source": a.train, "rows": n_rows,
+        "splits": {s: w.shards for s, w in writers.items()},
+        "examples": {s: sum(x["n"] for x in w.shards) for s, w in writers.items()},
+    }
+    (root / "manifest.json").write_text(json.dumps(manifest, indent=2) + "\n")
+    print(f"✅ {n_rows} rows → {manifest['examples']} examples in {root}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--train", required=True, help="pair JSONL, e.g. outputs/pairs/hard_pairs.jsonl")
+    ap.add_argument("--out", required=True, help="e.g. data/pairs/hard_pairs_tok")
+    ap.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2",
+                    help="tokenizer of the reranker you will train")
+    ap.add_argument("--max_len", type=int, default=320, help="per-text token cap (>= trainer --max_len)")
+    ap.add_argument("--max_negs_per_row", type=int, default=4)
+    ap.add_argument("--shard_size", type=int, default=200_000, help="examples per shard")
+    ap.add_argument("--dev_ratio", type=float, default=0.1, help="fraction of rows (queries) held out")
+    ap.add_argument("--seed", type=int, default=42)
+    main(ap.parse_args())
@@ -17,6 +17,23 @@ and fine-tunes a CrossEncoder.
 
 Recommended base model:
   cross-encoder/ms-marco-MiniLM-L-6-v2
+
+For millions of mined pairs, pre-tokenize them with 45_tokenize_pairs.py and pass
+--train_shards instead of --train: examples then stream from memory-mapped shards
+(shuffle buffer + DataLoader worker prefetch) and memory stays bounded.
+With --max_tokens_per_batch, pairs are grouped by length and batched by padded-token budget
+instead of a fixed --batch_size; per-epoch throughput and padding ratio are logged either way.
+
+Data-parallel CPU training (--train_shards only): launch with torchrun and every process joins a
+gloo DDP group, reads its own slice of the shards and syncs gradients every --grad_accum batches;
+only rank 0 logs and saves. Locally:
+  torchrun --standalone --nproc_per_node 4 scripts/50_train_reranker.py --train_shards ... --threads 8
+Across nodes add --nnodes N --node_rank R --master_addr HOST (see sge/train_reranker_cpu_ddp.sge).
+
+In-training evaluation (--train_shards only): with --eval_run/--eval_queries/--eval_qrels/--eval_meta
+the top --eval_depth candidates of a dev FAISS run are reranked before training, after every epoch
+and every --eval_steps optimizer steps; --out then holds the best checkpoint by --eval_metric
+(history in <out>/eval_log.json) instead of the last one.
 """
 
 import argparse
@@ -24,28 +41,26 @@ import json
 import os
 import random
 import math
+from collections import defaultdict
 from typing import List
 
-import torch
-from sentence_transformers import CrossEncoder, InputExample
-from torch.utils.data import DataLoader
+import perf
+from rank_eval import norm_paper
 
-try:
-    # If sklearn is available, we’ll use it for a clean split.
-    from sklearn.model_selection import train_test_split
-    HAVE_SKLEARN = True
-except Exception:
-    HAVE_SKLEARN = False
+# torch / sentence-transformers / ce_training are imported inside the functions, after argument
+# parsing, so `--help` and argument errors come back without loading them
 
 
 def set_seed(seed: int):
+    import torch
     random.seed(seed)
     torch.manual_seed(seed)
     torch.cuda.manual_seed_all(seed)
 
 
-def load_pairs(path: str, max_negs_per_row: int = None) -> List[InputExample]:
+def load_pairs(path: str, max_negs_per_row: int = None) -> List["InputExample"]:
     """Load weakly supervised pairs and expand to InputExample list."""
+    from sentence_transformers import InputExample
     rows: List[InputExample] = []
     with open(path) as f:
         for line in f:
@@ -64,7 +79,7 @@ def load_pairs(path: str, max_negs_per_row: int = None) -> List[InputExample]:
     return rows
 
 
-def simple_split(data: List[InputExample], test_size: float, seed: int):
+def simple_split(data: List["InputExample"], test_size: float, seed: int):
     """Fallback split if sklearn isn't available."""
     rng = random.Random(seed)
     data = data[:]  # copy
@@ -73,29 +88,128 @@ def simple_split(data: List[InputExample], test_size: float, seed: int):
     return data[n_test:], data[:n_test]
 
 
+def load_eval_set(a: argparse.Namespace):
+    """(queries, candidates, qrels, docids, passages) for RankingEvaluator."""
+    docids, passages = [], []
+    with open(a.eval_meta) as f:
+        for line in f:
+            o = json.loads(line)
+            docids.append(f"{norm_paper(o.get('paper_id', ''))}:{int(o.get('chunk_id') or 0)}")
+            passages.append(o.get("passage") or o.get("text") or "")
+    queries = {}
+    with open(a.eval_queries) as f:
+        for line in f:
+            if line.strip():
+                o = json.loads(line)
+                queries[o["qid"]] = o.get("query", "")
+    qrels = defaultdict(set)
+    with open(a.eval_qrels) as f:
+        for line in f:
+            qid, _, docid, rel = line.split()
+            if int(rel) > 0:
+                qrels[qid].add(docid)
+    run = defaultdict(list)
+    with open(a.eval_run) as f:
+        for line in f:
+            qid, _q0, docid, rank, _score, _tag = line.split()
+            if int(rank) <= a.eval_depth:
+                run[qid].append((int(rank), docid))
+    cands = {q: [d for _, d in sorted(v)] for q, v in run.items()}
+    if a.eval_max_queries:
+        cands = dict(list(cands.items())[:a.eval_max_queries])
+    return queries, cands, qrels, docids, passages
+
+
+def train_from_shards(a: argparse.Namespace, model: "CrossEncoder", device: str, rank: int, world: int):
+    """Stream pre-tokenized shards (45_tokenize_pairs.py) through a custom training loop."""
+    from torch.utils.data import DataLoader
+    from ce_training import (PairCollator, StreamingPairDataset, ThroughputLogger, TokenBudgetBatches,
+                             RankingEvaluator, is_main, pair_lengths, train_cross_encoder)
+    from token_cache import RaggedTokens
+    train_ds = StreamingPairDataset(a.train_shards, "train", shuffle=True,
+                                    shuffle_buffer=a.shuffle_buffer, seed=a.seed)
+    train_ds.rank, train_ds.world_size = rank, world
+    log = print if is_main() else (lambda *_, **__: None)
+    log(f"[data] train={len(train_ds)} examples in {len(train_ds.shards.entries)} shards  "
+          f"(dev={StreamingPairDataset(a.train_shards, 'dev').shards.n_examples})")
+    collate = PairCollator(model.tokenizer, a.max_len)
+    prefetch = a.prefetch if a.num_workers else None
+    if a.max_tokens_per_batch:
+        batches = TokenBudgetBatches(train_ds, model.tokenizer, a.max_len, a.max_tokens_per_batch,
+                                     pool_size=a.length_pool, max_batch=a.batch_size * 8)
+        loader = DataLoader(batches, batch_size=None, collate_fn=collate,
+                            num_workers=a.num_workers, prefetch_factor=prefetch)
+        steps_per_epoch = batches.estimate_steps(pair_lengths(train_ds.shards, model.tokenizer, a.max_len))
+    else:
+        batches = train_ds
+        loader = DataLoader(train_ds, batch_size=a.batch_size, collate_fn=collate,
+                            num_workers=a.num_workers, prefetch_factor=prefetch)
+        steps_per_epoch = max(1, math.ceil(len(train_ds) / a.batch_size))
+    steps_per_epoch = max(1, steps_per_epoch // world)  # batches per rank
+
+    warmup_steps = int(math.ceil(steps_per_epoch / a.grad_accum) * a.epochs * a.warmup_ratio)
+    log(f"[train] ranks={world}  batches/epoch/rank={steps_per_epoch}  grad_accum={a.grad_accum}  "
+        f"warmup_steps={warmup_steps}  workers={a.num_workers}  max_tokens_per_batch={a.max_tokens_per_batch or '-'}")
+    callbacks, evaluator = [ThroughputLogger(a.throughput_log if is_main() else None)], None
+    if a.eval_run:   # every rank: the evaluation is sharded across them
+        cache = RaggedTokens.open(a.eval_token_cache) if a.eval_token_cache else None
+        evaluator = RankingEvaluator(model, *load_eval_set(a), out_dir=a.out, cache=cache,
+                                     metric=a.eval_metric, batch_size=a.eval_batch, eval_steps=a.eval_steps)
+        callbacks.append(evaluator)
+    train_cross_encoder(model.model, loader, a.epochs, a.lr, warmup_steps, steps_per_epoch, device,
+                        on_epoch_start=batches.set_epoch, grad_accum=a.grad_accum, callbacks=callbacks)
+    return evaluator
+
+
 def main(a: argparse.Namespace):
+    import torch
+    from sentence_transformers import CrossEncoder
+    from torch.utils.data import DataLoader
+    from ce_training import init_distributed, is_main
     os.makedirs(a.out, exist_ok=True)
     set_seed(a.seed)
+    perf.enable(a.trace)  # one file per rank under torchrun (<trace>.rank<N>.json)
 
-    print(f"[cfg] model={a.model}  train={a.train}  out={a.out}")
+    print(f"[cfg] model={a.model}  train={a.train or a.train_shards}  out={a.out}")
     print(f"[cfg] epochs={a.epochs}  batch_size={a.batch_size}  lr={a.lr}  max_len={a.max_len}")
     print(f"[cfg] warmup_ratio={a.warmup_ratio}  seed={a.seed}")
 
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if a.train_shards:
+        rank, world = init_distributed()
+        if world > 1:
+            device = "cpu"  # gloo DDP targets the CPU nodes
+        if a.threads:
+            torch.set_num_threads(a.threads)
+        model = CrossEncoder(a.model, max_length=a.max_len, device=device)
+        evaluator = train_from_shards(a, model, device, rank, world)
+        if evaluator is not None and is_main():
+            print(f"[done] Best {a.eval_metric}={evaluator.best:.4f}; checkpoint in: {a.out}")
+        elif is_main() and not a.eval_run:
+            model.model.save_pretrained(a.out)
+            model.tokenizer.save_pretrained(a.out)
+            print(f"[done] Saved fine-tuned reranker to: {a.out}")
+        if world > 1:
+            torch.distributed.barrier()
+            torch.distributed.destroy_process_group()
+        return
+
     all_examples = load_pairs(a.train, max_negs_per_row=a.max_negs_per_row)
     if len(all_examples) < 10:
         raise ValueError(f"Too few training examples: {len(all_examples)}. "
                          f"Check that data/pairs/train_pairs.jsonl exists and is non-empty.")
 
-    if HAVE_SKLEARN:
+    try:
+        # If sklearn is available, we’ll use it for a clean split.
+        from sklearn.model_selection import train_test_split
         train_rows, dev_rows = train_test_split(
             all_examples, test_size=a.dev_ratio, random_state=a.seed, shuffle=True
         )
-    else:
+    except ImportError:
         train_rows, dev_rows = simple_split(all_examples, test_size=a.dev_ratio, seed=a.seed)
 
     print(f"[data] train={len(train_rows)}  dev={len(dev_rows)}  (total={len(all_examples)})")
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"[env] device={device}  cuda_available={torch.cuda.is_available()}  "
           f"gpu_count={torch.cuda.device_count()}")
 
@@ -109,15 +223,16 @@ def main(a: argparse.Namespace):
     warmup_steps = int(steps_per_epoch * a.epochs * a.warmup_ratio)
     print(f"[train] steps/epoch={steps_per_epoch}  warmup_steps={warmup_steps}")
 
-    model.fit(
-        train_dataloader=train_loader,
-        evaluator=None,
-        epochs=a.epochs,
-        optimizer_params={'lr': a.lr},
-        warmup_steps=warmup_steps,
-        output_path=a.out,
-        show_progress_bar=True
-    )
+    with perf.span("train.fit", items=len(train_rows) * a.epochs):
+        model.fit(
+            train_dataloader=train_loader,
+            evaluator=None,
+            epochs=a.epochs,
+            optimizer_params={'lr': a.lr},
+            warmup_steps=warmup_steps,
+            output_path=a.out,
+            show_progress_bar=True
+        )
 
     # (CrossEncoder wraps a HF AutoModelForSequenceClassification + tokenizer)
     model.model.save_pretrained(a.out)
@@ -129,7 +244,9 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2",
                     help="HuggingFace model id or local CE checkpoint.")
-    ap.add_argument("--train", required=True, help="JSONL from 40_make_weak_pairs.py")
+    ap.add_argument("--train", default=None, help="JSONL from 40_make_weak_pairs.py")
+    ap.add_argument("--train_shards", default=None,
+                    help="dir from 45_tokenize_pairs.py (streams pre-tokenized shards instead of --train)")
     ap.add_argument("--out", required=True, help="Output directory for the fine-tuned model")
     ap.add_argument("--lr", type=float, default=2e-5)
     ap.add_argument("--epochs", type=int, default=2)
@@ -141,4 +258,30 @@ if __name__ == "__main__":
     ap.add_argument("--seed", type=int, default=42)
     ap.add_argument("--max_negs_per_row", type=int, default=4,
                     help="Cap negatives per query row to bound expansion.")
-    main(ap.parse_args())
+    ap.add_argument("--shuffle_buffer", type=int, default=10_000, help="--train_shards: examples held for shuffling")
+    ap.add_argument("--num_workers", type=int, default=2, help="--train_shards: DataLoader workers")
+    ap.add_argument("--prefetch", type=int, default=4, help="--train_shards: batches prefetched per worker")
+    ap.add_argument("--max_tokens_per_batch", type=int, default=0,
+                    help="--train_shards: length-grouped batches of at most this many padded tokens (0 = fixed --batch_size)")
+    ap.add_argument("--length_pool", type=int, default=2000,
+                    help="--max_tokens_per_batch: examples sorted by length together")
+    ap.add_argument("--throughput_log", default=None, help="--train_shards: per-epoch throughput JSON")
+    ap.add_argument("--grad_accum", type=int, default=1, help="--train_shards: batches per optimizer step")
+    ap.add_argument("--threads", type=int, default=None, help="torch threads per process (set cores / nproc under DDP)")
+    ap.add_argument("--eval_run", default=None, help="--train_shards: dev FAISS run to rerank during training")
+    ap.add_argument("--eval_queries", default=None, help="dev queries JSONL for --eval_run")
+    ap.add_argument("--eval_qrels", default=None, help="dev qrels for --eval_run")
+    ap.add_argument("--eval_meta", default=None, help="index meta.jsonl the run's docids come from")
+    ap.add_argument("--eval_token_cache", default=None, help="21_pretokenize_passages.py cache for --eval_meta")
+    ap.add_argument("--eval_depth", type=int, default=50, help="candidates per dev query")
+    ap.add_argument("--eval_max_queries", type=int, default=None)
+    ap.add_argument("--eval_steps", type=int, default=0, help="also evaluate every N optimizer steps (0 = per epoch)")
+    ap.add_argument("--eval_batch", type=int, default=64)
+    ap.add_argument("--eval_metric", choices=["ndcg@10", "mrr@10"], default="ndcg@10")
+    ap.add_argument("--trace", default=None, help="write a perf trace JSON (perf.py) here")
+    args = ap.parse_args()
+    if bool(args.train) == bool(args.train_shards):
+        ap.error("pass exactly one of --train or --train_shards")
+    if args.eval_run and not (args.eval_queries and args.eval_qrels and args.eval_meta):
+        ap.error("--eval_run needs --eval_queries, --eval_qrels and --eval_meta")
+    main(args)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Export a fine-tuned cross-encoder (from 50_train_reranker.py) for fast CPU inference.
+
+Writes into <ckpt>/onnx (or --out):
+  model.onnx        fp32 ONNX graph with dynamic batch / sequence axes
+  model.int8.onnx   int8 dynamically-quantized weights (onnxruntime.quantization)
+  tokenizer files + export.json
+
+Use them with --backend onnx / onnx-int8 in 32_rerank_cross_encoder.py and 60_rerank.py.
+
+With --run/--queries/--meta the export also writes parity.json: for every backend, the
+Pearson/Spearman correlation of its scores with the fp32 torch model over the run's candidates
+and (with --qrels) NDCG@10 of the reranked lists.
+"""
+
+import argparse, json, math, time, inspect
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from ce_backend import BACKENDS, load_reranker
+from rank_eval import norm_paper
+
+def export_onnx(ckpt, out_dir: Path, max_len: int, opset: int):
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    class LogitsOnly(torch.nn.Module):
+        """Positional inputs -> logits, so the exported graph has plain named inputs/outputs."""
+        def __init__(self, model, names):
+            super().__init__()
+            self.model, self.names = model, names
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(self.names, inputs)), return_dict=True).logits
+
+    tok = AutoTokenizer.from_pretrained(ckpt, use_fast=True)
+    model = AutoModelForSequenceClassification.from_pretrained(ckpt).eval()
+
+    dummy = tok(["dark matter halo"], ["rotation curves of dwarf galaxies"], return_tensors="pt",
+                padding="max_length", max_length=16, truncation=True)
+    names = [n for n in tok.model_input_names if n in dummy]
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["logits"] = {0: "batch"}
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fp32 = out_dir / "model.onnx"
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False   # TorchScript exporter: no onnxscript dependency
+    with torch.no_grad():
+        torch.onnx.export(LogitsOnly(model, names), tuple(dummy[n] for n in names), str(fp32),
+                          input_names=names, output_names=["logits"],
+                          dynamic_axes=axes, opset_version=opset, **kwargs)
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    int8 = out_dir / "model.int8.onnx"
+    quantize_dynamic(str(fp32), str(int8), weight_type=QuantType.QInt8)
+
+    tok.save_pretrained(out_dir)
+    (out_dir / "export.json").write_text(json.dumps({
+        "source": str(ckpt), "max_length": max_len, "opset": opset,
+        "num_labels": model.config.num_labels, "inputs": names,
+    }, indent=2) + "\n")
+    mb = lambda p: round(p.stat().st_size / 2**20, 1)
+    print(f"[export] {fp32} ({mb(fp32)} MB)  {int8} ({mb(int8)} MB)")
+
+def load_candidates(run_path, meta_path, queries_path, depth):
+    d2t = {}
+    with open(meta_path) as f:
+        for line in f:
+            o = json.loads(line)
+            d2t[f"{norm_paper(o.get('paper_id',''))}:{int(o['chunk_id'])}"] = o.get("passage", "") or ""
+    qtext = {}
+    with open(queries_path) as f:
+        for line in f:
+            o = json.loads(line)
+            qtext[o["qid"]] = o["query"]
+    run = defaultdict(list)
+    with open(run_path) as f:
+        for line in f:
+            qid, _q0, docid, rank, _score, _tag = line.split()
+            if int(rank) <= depth and qid in qtext:
+                run[qid].append((int(rank), docid))
+    return {qid: (qtext[qid], [d for _, d in sorted(c)], [d2t.get(d, "") for _, d in sorted(c)])
+            for qid, c in run.items()}
+
+def load_qrels(path):
+    qrels = defaultdict(set)
+    with open(path) as f:
+        for line in f:
+            qid, _, docid, rel = line.split()
+            if int(rel) > 0:
+                qrels[qid].add(docid)
+    return qrels
+
+def ndcg_at_k(ranked, gold, k=10):
+    dcg = sum(1.0 / math.log2(i + 1) for i, d in enumerate(ranked[:k], start=1) if d in gold)
+    ideal = sum(1.0 / math.log2(i + 1) for i in range(1, min(k, len(gold)) + 1))
+    return dcg / ideal if ideal > 0 else 0.0
+
+def spearman(a, b):
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+def parity_report(a, out_dir: Path):
+    cands = load_candidates(a.run, a.meta, a.queries, a.depth)
+    qrels = load_qrels(a.qrels) if a.qrels else None
+    report, ref = {}, None
+    for backend in BACKENDS:
+        ce = load_reranker(a.model if not backend.startswith("onnx") else str(out_dir),
+                           backend, max_length=a.max_len, threads=a.threads, device="cpu")
+        scores, ndcgs, t0, n_pairs = {}, [], time.perf_counter(), 0
+        for qid, (q, docids, texts) in cands.items():
+            s = np.asarray(ce.predict([[q, t] for t in texts], batch_size=a.batch), dtype=np.float64)
+            scores[qid] = s
+            n_pairs += len(s)
+            if qrels is not None and qrels.get(qid):
+                ndcgs.append(ndcg_at_k([docids[i] for i in np.argsort(-s, kind="stable")], qrels[qid]))
+        secs = time.perf_counter() - t0
+        row = {"pairs_per_sec": round(n_pairs / max(secs, 1e-9), 1)}
+        if ndcgs:
+            row["NDCG@10"] = round(float(np.mean(ndcgs)), 4)
+        if ref is None:
+            ref = scores
+        else:
+            x = np.concatenate([ref[q] for q in ref]); y = np.concatenate([scores[q] for q in ref])
+            row["pearson"] = round(float(np.corrcoef(x, y)[0, 1]), 6)
+            row["spearman"] = round(spearman(x, y), 6)
+            row["spearman_per_query"] = round(float(np.nanmean(
+                [spearman(ref[q], scores[q]) for q in ref if len(ref[q]) > 1])), 6)
+            row["max_abs_diff"] = round(float(np.max(np.abs(x - y))), 6)
+            if "NDCG@10" in row and "NDCG@10" in report["torch"]:
+                row["NDCG@10_delta"] = round(row["NDCG@10"] - report["torch"]["NDCG@10"], 4)
+        report[backend] = row
+        print(f"[parity] {backend:10s} {json.dumps(row)}")
+    (out_dir / "parity.json").write_text(json.dumps(report, indent=2) + "\n")
+    print(f"✅ Wrote parity report → {out_dir / 'parity.json'}")
+
+def main(a):
+    out_dir = Path(a.out) if a.out else Path(a.model) / "onnx"
+    export_onnx(a.model, out_dir, a.max_len, a.opset)
+    if a.run:
+        parity_report(a, out_dir)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", required=True, help="checkpoint dir, e.g. outputs/reranker/minilm_ce_hard")
+    ap.add_argument("--out", default=None, help="default: <model>/onnx")
+    ap.add_argument("--max_len", type=int, default=320)
+    ap.add_argument("--opset", type=int, default=14)
+    # parity report (optional)
+    ap.add_argument("--run", default=None, help="TREC run whose candidates to score, e.g. faiss_top100.trec")
+    ap.add_argument("--meta", default=None)
+    ap.add_argument("--queries", default=None)
+    ap.add_argument("--qrels", default=None)
+    ap.add_argument("--depth", type=int, default=100)
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--threads", type=int, default=None)
+    a = ap.parse_args()
+    if a.run and not (a.meta and a.queries):
+        ap.error("--run needs --meta and --queries")
+    main(a)
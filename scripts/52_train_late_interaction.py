@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Train a late-interaction (MaxSim) reranker on the same pair files 50_train_reranker.py uses:
+  {"qid": ..., "query": ..., "pos": "...", "negs": ["...", ...]}
+
+Each row becomes a listwise example [pos, neg_1..neg_k] with a softmax loss over MaxSim scores.
+Output: checkpoint dir for 22_index_token_embeddings.py and 60_rerank.py --mode late.
+"""
+
+import argparse, json, os, random
+
+# torch / transformers load inside the functions, so `--help` answers without them
+
+def set_seed(seed: int):
+    import torch
+    random.seed(seed)
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+def load_rows(path, k_neg):
+    rows = []
+    with open(path) as f:
+        for line in f:
+            o = json.loads(line)
+            negs = o.get("negs", [])[:k_neg]
+            if not negs:
+                continue
+            while len(negs) < k_neg:      # pad by cycling so every row has the same list size
+                negs = negs + negs[:k_neg - len(negs)]
+            rows.append((o["query"], [o["pos"]] + negs))
+    return rows
+
+def main(a):
+    import torch
+    from transformers import get_linear_schedule_with_warmup
+    from late_interaction import LateInteractionEncoder, maxsim_loss
+
+    os.makedirs(a.out, exist_ok=True)
+    set_seed(a.seed)
+    rows = load_rows(a.train, a.k_neg)
+    if len(rows) < 2:
+        raise ValueError(f"Too few training rows with negatives in {a.train}: {len(rows)}")
+    print(f"[data] rows={len(rows)}  list_size={1 + a.k_neg}")
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    enc = LateInteractionEncoder(a.model, a.dim, a.max_len_q, a.max_len_p).to(device).train()
+    opt = torch.optim.AdamW(enc.parameters(), lr=a.lr)
+    steps = a.epochs * ((len(rows) + a.batch_size - 1) // a.batch_size)
+    sched = get_linear_schedule_with_warmup(opt, int(steps * a.warmup_ratio), steps)
+    print(f"[train] device={device}  steps={steps}")
+
+    step = 0
+    for epoch in range(a.epochs):
+        random.shuffle(rows)
+        total = 0.0
+        for start in range(0, len(rows), a.batch_size):
+            batch = rows[start:start + a.batch_size]
+            loss = maxsim_loss(enc, [q for q, _ in batch], [d for _, docs in batch for d in docs], 1 + a.k_neg)
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(enc.parameters(), 1.0)
+            opt.step(); sched.step(); opt.zero_grad()
+            total += loss.item(); step += 1
+            if step % 50 == 0:
+                print(f"  step {step}/{steps}  loss={loss.item():.4f}")
+        print(f"[epoch {epoch + 1}] mean_loss={total / max(1, (len(rows) + a.batch_size - 1) // a.batch_size):.4f}")
+
+    enc.save(a.out, extra={"base": a.model})
+    print(f"[done] Saved late-interaction reranker to: {a.out}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2",
+                    help="MiniLM-sized HF encoder to start from")
+    ap.add_argument("--train", required=True, help="JSONL from 40_make_weak_pairs.py / 41_make_hard_pairs.py")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--max_len_q", type=int, default=32)
+    ap.add_argument("--max_len_p", type=int, default=256)
+    ap.add_argument("--k_neg", type=int, default=4)
+    ap.add_argument("--lr", type=float, default=3e-5)
+    ap.add_argument("--epochs", type=int, default=2)
+    ap.add_argument("--batch_size", type=int, default=16)
+    ap.add_argument("--warmup_ratio", type=float, default=0.1)
+    ap.add_argument("--seed", type=int, default=42)
+    main(ap.parse_args())
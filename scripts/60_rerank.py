@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
-import argparse, json
-import numpy as np, faiss
-from sentence_transformers import SentenceTransformer, CrossEncoder
+import argparse, json, os, queue, threading, time
+from collections import defaultdict
+import numpy as np
+
+from ce_backend import BACKENDS, load_reranker
+from token_cache import RaggedTokens, score_cached
+from cascade import load_cascade, run_cascade, ndcg_at_k
+from rerank_pipeline import OrderedWriter, Stage, run_pipeline
+from run_format import RunWriter
+from exact_search import load_index
+from query_cache import SemanticCache, cache_version
+import memory_budget as mb
+import perf
 
 def norm_paper(x: str) -> str:
     return (x or "").replace("http://arxiv.org/abs/","").replace("https://arxiv.org/abs/","").replace("arXiv:","").strip()
 
-def load_meta(meta_path):
+def load_meta(meta_path, keep_text=True):
     ids, texts = [], []
     with open(meta_path) as f:
         for line in f:
@@ -14,42 +24,319 @@ def load_meta(meta_path):
             pid = norm_paper(o.get("paper_id",""))
             cid = int(o.get("chunk_id"))
             ids.append(f"{pid}:{cid}")
-            texts.append(o.get("passage","") or "")
-    return ids, texts
+            if keep_text:
+                texts.append(o.get("passage","") or "")
+    # texts left on disk are read back by row (byte offsets only in memory)
+    return ids, (texts if keep_text else mb.MetaTexts(meta_path))
+
+def load_qrels(path):
+    qrels = defaultdict(set)
+    with open(path) as f:
+        for line in f:
+            qid, _, docid, rel = line.split()
+            if int(rel) > 0:
+                qrels[qid].add(docid)
+    return qrels
+
+def make_scorer(ce, qtext, passages, cache, batch):
+    """rows -> reranker scores for one query (token cache if given, else raw text)."""
+    if hasattr(ce, "score_rows"):   # late interaction scores straight from its token store
+        return lambda rows: ce.score_rows(qtext, rows)
+    if cache is not None:
+        q_ids = ce.tokenizer(qtext, add_special_tokens=False)["input_ids"]
+        return lambda rows: score_cached(ce, q_ids, rows, cache, batch)
+    return lambda rows: ce.predict([[qtext, passages[i]] for i in rows], batch_size=batch)
+
+def load_rerankers(a, cascade):
+    """{(model, backend): scorer} for the --reranker and every cascade stage."""
+    if a.mode == "late":
+        from late_interaction import LateInteractionReranker
+        main_model = LateInteractionReranker(a.reranker, a.token_store, threads=a.threads)
+    else:
+        main_model = load_reranker(a.reranker, a.backend, threads=a.threads)
+    models = {(a.reranker, a.backend): main_model}
+    for st in (cascade or {}).get("stages", []):
+        key = (st["model"], st["backend"])
+        if key not in models:
+            models[key] = load_reranker(st["model"], st["backend"], threads=a.threads)
+    return models
+
+def rerank_query(a, ctx, models, qid, qtext, D, I):
+    """Rerank one query's FAISS hits. Returns the final list plus cascade/NDCG stats."""
+    rows = [int(i) for i in I]
+    reranker, cascade, cache, docids = models[(a.reranker, a.backend)], ctx["cascade"], ctx["cache"], ctx["docids"]
+    res = {"qid": qid, "calls": {}, "ndcg": None, "ndcg_full": None}
+    if cascade is not None:
+        scorers = {st["name"]: make_scorer(models[(st["model"], st["backend"])], qtext, ctx["passages"],
+                                           cache if st["token_cache"] else None, st["batch"])
+                   for st in cascade["stages"]}
+        reranked, res["calls"] = run_cascade(rows, D, cascade["stages"], scorers, cascade["depth"])
+        reranked = [(docids[r], s) for r, s in reranked]
+    else:
+        scores = make_scorer(reranker, qtext, ctx["passages"], cache, a.batch)(rows)  # higher is better
+        reranked = sorted(zip([docids[i] for i in rows], scores),
+                          key=lambda x: x[1], reverse=True)[:a.final_topk]
+        res["calls"] = {"full": len(rows)}
+
+    qrels = ctx["qrels"]
+    if qrels is not None and qrels.get(qid):
+        res["ndcg"] = ndcg_at_k([d for d, _ in reranked], qrels[qid], 10)
+        if cascade is not None and a.compare_full:
+            full = make_scorer(reranker, qtext, ctx["passages"], cache, a.batch)(rows)
+            order = np.argsort(-np.asarray(full), kind="stable")[:a.final_topk]
+            res["ndcg_full"] = ndcg_at_k([docids[rows[i]] for i in order], qrels[qid], 10)
+    res["reranked"] = reranked
+    return res
+
+def cached_result(ctx, qid, reranked):
+    """Result record for a semantic cache hit: no FAISS / reranker calls."""
+    res = {"qid": qid, "calls": {}, "ndcg": None, "ndcg_full": None, "reranked": reranked}
+    qrels = ctx["qrels"]
+    if qrels is not None and qrels.get(qid):
+        res["ndcg"] = ndcg_at_k([d for d, _ in reranked], qrels[qid], 10)
+    return res
+
+def open_cache(a, dim):
+    # results depend on the index, its meta, the reranker(s) and the ranking settings
+    version = cache_version([a.index, a.meta, a.reranker, a.cascade, a.token_store], mode=a.mode,
+                            backend=a.backend, faiss_topk=a.faiss_topk, final_topk=a.final_topk)
+    cache = SemanticCache.load(a.cache_file, dim, version, threshold=a.cache_threshold,
+                               capacity=a.cache_capacity, ttl=a.cache_ttl)
+    print(f"[cache] version {version}, {len(cache)} entries loaded, threshold={a.cache_threshold}")
+    return cache
 
 def main(a):
+    # per-thread CPU time when stages overlap on threads
+    perf.enable(a.trace, thread_cpu=a.pipeline)
+    budget = mb.budget_from(a.memory_budget)
+    with perf.span("load_model"):
+        from sentence_transformers import SentenceTransformer
+        biencoder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    if budget is not None:
+        # rerankers load later; one copy counts as baseline alongside the bi-encoder
+        plan = mb.plan_search(budget, a.index, a.meta, mb.current_rss() + reranker_bytes(a.reranker))
+        plan["stage"] = "rerank"
+    else:
+        plan = None
     # FAISS stage
-    index = faiss.read_index(a.index)
-    biencoder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    docids, passages = load_meta(a.meta)
+    with perf.span("load_index"):
+        index = load_index(a.index, mmap=a.mmap)
+    with perf.span("load_meta"):
+        docids, passages = load_meta(a.meta, keep_text=plan is None or plan["choices"]["passage_texts"] == "memory")
     with open(a.queries) as qf:
         queries = [json.loads(l) for l in qf]
 
-    # Cross-encoder reranker
-    reranker = CrossEncoder(a.reranker)
+    cascade = load_cascade(a.cascade, a.reranker, a.final_topk, a.backend) if a.cascade else None
+    if cascade is not None:
+        print("[cascade] stages: " + " → ".join(f"{s['name']}({s['model']}/{s['backend']}, keep={s['keep']})"
+                                                   for s in cascade["stages"]))
+    ctx = {
+        "docids": docids, "passages": passages, "cascade": cascade,
+        # FAISS row ids index the token cache directly (both follow meta.jsonl order)
+        "cache": RaggedTokens.open(a.token_cache) if a.token_cache else None,
+        "qrels": load_qrels(a.qrels) if a.qrels else None,
+        "qcache": open_cache(a, biencoder.get_sentence_embedding_dimension()) if a.cache else None,
+    }
+    report = {"queries": 0, "calls": defaultdict(int), "ndcg": [], "ndcg_full": []}
+
+    outf = RunWriter(a.out, "faiss+ce")
+    def record(res):
+        for name, n in res["calls"].items():
+            report["calls"][name] += n
+        report["queries"] += 1
+        if res["ndcg"] is not None:
+            report["ndcg"].append(res["ndcg"])
+        if res["ndcg_full"] is not None:
+            report["ndcg_full"].append(res["ndcg_full"])
+        outf.add(res["qid"], [d for d, _ in res["reranked"]], [s for _, s in res["reranked"]])
+
+    try:
+        if a.pipeline:
+            run_pipelined(a, ctx, index, biencoder, queries, record)
+        else:
+            with perf.span("load_rerankers"):
+                models = load_rerankers(a, cascade)
+            qcache = ctx["qcache"]
+            for q in queries:
+                qid, qtext = q["qid"], q["query"]
+                with perf.span("encode", items=1):
+                    qemb = biencoder.encode([qtext], normalize_embeddings=True)
+                hit = qcache.lookup(qemb[0]) if qcache is not None else None
+                if hit is not None:
+                    perf.count("query_cache.hit")
+                    res = cached_result(ctx, qid, hit["results"])
+                else:
+                    t0 = time.perf_counter()
+                    with perf.span("search", items=1):
+                        D, I = index.search(np.asarray(qemb, dtype="float32"), a.faiss_topk)
+                    with perf.span("score", items=len(I[0])):
+                        res = rerank_query(a, ctx, models, qid, qtext, D[0], I[0])
+                    if qcache is not None:
+                        qcache.insert(qemb[0], res["reranked"], qtext)
+                        qcache.record_miss(time.perf_counter() - t0)
+                with perf.span("write"):
+                    record(res)
+    finally:
+        with perf.span("write_run", items=outf.n):
+            outf.close()
+
+    if cascade is not None:
+        write_cascade_report(a, cascade, report)
+    if ctx["qcache"] is not None:
+        write_cache_report(a, ctx["qcache"])
+    if plan is not None:
+        mb.check(plan)
+
+def reranker_bytes(path):
+    """Size of the reranker weights on disk (~ their size once loaded)."""
+    if not os.path.isdir(path):
+        return 0
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+               if f.endswith((".safetensors", ".bin", ".pt")))
+
+def run_pipelined(a, ctx, index, biencoder, queries, record):
+    """encode (batched) → FAISS search (batched) → CE scoring (N workers) → ordered writer."""
+    if a.faiss_threads:
+        import faiss
+        faiss.omp_set_num_threads(a.faiss_threads)
+    # one reranker copy per scoring worker (HF fast tokenizers aren't thread-safe), loaded up front
+    copies = queue.SimpleQueue()
+    with perf.span("load_rerankers"):
+        for _ in range(a.score_workers):
+            copies.put(load_rerankers(a, ctx["cascade"]))
+    local = threading.local()
+
+    def encode(batch):
+        perf.hist("query_batch_size", len(batch))
+        embs = biencoder.encode([q["query"] for _, q in batch], batch_size=len(batch),
+                                normalize_embeddings=True)
+        yield batch, np.asarray(embs, dtype="float32")
+
+    qcache = ctx["qcache"]
+
+    def search(item):
+        batch, embs = item
+        # semantic cache hits skip FAISS and the reranker; only the misses are searched
+        hits = [qcache.lookup(e) if qcache is not None else None for e in embs]
+        miss = [j for j, h in enumerate(hits) if h is None]
+        t0 = time.perf_counter()
+        D, I = index.search(embs[miss], a.faiss_topk) if miss else (None, None)
+        per_query = (time.perf_counter() - t0) / max(1, len(miss))
+        found = dict(zip(miss, range(len(miss))))
+        for j, (seq, q) in enumerate(batch):
+            if hits[j] is not None:
+                perf.count("query_cache.hit")
+                yield seq, q, embs[j], hits[j], None, None, 0.0
+            else:
+                yield seq, q, embs[j], None, D[found[j]], I[found[j]], per_query
+
+    def score(item):
+        seq, q, emb, hit, d, i, search_s = item
+        if hit is not None:
+            yield seq, cached_result(ctx, q["qid"], hit["results"])
+            return
+        if not hasattr(local, "models"):
+            local.models = copies.get_nowait()
+        t0 = time.perf_counter()
+        res = rerank_query(a, ctx, local.models, q["qid"], q["query"], d, i)
+        if qcache is not None:
+            qcache.insert(emb, res["reranked"], q["query"])
+            qcache.record_miss(search_s + time.perf_counter() - t0)
+        yield seq, res
 
-    with open(a.out, "w") as outf:
-        for q in queries:
-            qid, qtext = q["qid"], q["query"]
-            qemb = biencoder.encode([qtext], normalize_embeddings=True)
-            D, I = index.search(np.asarray(qemb, dtype="float32"), a.faiss_topk)
-            cand_ids = [docids[i] for i in I[0]]
-            cand_txt = [passages[i] for i in I[0]]
+    batches = [list(enumerate(queries))[s:s + a.query_batch] for s in range(0, len(queries), a.query_batch)]
+    stages = [Stage("encode", encode, 1), Stage("search", search, 1),
+              Stage("score", score, a.score_workers)]
+    stats = run_pipeline(batches, stages, OrderedWriter(record), queue_size=a.queue_size)
+    width = max(len(k) for k in stats)
+    for name, st in stats.items():
+        if isinstance(st, dict):
+            print(f"[pipeline] {name:{width}s} workers={st['workers']} busy={st['busy']:.0%} ({st['busy_s']}s)")
+    print(f"[pipeline] wall={stats['wall_s']}s  bottleneck="
+          f"{max((k for k in stats if isinstance(stats[k], dict)), key=lambda k: stats[k]['busy'])}")
+    if a.pipeline_report:
+        with open(a.pipeline_report, "w") as f:
+            json.dump(stats, f, indent=2)
 
-            pairs = [[qtext, t] for t in cand_txt]
-            scores = reranker.predict(pairs)  # higher is better
-            reranked = sorted(zip(cand_ids, scores), key=lambda x: x[1], reverse=True)[:a.final_topk]
+def write_cache_report(a, qcache):
+    """Hit rate and latency saved by the semantic query cache; persists it with --cache_file."""
+    stats = qcache.stats()
+    print("[cache] " + json.dumps(stats))
+    if a.cache_file:
+        qcache.save(a.cache_file)
+    if a.cache_report:
+        with open(a.cache_report, "w") as f:
+            json.dump(stats, f, indent=2)
 
-            for rank, (docid, score) in enumerate(reranked, start=1):
-                outf.write(f"{qid} Q0 {docid} {rank} {float(score):.6f} faiss+ce\n")
+def write_cascade_report(a, cascade, report):
+    """CE calls saved vs. sending every FAISS candidate to the full model, and NDCG@10 lost."""
+    baseline = report["queries"] * a.faiss_topk
+    last = cascade["stages"][-1]["name"]
+    out = {
+        "queries": report["queries"],
+        "baseline_full_calls": baseline,
+        "calls_per_stage": dict(report["calls"]),
+        "full_model_calls_saved": baseline - report["calls"][last],
+        "full_model_calls_saved_frac": round(1 - report["calls"][last] / max(1, baseline), 4),
+    }
+    if report["ndcg"]:
+        out["NDCG@10"] = round(float(np.mean(report["ndcg"])), 4)
+    if report["ndcg_full"]:
+        out["NDCG@10_full"] = round(float(np.mean(report["ndcg_full"])), 4)
+        out["NDCG@10_lost"] = round(out["NDCG@10_full"] - out["NDCG@10"], 4)
+    print("[cascade] " + json.dumps(out))
+    if a.cascade_report:
+        with open(a.cascade_report, "w") as f:
+            json.dump(out, f, indent=2)
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument("--index", required=True)
+    ap.add_argument("--index", required=True, help="index.faiss, or embeddings.npy for NumPy exact search")
     ap.add_argument("--meta", required=True)
     ap.add_argument("--queries", required=True)
     ap.add_argument("--reranker", required=True)   # path to outputs/reranker/minilm_ce
-    ap.add_argument("--out", required=True)
+    ap.add_argument("--mode", choices=["ce", "late"], default="ce",
+                    help="late: --reranker is a 52_train_late_interaction.py checkpoint scored by MaxSim")
+    ap.add_argument("--token_store", default=None,
+                    help="late mode: token embeddings from 22_index_token_embeddings.py (same meta.jsonl)")
+    ap.add_argument("--out", required=True, help="run file; .npz for the binary format (run_format.py)")
     ap.add_argument("--faiss_topk", type=int, default=200)
+    ap.add_argument("--mmap", action="store_true",
+                    help="map --index read-only instead of reading it (page cache shared by concurrent workers)")
     ap.add_argument("--final_topk", type=int, default=10)
-    main(ap.parse_args())
+    ap.add_argument("--batch", type=int, default=32)
+    ap.add_argument("--token_cache", default=None,
+                    help="dir from 21_pretokenize_passages.py built over the same meta.jsonl")
+    ap.add_argument("--backend", choices=BACKENDS, default="torch",
+                    help="onnx/onnx-int8 need 51_export_reranker.py output under <reranker>/onnx")
+    ap.add_argument("--threads", type=int, default=None, help="CPU inference threads")
+    ap.add_argument("--cascade", default=None, help="YAML cascade config, e.g. configs/cascade.yaml")
+    ap.add_argument("--cascade_report", default=None, help="write the cascade calls/NDCG report here")
+    ap.add_argument("--qrels", default=None, help="qrels for NDCG@10 in the cascade report")
+    ap.add_argument("--compare_full", action="store_true",
+                    help="also rerank every FAISS candidate with the full model to measure NDCG@10 lost")
+    # pipelined execution
+    ap.add_argument("--pipeline", action="store_true",
+                    help="overlap query encoding, FAISS search and CE scoring via bounded queues")
+    ap.add_argument("--query_batch", type=int, default=32, help="queries per encode/search batch")
+    ap.add_argument("--score_workers", type=int, default=2, help="CE scoring threads (one model copy each)")
+    ap.add_argument("--faiss_threads", type=int, default=None)
+    ap.add_argument("--queue_size", type=int, default=8)
+    ap.add_argument("--pipeline_report", default=None, help="write per-stage busy stats (JSON) here")
+    # semantic query cache
+    ap.add_argument("--cache", action="store_true",
+                    help="reuse the final top-k of an earlier query whose embedding is within --cache_threshold")
+    ap.add_argument("--cache_threshold", type=float, default=0.97, help="cosine similarity for a cache hit")
+    ap.add_argument("--cache_capacity", type=int, default=10000, help="entries kept (LRU eviction)")
+    ap.add_argument("--cache_ttl", type=float, default=None, help="seconds an entry stays valid")
+    ap.add_argument("--cache_file", default=None,
+                    help="load/save the cache here (.npz); ignored when the index / reranker / settings changed")
+    ap.add_argument("--cache_report", default=None, help="write hit rate / latency saved (JSON) here")
+    ap.add_argument("--memory_budget", default=None,
+                    help="e.g. 3GB (or $ASTRORAG_MEMORY_BUDGET): keep passage texts on disk if they do not fit, "
+                         "fail with the plan if the index does not")
+    ap.add_argument("--trace", default=None, help="write a perf trace JSON (perf.py) here")
+    args = ap.parse_args()
+    if args.mode == "late" and not args.token_store:
+        ap.error("--mode late needs --token_store")
+    main(args)
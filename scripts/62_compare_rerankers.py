@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cross-encoder against the late-interaction reranker on the same candidates.
+
+Takes a FAISS run (31_search_faiss.py), reranks each query's top --depth with
+  - the cross-encoder (--ce, any --backend from ce_backend.py)
+  - the late-interaction checkpoint (--late + --token_store)
+and reports NDCG@10 / MRR@10 against --qrels plus queries/sec for each.
+"""
+
+import argparse, json, time
+
+import numpy as np
+
+from ce_backend import BACKENDS, load_reranker
+from rank_eval import evaluate_runs, norm_paper, read_qrels
+from run_format import read_run
+
+def load_meta(meta_path):
+    ids, texts = [], []
+    with open(meta_path) as f:
+        for line in f:
+            o = json.loads(line)
+            ids.append(f"{norm_paper(o.get('paper_id',''))}:{int(o['chunk_id'])}")
+            texts.append(o.get("passage", "") or "")
+    return ids, texts
+
+def evaluate(name, score_fn, cands, qtext, qrels):
+    ranked, n_pairs = {}, 0
+    t0 = time.perf_counter()
+    for qid, docids in cands.items():
+        scores = np.asarray(score_fn(qtext[qid], docids))
+        n_pairs += len(docids)
+        ranked[qid] = [docids[i] for i in np.argsort(-scores, kind="stable")]
+    secs = time.perf_counter() - t0
+    m = evaluate_runs({name: ranked}, qrels, ks=[10], query_set="run")[name]
+    row = {"NDCG@10": round(m["NDCG@10"], 4), "MRR@10": round(m["MRR@10"], 4),
+           "queries_per_sec": round(len(cands) / max(secs, 1e-9), 2),
+           "pairs_per_sec": round(n_pairs / max(secs, 1e-9), 1)}
+    print(f"[{name:5s}] {json.dumps(row)}")
+    return row
+
+def main(a):
+    docids, passages = load_meta(a.meta)
+    row_of = {d: i for i, d in reversed(list(enumerate(docids)))}
+    qtext = {}
+    with open(a.queries) as f:
+        for line in f:
+            o = json.loads(line)
+            qtext[o["qid"]] = o["query"]
+    qrels = read_qrels(a.qrels)
+    cands, missing = {}, 0
+    for q, ds in read_run(a.run).ranked_docids(depth=a.depth).items():
+        if q not in qtext or not qrels.get(q):
+            continue
+        # docids not in --meta (another index, removed by dedup) have no text or token row
+        kept = [d for d in ds if d in row_of]
+        missing += len(ds) - len(kept)
+        if kept:
+            cands[q] = kept
+    if a.max_queries:
+        cands = dict(list(cands.items())[:a.max_queries])
+    print(f"[data] queries={len(cands)}  depth={a.depth}"
+          + (f"  ({missing} candidates not in {a.meta} skipped)" if missing else ""))
+
+    report = {"faiss": evaluate("faiss", lambda q, d: -np.arange(len(d)), cands, qtext, qrels)}
+    if a.ce:
+        ce = load_reranker(a.ce, a.backend, threads=a.threads)
+        report["ce"] = evaluate("ce", lambda q, d: ce.predict([[q, passages[row_of[x]]] for x in d],
+                                                              batch_size=a.batch), cands, qtext, qrels)
+    if a.late:
+        from late_interaction import LateInteractionReranker
+        late = LateInteractionReranker(a.late, a.token_store, threads=a.threads)
+        report["late"] = evaluate("late", lambda q, d: late.score_rows(q, [row_of[x] for x in d]),
+                                  cands, qtext, qrels)
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {a.out}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--run", required=True, help="FAISS candidates, e.g. outputs/runs/faiss_dev_top200.trec")
+    ap.add_argument("--meta", required=True)
+    ap.add_argument("--queries", required=True)
+    ap.add_argument("--qrels", required=True)
+    ap.add_argument("--ce", default=None, help="cross-encoder checkpoint")
+    ap.add_argument("--backend", choices=BACKENDS, default="torch")
+    ap.add_argument("--late", default=None, help="late-interaction checkpoint")
+    ap.add_argument("--token_store", default=None)
+    ap.add_argument("--depth", type=int, default=100)
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--threads", type=int, default=None)
+    ap.add_argument("--max_queries", type=int, default=None)
+    ap.add_argument("--out", default=None, help="JSON report path")
+    a = ap.parse_args()
+    if a.late and not a.token_store:
+        ap.error("--late needs --token_store")
+    main(a)
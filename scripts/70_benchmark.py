@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite over a synthetic arXiv-like corpus (synthetic.py), one JSON per run.
+
+Stages, each timed on its own (best of --repeat):
+  generate    raw records → data/raw-style JSONL                        records/s
+  chunk       10_chunk_passages.py main() on those records              passages/s
+  embed       StubEncoder (hashing bag-of-words, no download)           passages/s
+  index       FAISS IndexFlatIP add + write                             vectors/s
+  search      batched FAISS search at --search_batches, run written     queries/s
+  search_numpy exact_search.NumpyFlatIndex over embeddings.npy (float32
+              and float16), ids checked against IndexFlatIP             queries/s
+  rerank      tiny random BERT cross-encoder via ce_backend, text and
+              token-cache (token_cache.score_cached) paths              pairs/s
+  hard_pairs  41_make_hard_pairs.py on the search run                   queries/s
+  eval        rank_eval.evaluate_runs on the run (.npz and TREC)        queries/s
+
+The stub models exercise the repo's own code around the model (I/O, batching, FAISS, token
+caches, evaluation) at realistic shapes; their absolute accuracy is meaningless. Everything runs
+on CPU without network access. Results go to outputs/bench/<commit>.json; --compare prints
+throughput ratios against an earlier file and flags drops beyond --tolerance.
+
+Passages are streamed in --block rows (20_embed_and_index.py's iter_blocks) and embeddings go to
+index/embeddings.npy, which the index, NumPy search and fp16 stages read back block by block, so
+no stage holds the corpus text or a second embedding matrix.
+
+  python scripts/70_benchmark.py --passages 10000
+  python scripts/70_benchmark.py --passages 1000000 --skip rerank --compare outputs/bench/abc1234.json
+"""
+
+import argparse, importlib, json, os, platform, runpy, shutil, subprocess, sys, time
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+
+SCRIPTS = Path(__file__).resolve().parent
+ROOT = SCRIPTS.parent
+
+import synthetic
+from exact_search import NumpyFlatIndex
+from rank_eval import evaluate_runs, load_run, norm_paper, qrels_from_meta
+from run_format import RunWriter, read_run, write_trec
+
+iter_blocks = importlib.import_module("20_embed_and_index").iter_blocks
+
+try:
+    import faiss
+    HAVE_FAISS = True
+except Exception:
+    HAVE_FAISS = False
+
+STAGES = ("generate", "chunk", "embed", "index", "search", "search_numpy", "rerank", "hard_pairs", "eval")
+
+def peak_rss_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def timed(fn, repeat=1):
+    """Best wall / CPU seconds over repeat calls of fn(); returns (wall, cpu, last result)."""
+    best_wall, best_cpu, out = float("inf"), float("inf"), None
+    for _ in range(max(1, repeat)):
+        t0, c0 = time.perf_counter(), time.process_time()
+        out = fn()
+        best_wall = min(best_wall, time.perf_counter() - t0)
+        best_cpu = min(best_cpu, time.process_time() - c0)
+    return best_wall, best_cpu, out
+
+def result(wall, cpu, items, unit, **extra):
+    r = {"seconds": round(wall, 4), "cpu_seconds": round(cpu, 4), "items": items, "unit": unit,
+         f"{unit}_per_s": round(items / wall, 2) if wall > 0 else None, "peak_rss_mb": round(peak_rss_mb(), 1)}
+    r.update(extra)
+    return r
+
+def run_script(name, argv):
+    """Run a numbered script in-process (same code path as the CLI), stdout silenced."""
+    saved = sys.argv, sys.stdout
+    sys.argv = [str(SCRIPTS / name)] + [str(a) for a in argv]
+    try:
+        with open(os.devnull, "w") as devnull:
+            sys.stdout = devnull
+            runpy.run_path(str(SCRIPTS / name), run_name="__main__")
+    finally:
+        sys.argv, sys.stdout = saved
+
+def embed_to_npy(encoder, passages_path, out_path, n, a):
+    """Encode passages.jsonl block by block into an [n, dim] float32 embeddings.npy."""
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(n, a.dim))
+    start = 0
+    for block in iter_blocks(passages_path, a.block):
+        embs = encoder.encode([p["passage"] for p in block], batch_size=a.batch, normalize_embeddings=True)
+        out[start:start + len(embs)] = embs
+        start += len(embs)
+    out.flush()
+    del out
+
+def git_commit():
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT).strip())
+        return sha, dirty
+    except Exception:
+        return "unknown", False
+
+def host_info():
+    info = {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "faiss": getattr(faiss, "__version__", "?") if HAVE_FAISS else None}
+    try:
+        import torch
+        info["torch"], info["torch_threads"] = torch.__version__, torch.get_num_threads()
+    except Exception:
+        info["torch"] = None
+    return info
+
+def main(a):
+    work = Path(a.workdir)
+    work.mkdir(parents=True, exist_ok=True)
+    stages = [s for s in (a.only or STAGES) if s not in (a.skip or [])]
+    res, notes = {}, {}
+    raw_dir, passages_path = work / "raw", work / "passages.jsonl"
+    meta_path, queries_path = work / "index" / "meta.jsonl", work / "queries.jsonl"
+    run_npz, run_trec, qrels_path = work / "faiss.npz", work / "faiss.trec", work / "dev.qrels"
+    n_records = max(1, a.passages // 3)  # ~3 chunks per 180-word abstract at chunk_size 100 / overlap 30
+
+    def log(name):
+        r = res[name]
+        print(f"[bench] {name:17s} {r['seconds']:8.3f}s  {r[r['unit'] + '_per_s']:>12,.1f} {r['unit']}/s"
+              + (f"  {r['note']}" if r.get("note") else ""))
+
+    # inputs every later stage needs are (re)built when missing even if their stage is skipped
+    if "generate" in stages or not (raw_dir / "synthetic.jsonl").exists():
+        wall, cpu, _ = timed(lambda: synthetic.write_records(raw_dir / "synthetic.jsonl", n_records, a.seed), a.repeat)
+        res["generate"] = result(wall, cpu, n_records, "records"); log("generate")
+
+    if "chunk" in stages or not passages_path.exists():
+        chunker = importlib.import_module("10_chunk_passages")
+        ns = argparse.Namespace(raw_dir=str(raw_dir), out=str(passages_path), chunk_size=100, overlap=30, trace=None)
+        saved = sys.stdout
+        try:
+            sys.stdout = open(os.devnull, "w")
+            wall, cpu, _ = timed(lambda: chunker.main(ns), a.repeat)
+        finally:
+            sys.stdout.close(); sys.stdout = saved
+        n_pass = sum(1 for _ in open(passages_path))
+        res["chunk"] = result(wall, cpu, n_pass, "passages"); log("chunk")
+
+    with open(passages_path) as f:
+        n_pass = sum(1 for _ in f)
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    if not meta_path.exists() or meta_path.stat().st_mtime < passages_path.stat().st_mtime:
+        shutil.copyfile(passages_path, meta_path)  # 20_embed_and_index.py writes meta = passages
+    queries = synthetic.queries_from_file(raw_dir / "synthetic.jsonl", a.queries, a.seed)
+    with open(queries_path, "w") as f:
+        f.writelines(json.dumps(q) + "\n" for q in queries)
+
+    encoder = synthetic.StubEncoder(dim=a.dim, seed=a.seed)
+    emb_path = work / "index" / "embeddings.npy"
+    if "embed" in stages or not emb_path.exists():
+        wall, cpu, _ = timed(lambda: embed_to_npy(encoder, passages_path, emb_path, n_pass, a), a.repeat)
+        res["embed"] = result(wall, cpu, n_pass, "passages", dim=a.dim, batch=a.batch, block=a.block,
+                              note="stub encoder"); log("embed")
+
+    if not HAVE_FAISS:
+        notes["faiss"] = "faiss not importable; index/search/hard_pairs/eval skipped"
+        print(f"[bench] {notes['faiss']}")
+        stages = [s for s in stages if s not in ("index", "search", "hard_pairs", "eval")]
+    index_path = work / "index" / "index.faiss"
+    if HAVE_FAISS and ("index" in stages or not index_path.exists()):
+        def build():
+            embs = np.load(emb_path, mmap_mode="r")
+            index = faiss.IndexFlatIP(embs.shape[1])
+            for start in range(0, len(embs), a.block):
+                index.add(np.ascontiguousarray(embs[start:start + a.block]))
+            faiss.write_index(index, str(index_path))
+        wall, cpu, _ = timed(build, a.repeat)
+        res["index"] = result(wall, cpu, n_pass, "vectors", index="IndexFlatIP"); log("index")
+
+    if HAVE_FAISS and ("search" in stages or not run_npz.exists()):
+        index = faiss.read_index(str(index_path))
+        qembs = encoder.encode([q["query"] for q in queries], batch_size=a.batch)
+        docids = [f"{norm_paper(p['paper_id'])}:{int(p['chunk_id'])}"
+                  for p in chain.from_iterable(iter_blocks(meta_path, a.block))]
+        per_batch = {}
+        for qb in a.search_batches:
+            def search(qb=qb):
+                D = np.empty((len(qembs), a.topk), dtype=np.float32); I = np.empty((len(qembs), a.topk), dtype=np.int64)
+                for s in range(0, len(qembs), qb):
+                    D[s:s + qb], I[s:s + qb] = index.search(qembs[s:s + qb], a.topk)
+                return D, I
+            wall, cpu, (D, I) = timed(search, a.repeat)
+            per_batch[qb] = result(wall, cpu, len(qembs), "queries", topk=a.topk, query_batch=qb)
+        best = max(per_batch, key=lambda b: per_batch[b]["queries_per_s"])
+        res["search"] = dict(per_batch[best], by_batch={str(b): r["queries_per_s"] for b, r in per_batch.items()})
+        log("search")
+        with RunWriter(str(run_npz), "faiss") as w:
+            for q, d, i in zip(queries, D, I):
+                w.add(q["qid"], [docids[j] for j in i], d, rows=i)
+        write_trec(str(run_trec), read_run(str(run_npz)))
+        qrels = qrels_from_meta(str(queries_path), str(meta_path))
+        with open(qrels_path, "w") as f:
+            for qid, docs in qrels.items():
+                f.writelines(f"{qid} 0 {d} 1\n" for d in sorted(docs))
+
+    if "search_numpy" in stages:
+        res.update(bench_numpy_search(a, work, encoder, queries, index_path if HAVE_FAISS else None))
+        for k in ("search_numpy", "search_numpy_fp16"):
+            log(k)
+
+    if "rerank" in stages and not run_npz.exists():
+        notes["rerank"] = "no search run to rerank (search needs faiss); rerank skipped"
+        print(f"[bench] {notes['rerank']}")
+    elif "rerank" in stages:
+        res.update(bench_rerank(a, work, queries, meta_path, run_npz))
+        for k in ("rerank", "rerank_cached"):
+            if k in res:
+                log(k)
+
+    if "hard_pairs" in stages:
+        out = work / "hard_pairs.jsonl"
+        args = ["--run", run_trec, "--qrels", qrels_path, "--queries", queries_path, "--meta", meta_path,
+                "--out", out, "--topk", a.topk]
+        wall, cpu, _ = timed(lambda: run_script("41_make_hard_pairs.py", args), a.repeat)
+        rows = sum(1 for _ in open(out))
+        res["hard_pairs"] = result(wall, cpu, len(queries), "queries", rows_written=rows); log("hard_pairs")
+
+    if "eval" in stages:
+        qrels = qrels_from_meta(str(queries_path), str(meta_path))
+        for name, path in (("eval", run_npz), ("eval_trec", run_trec)):
+            wall, cpu, m = timed(lambda: evaluate_runs({"faiss": load_run(str(path))}, qrels, ks=[1, 10, 100],
+                                                       query_set="run"), a.repeat)
+            res[name] = result(wall, cpu, len(queries), "queries", format=path.suffix[1:],
+                               ndcg10=round(m["faiss"]["NDCG@10"], 4)); log(name)
+
+    sha, dirty = git_commit()
+    doc = {"suite": "astrorag-bench", "version": 1, "commit": sha, "dirty": dirty,
+           "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": host_info(),
+           "config": {k: v for k, v in vars(a).items() if k not in ("out", "compare")},
+           "results": res, "notes": notes}
+    out = Path(a.out or ROOT / "outputs" / "bench" / f"{sha}{'-dirty' if dirty else ''}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2) + "\n")
+    print(f"✅ {len(res)} benchmarks → {out}")
+    if a.compare:
+        return compare(json.loads(Path(a.compare).read_text()), doc, a.tolerance)
+    return 0
+
+def bench_numpy_search(a, work, encoder, queries, index_path):
+    """FAISS-free exact search at the largest --search_batches; agreement with IndexFlatIP when faiss is there."""
+    emb_path = work / "index" / "embeddings.npy"   # written by the embed stage
+    src = np.load(emb_path, mmap_mode="r")
+    fp16 = np.lib.format.open_memmap(work / "index" / "embeddings_fp16.npy", mode="w+", dtype=np.float16, shape=src.shape)
+    for start in range(0, len(src), a.block):
+        fp16[start:start + a.block] = src[start:start + a.block]
+    fp16.flush()
+    del src, fp16
+    qembs = encoder.encode([q["query"] for q in queries], batch_size=a.batch)
+    ref = faiss.read_index(str(index_path)).search(qembs, a.topk) if index_path else None
+    qb = max(a.search_batches)
+    out = {}
+    for name, path in (("search_numpy", emb_path), ("search_numpy_fp16", work / "index" / "embeddings_fp16.npy")):
+        index = NumpyFlatIndex.open(path, query_batch=qb, threads=a.threads)
+        wall, cpu, (D, I) = timed(lambda: index.search(qembs, a.topk), a.repeat)
+        extra = {"topk": a.topk, "query_batch": qb, "dtype": str(index.embs.dtype)}
+        if ref is not None:
+            # same ids at the same rank; overlap ignores swaps between (near-)tied scores
+            extra["ids_equal"] = round(float((I == ref[1]).mean()), 6)
+            extra["overlap"] = round(float(np.mean([len(set(x) & set(y)) / len(x) for x, y in zip(I, ref[1])])), 6)
+            extra["max_score_diff"] = float(np.abs(D - ref[0]).max())
+        out[name] = result(wall, cpu, len(qembs), "queries", **extra,
+                           note=f"ids_equal={extra['ids_equal']:.4f}" if ref is not None else "")
+    return out
+
+def bench_rerank(a, work, queries, meta_path, run_npz):
+    try:
+        from ce_backend import load_reranker
+        from token_cache import RaggedTokens, score_cached, tokenize_texts, write_ragged
+        ckpt = synthetic.make_stub_cross_encoder(work / "stub_ce", seed=a.seed)
+        ce = load_reranker(ckpt, "torch", threads=a.threads, device="cpu")
+    except Exception as e:  # torch / transformers missing
+        print(f"[bench] rerank skipped: {e}")
+        return {}
+    run = read_run(str(run_npz))
+    ranked = run.by_query(a.rerank_depth)
+    qtext = {q["qid"]: q["query"] for q in queries}
+    work_items = [(qtext[qid], run.rows[idx].tolist()) for qid, idx in list(ranked.items())[:a.rerank_queries]]
+    n_pairs = sum(len(rows) for _, rows in work_items)
+    # only the reranked passages' texts are kept
+    needed = {r for _, rows in work_items for r in rows}
+    texts = {i: p["passage"] for i, p in enumerate(chain.from_iterable(iter_blocks(meta_path, a.block))) if i in needed}
+    out = {}
+
+    def text_path():
+        for q, rows in work_items:
+            ce.predict([(q, texts[r]) for r in rows], batch_size=a.rerank_batch, show_progress_bar=False)
+    wall, cpu, _ = timed(text_path, a.repeat)
+    out["rerank"] = result(wall, cpu, n_pairs, "pairs", depth=a.rerank_depth, batch=a.rerank_batch,
+                           note="stub BERT, text path")
+
+    cache_dir = work / "ce_tokens"
+    if not (cache_dir / "ids.npy").exists():
+        seqs = chain.from_iterable(tokenize_texts(ce.tokenizer, [p["passage"] for p in block], 512)
+                                   for block in iter_blocks(meta_path, a.block))
+        write_ragged(cache_dir, seqs, {"tokenizer": ckpt, "max_tokens": 512})
+    cache = RaggedTokens.open(cache_dir)
+
+    def cached_path():
+        for q, rows in work_items:
+            score_cached(ce, ce.tokenizer(q, add_special_tokens=False)["input_ids"], rows, cache, a.rerank_batch)
+    wall, cpu, _ = timed(cached_path, a.repeat)
+    out["rerank_cached"] = result(wall, cpu, n_pairs, "pairs", depth=a.rerank_depth, batch=a.rerank_batch,
+                                  note="stub BERT, token cache")
+    return out
+
+def compare(old, new, tolerance):
+    """Throughput ratios new/old per benchmark; returns 1 if any dropped by more than tolerance."""
+    print(f"\n[compare] {old.get('commit')} → {new.get('commit')}")
+    regressed = 0
+    for name, r in new["results"].items():
+        o = old.get("results", {}).get(name)
+        key = f"{r['unit']}_per_s"
+        if not o or not o.get(key) or not r.get(key):
+            continue
+        ratio = r[key] / o[key]
+        flag = "❌" if ratio < 1 - tolerance else ("⬆" if ratio > 1 + tolerance else " ")
+        regressed += ratio < 1 - tolerance
+        print(f"{flag} {name:17s} {o[key]:>12,.1f} → {r[key]:>12,.1f} {r['unit']}/s  ({ratio:.2f}x)")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--passages", type=int, default=10000, help="target corpus size (10k–10M)")
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--workdir", default=None, help="corpus + artifacts; default outputs/bench/work/p<passages>-s<seed>")
+    ap.add_argument("--out", default=None, help="default: outputs/bench/<commit>.json")
+    ap.add_argument("--only", nargs="+", choices=STAGES, default=None)
+    ap.add_argument("--skip", nargs="+", choices=STAGES, default=None)
+    ap.add_argument("--repeat", type=int, default=3, help="report the best of N runs per stage")
+    ap.add_argument("--dim", type=int, default=384, help="stub embedding size (MiniLM is 384)")
+    ap.add_argument("--batch", type=int, default=512, help="encode batch")
+    ap.add_argument("--block", type=int, default=50000, help="passages / vectors per streamed block")
+    ap.add_argument("--topk", type=int, default=100)
+    ap.add_argument("--search_batches", type=int, nargs="+", default=[1, 64])
+    ap.add_argument("--rerank_queries", type=int, default=50)
+    ap.add_argument("--rerank_depth", type=int, default=100)
+    ap.add_argument("--rerank_batch", type=int, default=64)
+    ap.add_argument("--threads", type=int, default=None, help="torch threads for rerank, NumPy search workers")
+    ap.add_argument("--compare", default=None, help="earlier result JSON to compare throughput against")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="--compare: flag drops beyond this fraction")
+    args = ap.parse_args()
+    args.workdir = args.workdir or str(ROOT / "outputs" / "bench" / "work" / f"p{args.passages}-s{args.seed}")
+    sys.exit(main(args))
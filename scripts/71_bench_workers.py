@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Startup time and memory of N search workers loading the same index: copied vs memory-mapped.
+
+Each worker is a fresh process (spawn) that loads the index the way 31_search_faiss.py /
+60_rerank.py do (exact_search.load_index, --mmap or not), runs --queries random searches, then
+waits at a barrier so every worker is alive when memory is read from /proc/self/smaps_rollup:
+
+  Rss      resident pages, shared file pages counted in full by every worker
+  Pss      shared pages divided among the processes mapping them (sums to real usage)
+  Private  pages only this worker holds: a copied index, and mapped pages while one worker runs
+
+With read_index() each worker holds a private copy of the vectors, so the Pss sum grows with the
+number of workers; with --mmap the vectors are page-cache pages shared by all workers and the Pss
+sum stays roughly one index. Load time under --mmap excludes reading the file (first search pays
+for page faults instead). The file is read once up front so both modes start from a warm page cache.
+
+  python scripts/71_bench_workers.py --index indexes/faiss_base/index.faiss --workers 1 8
+  python scripts/71_bench_workers.py --index indexes/faiss_base/embeddings.npy --modes mmap
+"""
+
+import argparse, json, multiprocessing as mp, os, queue, time
+from pathlib import Path
+
+import numpy as np
+
+def smaps_rollup():
+    """{Rss, Pss, Private} bytes of this process (Linux), {} elsewhere."""
+    out = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    out[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        return {}
+    return {"rss": out.get("Rss", 0), "pss": out.get("Pss", 0),
+            "private": out.get("Private_Clean", 0) + out.get("Private_Dirty", 0)}
+
+def worker(path, mode, n_queries, topk, threads, seed, barrier, results):
+    from exact_search import NumpyFlatIndex, load_index
+    if not path.endswith(".npy"):
+        import faiss  # noqa: F401  before the timer: load_s is reading the index, not importing faiss
+    before = smaps_rollup()
+    t0 = time.perf_counter()
+    if path.endswith(".npy") and mode == "copy":
+        index = NumpyFlatIndex.open(path, mmap=False, threads=threads)
+    else:
+        index = load_index(path, threads=threads, mmap=mode == "mmap")
+    load_s = time.perf_counter() - t0
+    Q = np.random.default_rng(seed).standard_normal((n_queries, index.d)).astype(np.float32)
+    Q /= np.linalg.norm(Q, axis=1, keepdims=True)
+    t0 = time.perf_counter()
+    index.search(Q, topk)
+    search_s = time.perf_counter() - t0
+    barrier.wait()             # everyone loaded and searched: shared pages are shared now
+    mem = smaps_rollup()
+    results.put({"load_s": load_s, "search_s": search_s, "base_rss": before.get("rss", 0), **mem})
+    barrier.wait()             # nobody exits (and unmaps) before all have measured
+
+def run(path, mode, n_workers, args):
+    ctx = mp.get_context("spawn")
+    # the timeout breaks the barrier for the survivors if a worker dies before reaching it
+    barrier, results = ctx.Barrier(n_workers, timeout=args.timeout), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(path, mode, args.queries, args.topk, args.threads,
+                                              args.seed + i, barrier, results)) for i in range(n_workers)]
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    rows, deadline = [], time.monotonic() + args.timeout
+    while len(rows) < n_workers:
+        try:
+            rows.append(results.get(timeout=1.0))
+        except queue.Empty:
+            failed = any(not p.is_alive() and p.exitcode for p in procs)
+            if failed or time.monotonic() > deadline:
+                barrier.abort()
+                for p in procs:
+                    p.join(5)
+                    if p.is_alive():
+                        p.terminate()
+                why = "failed" if failed else f"timed out after {args.timeout:.0f}s"
+                raise SystemExit(f"[bench] {mode} x{n_workers} {why}: exit codes {[p.exitcode for p in procs]}")
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - t0
+    if any(p.exitcode for p in procs):
+        raise SystemExit(f"[bench] a {mode} worker failed: exit codes {[p.exitcode for p in procs]}")
+    mib = lambda key: round(sum(r.get(key, 0) for r in rows) / 2**20, 1)
+    return {"mode": mode, "workers": n_workers, "wall_s": round(wall, 3),
+            "load_s_mean": round(float(np.mean([r["load_s"] for r in rows])), 4),
+            "load_s_max": round(max(r["load_s"] for r in rows), 4),
+            "search_s_mean": round(float(np.mean([r["search_s"] for r in rows])), 4),
+            "rss_sum_mib": mib("rss"), "pss_sum_mib": mib("pss"), "private_sum_mib": mib("private"),
+            "interpreter_rss_sum_mib": mib("base_rss")}
+
+def main(args):
+    path = args.index
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:          # warm the page cache so both modes start equal
+        while f.read(1 << 24):
+            pass
+    print(f"[bench] {path} ({size / 2**20:.1f} MiB), modes={args.modes}, workers={args.workers}")
+    rows = []
+    for n in args.workers:
+        for mode in args.modes:
+            r = run(path, mode, n, args)
+            rows.append(r)
+            print(f"  {mode:5s} x{n:<3d} load {r['load_s_mean']:.3f}s (max {r['load_s_max']:.3f}s)  "
+                  f"search {r['search_s_mean']:.3f}s  RSS {r['rss_sum_mib']:8.1f}  PSS {r['pss_sum_mib']:8.1f}  "
+                  f"private {r['private_sum_mib']:8.1f} MiB")
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"index": path, "index_mib": round(size / 2**20, 1), "queries": args.queries,
+                       "topk": args.topk, "threads": args.threads, "results": rows}, f, indent=2)
+        print(f"✅ {args.out}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", required=True, help="index.faiss or embeddings.npy")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 8], help="worker counts to compare")
+    ap.add_argument("--modes", nargs="+", choices=["copy", "mmap"], default=["copy", "mmap"],
+                    help="copy: read the file into memory; mmap: load_index(..., mmap=True)")
+    ap.add_argument("--queries", type=int, default=32, help="random searches per worker after loading")
+    ap.add_argument("--topk", type=int, default=100)
+    ap.add_argument("--threads", type=int, default=1, help="search threads per worker")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--timeout", type=float, default=600, help="seconds to wait for the workers of one run")
+    ap.add_argument("--out", default=None, help="write the results JSON here")
+    main(ap.parse_args())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+One entry point for the numbered pipeline scripts.
+
+  python scripts/astrorag.py <command> [script args...]
+  python scripts/astrorag.py eval --qrels outputs/qrels/dev.qrels --runs a.trec b.trec --out m.json
+
+Each command runs its script (runpy, same process) with the remaining arguments, so the script's
+imports happen only when that command is chosen: `eval`, `qrels`, `convert-run`, ... never load
+torch / sentence-transformers / faiss. This file itself imports nothing beyond the stdlib, which
+keeps `--help` instant.
+
+  python scripts/astrorag.py check-startup [--budget 1.0]
+
+times `--help` and every command's `--help` in fresh interpreters and fails if one is over
+budget or pulls in a heavy module: the scripts import torch / sentence-transformers / faiss after
+parse_args(), so help and argument errors come back before any of them load.
+"""
+
+import os
+import runpy
+import subprocess
+import sys
+import time
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+# command -> (script, light, summary); light = stdlib / numpy only even when it runs
+COMMANDS = {
+    "download":          ("00_download_arxiv.py",          False, "download arXiv metadata (configs/data.yaml)"),
+    "chunk":             ("10_chunk_passages.py",          True,  "chunk abstracts into passages.jsonl"),
+    "dedup":             ("15_dedup_passages.py",          True,  "drop older arXiv versions + near-duplicate chunks"),
+    "embed":             ("20_embed_and_index.py",         False, "embed passages and build the FAISS index"),
+    "pretokenize":       ("21_pretokenize_passages.py",    False, "token cache for cross-encoder passages"),
+    "merge-shards":      ("23_merge_shards.py",            False, "merge --shard i/N embeddings into one index"),
+    "index-tokens":      ("22_index_token_embeddings.py",  False, "per-token store for late interaction"),
+    "build-queries":     ("30_build_queries.py",           True,  "sample title queries from raw data"),
+    "search":            ("31_search_faiss.py",            False, "FAISS top-k retrieval → run file"),
+    "rerank-ce":         ("32_rerank_cross_encoder.py",    False, "rerank a run with a cross-encoder"),
+    "eval":              ("33_eval_runs.py",               True,  "NDCG/MRR/Recall of runs against qrels"),
+    "qrels":             ("34_make_qrels.py",              True,  "same-paper qrels from queries + meta"),
+    "convert-run":       ("35_convert_run.py",             True,  "TREC text <-> binary .npz runs"),
+    "compare-runs":      ("36_compare_runs.py",            True,  "paired bootstrap / randomization tests"),
+    "chunk-sweep":       ("40_experiment_chunk_sizes.py",  True,  "chunk-size sweep (cached DAG)"),
+    "weak-pairs":        ("40_make_weak_pairs.py",         True,  "weakly supervised training pairs"),
+    "eval-run":          ("41_eval_run.py",                True,  "evaluate one run with same-paper qrels"),
+    "hard-pairs":        ("41_make_hard_pairs.py",         True,  "hard-negative pairs from a run"),
+    "mine-pairs":        ("42_mine_pairs_from_index.py",   False, "hard-negative pairs straight from FAISS"),
+    "compare-chunks":    ("43_compare_all_chunks.py",      True,  "FAISS vs CE over a chunk sweep"),
+    "tokenize-pairs":    ("45_tokenize_pairs.py",          False, "pre-tokenized training shards"),
+    "train-reranker":    ("50_train_reranker.py",          False, "train the cross-encoder reranker"),
+    "export-reranker":   ("51_export_reranker.py",         False, "export the reranker for CPU inference"),
+    "train-late":        ("52_train_late_interaction.py",  False, "train the late-interaction reranker"),
+    "rerank":            ("60_rerank.py",                  False, "end-to-end retrieve + rerank"),
+    "compare-rerankers": ("62_compare_rerankers.py",       False, "CE vs late interaction benchmark"),
+}
+
+# scripts that read sys.argv directly: --help would start real work, so answer it here
+USAGE = {
+    "download": "astrorag download            (no arguments; settings come from configs/data.yaml)",
+}
+
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "faiss", "onnxruntime", "sklearn")
+
+
+def usage() -> str:
+    lines = ["usage: astrorag <command> [args...]   (astrorag <command> --help for its options)", "",
+             "commands:"]
+    for name, (script, light, summary) in COMMANDS.items():
+        lines.append(f"  {name:18s} {summary}  [{script}]")
+    lines.append(f"  {'check-startup':18s} time --help of the CLI and every command")
+    return "\n".join(lines)
+
+
+def run_command(name: str, argv):
+    script = os.path.join(SCRIPTS, COMMANDS[name][0])
+    if name in USAGE and any(a in ("-h", "--help") for a in argv):
+        print(USAGE[name])
+        return 0
+    if SCRIPTS not in sys.path:
+        sys.path.insert(0, SCRIPTS)
+    sys.argv = [script] + list(argv)
+    runpy.run_path(script, run_name="__main__")
+    return 0
+
+
+# snippet run in a fresh interpreter: the command's --help, then which heavy modules got imported
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {scripts!r})
+import astrorag
+try:
+    astrorag.main(sys.argv[1:])
+except SystemExit:
+    pass
+print(json.dumps({{"seconds": time.perf_counter() - t0,
+                  "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}), file=sys.stderr)
+"""
+
+
+def check_startup(argv) -> int:
+    import argparse, json
+    ap = argparse.ArgumentParser(prog="astrorag check-startup")
+    ap.add_argument("--budget", type=float, default=1.0, help="seconds allowed per command, interpreter start included")
+    ap.add_argument("--commands", nargs="+", default=None, help="default: every command")
+    args = ap.parse_args(argv)
+
+    probes = [[]] + [[c] for c in (args.commands or list(COMMANDS))]
+    code = _PROBE.format(scripts=SCRIPTS, heavy=HEAVY_MODULES)
+    failed = 0
+    for cmd in probes:
+        t0 = time.perf_counter()
+        p = subprocess.run([sys.executable, "-c", code, *cmd, "--help"],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        wall = time.perf_counter() - t0
+        try:
+            info = json.loads(p.stderr.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            info = {"seconds": float("nan"), "heavy": ["<probe failed>"]}
+        ok = wall <= args.budget and not info["heavy"]
+        failed += not ok
+        label = " ".join(cmd) or "--help"
+        extra = f"  imports {', '.join(info['heavy'])}" if info["heavy"] else ""
+        print(f"{'✅' if ok else '❌'} {label:18s} {wall:.2f}s wall ({info['seconds']:.2f}s in-process){extra}")
+    print(f"{len(probes) - failed}/{len(probes)} within {args.budget:.2f}s")
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0 if argv else 2
+    name, rest = argv[0], argv[1:]
+    if name == "check-startup":
+        return check_startup(rest)
+    if name not in COMMANDS:
+        print(f"astrorag: unknown command {name!r}\n\n{usage()}", file=sys.stderr)
+        return 2
+    return run_command(name, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Multi-stage cascade reranking for 60_rerank.py.
+
+A cheap scorer (smaller / quantized / distilled cross-encoder) prunes the FAISS candidates and
+only the survivors reach the next (more expensive) stage. How many candidates enter the first
+stage is picked per query from the FAISS score margin: a big gap between the top hit and the
+`margin_at`-th hit means the retriever is confident, so fewer candidates are reranked.
+
+Config (YAML, see configs/cascade.yaml):
+  depth:  {min, max, margin_at, margin_lo, margin_hi}
+  stages: [{name, model, backend, keep, batch, token_cache}, ...]   # last stage = full model
+"""
+
+import math
+from typing import Dict, List
+
+import numpy as np
+import yaml
+
+
+def load_cascade(path: str, final_model: str, final_topk: int, backend: str = "torch") -> dict:
+    with open(path) as f:
+        cfg = yaml.safe_load(f) or {}
+    depth = cfg.setdefault("depth", {})
+    depth.setdefault("min", 50)
+    depth.setdefault("max", 200)
+    depth.setdefault("margin_at", 10)
+    depth.setdefault("margin_lo", 0.02)
+    depth.setdefault("margin_hi", 0.15)
+
+    stages = cfg.get("stages") or []
+    if not stages:
+        raise ValueError(f"{path}: cascade needs at least one stage")
+    for i, st in enumerate(stages):
+        st.setdefault("name", f"stage{i}")
+        st.setdefault("batch", 32)
+        st.setdefault("token_cache", False)
+        st["backend"] = st.get("backend") or backend
+        if not st.get("model"):
+            st["model"] = final_model     # null model = the --reranker checkpoint
+    # scorers and per-stage call counts are keyed by name
+    seen = set()
+    for st in stages:
+        if st["name"] in seen:
+            raise ValueError(f"{path}: stage name '{st['name']}' is used twice")
+        seen.add(st["name"])
+    stages[-1]["keep"] = final_topk       # last stage always emits the final list
+    for st in stages[:-1]:
+        if "keep" not in st:
+            raise ValueError(f"{path}: stage '{st['name']}' needs a 'keep' count")
+    return cfg
+
+
+def adaptive_depth(faiss_scores: np.ndarray, depth: dict) -> int:
+    """Rerank depth from the FAISS margin top1 - top[margin_at], linear between lo and hi."""
+    n = len(faiss_scores)
+    lo_d, hi_d = int(depth["min"]), int(depth["max"])
+    if n == 0:
+        return 0
+    at = min(int(depth["margin_at"]), n) - 1
+    margin = float(faiss_scores[0] - faiss_scores[at])
+    lo, hi = float(depth["margin_lo"]), float(depth["margin_hi"])
+    t = 0.0 if margin <= lo else 1.0 if margin >= hi else (margin - lo) / (hi - lo)
+    return min(n, int(round(hi_d - t * (hi_d - lo_d))))
+
+
+def run_cascade(rows: List[int], faiss_scores: np.ndarray, stages: List[dict],
+                scorers: Dict[str, callable], depth: dict):
+    """Return ([(row, score)] best-first, {stage_name: n_scored}) for one query.
+
+    scorers[name](rows) -> scores for that stage's model.
+    """
+    k = adaptive_depth(faiss_scores, depth)
+    cand = list(rows[:k])
+    calls = {}
+    scored = []
+    for st in stages:
+        scores = np.asarray(scorers[st["name"]](cand), dtype=np.float32) if cand else np.zeros(0)
+        calls[st["name"]] = len(cand)
+        order = np.argsort(-scores, kind="stable")[:int(st["keep"])]
+        cand = [cand[i] for i in order]
+        scored = [(cand[j], float(scores[i])) for j, i in enumerate(order)]
+    return scored, calls
+
+
+def ndcg_at_k(ranked_docids: List[str], gold: set, k: int = 10) -> float:
+    dcg = sum(1.0 / math.log2(i + 1) for i, d in enumerate(ranked_docids[:k], start=1) if d in gold)
+    ideal = sum(1.0 / math.log2(i + 1) for i in range(1, min(k, len(gold)) + 1))
+    return dcg / ideal if ideal > 0 else 0.0
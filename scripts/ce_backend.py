@@ -0,0 +1,90 @@
+"""
+Cross-encoder inference backends for CPU reranking.
+
+  torch       : fp32 sentence-transformers CrossEncoder (what we always ran)
+  torch-int8  : same model with nn.Linear layers dynamically quantized to int8
+  onnx        : <ckpt>/onnx/model.onnx via onnxruntime        (51_export_reranker.py)
+  onnx-int8   : <ckpt>/onnx/model.int8.onnx via onnxruntime   (51_export_reranker.py)
+
+Every backend exposes .tokenizer, .max_length and .predict(pairs, batch_size); the ONNX ones
+also have .score_features(feats) so token_cache.score_cached can feed them cached ids.
+Scores go through the same activation CrossEncoder.predict applies (sigmoid for 1 label).
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+
+
+def find_onnx(ckpt: str, backend: str) -> Path:
+    name = ONNX_FILES[backend]
+    for cand in (Path(ckpt) / "onnx" / name, Path(ckpt) / name):
+        if cand.exists():
+            return cand
+    raise FileNotFoundError(f"No {name} under {ckpt} (run scripts/51_export_reranker.py first)")
+
+
+class OnnxCrossEncoder:
+    def __init__(self, ckpt: str, backend: str = "onnx", max_length: int = None, threads: int = None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("onnxruntime is required for the onnx backends (pip install onnxruntime)") from e
+        from transformers import AutoTokenizer
+
+        path = find_onnx(ckpt, backend)
+        tok_dir = path.parent
+        self.tokenizer = AutoTokenizer.from_pretrained(str(tok_dir), use_fast=True)
+        info_path = tok_dir / "export.json"
+        info = json.loads(info_path.read_text()) if info_path.exists() else {}
+        self.max_length = max_length or info.get("max_length") or self.tokenizer.model_max_length
+        self.num_labels = info.get("num_labels", 1)
+
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def score_features(self, feats: dict) -> np.ndarray:
+        logits = self.session.run(None, {k: feats[k] for k in self.input_names})[0]
+        if logits.shape[-1] == 1:
+            return 1.0 / (1.0 + np.exp(-logits[:, 0]))
+        return logits
+
+    def predict(self, pairs, batch_size: int = 32, **_) -> np.ndarray:
+        out = []
+        for start in range(0, len(pairs), batch_size):
+            chunk = pairs[start:start + batch_size]
+            feats = self.tokenizer([p[0] for p in chunk], [p[1] for p in chunk], padding=True,
+                                   truncation="longest_first", max_length=self.max_length,
+                                   return_tensors="np")
+            out.append(self.score_features({k: v.astype(np.int64) for k, v in feats.items()}))
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+
+def load_reranker(ckpt: str, backend: str = "torch", max_length: int = None, threads: int = None,
+                  device: str = None):
+    """Load a reranker checkpoint with the requested backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}; choose from {BACKENDS}")
+    if backend.startswith("onnx"):
+        return OnnxCrossEncoder(ckpt, backend, max_length=max_length, threads=threads)
+
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    if threads:
+        torch.set_num_threads(threads)
+    if backend == "torch-int8":
+        device = "cpu"   # dynamic quantization kernels are CPU-only
+    ce = CrossEncoder(ckpt, max_length=max_length, device=device)
+    if backend == "torch-int8":
+        # in place: newer sentence-transformers expose .model as a read-through property
+        torch.ao.quantization.quantize_dynamic(ce.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return ce
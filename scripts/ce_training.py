@@ -0,0 +1,434 @@
+"""
+Training utilities for 50_train_reranker.py on pre-tokenized pair shards (45_tokenize_pairs.py).
+
+- StreamingPairDataset: iterates memory-mapped shards with a per-epoch permutation, splits the
+  examples across DataLoader workers and mixes them through a bounded shuffle buffer, so memory
+  stays flat no matter how many pairs were mined.
+- TokenBudgetBatches: sorts a pool of streamed examples by pair length and cuts it into batches
+  of at most max_tokens padded tokens, so short pairs are not padded up to long ones.
+- PairCollator: joins cached query/passage ids into padded cross-encoder inputs.
+- train_cross_encoder: plain AdamW + linear warmup loop (BCE on 0/1 labels, like CrossEncoder.fit).
+- ThroughputLogger: per-epoch examples/sec, tokens/sec and padding ratio.
+- init_distributed: torch DDP over gloo when launched by torchrun (CPU nodes, one or many).
+- RankingEvaluator: NDCG@10 / MRR@10 on a fixed, pre-tokenized dev candidate set during training;
+  saves the best checkpoint.
+"""
+
+import json
+import math
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.utils.data import IterableDataset, get_worker_info
+
+import perf
+from token_cache import RaggedTokens, _torch_scores, build_pairs_features, pair_template, tokenize_texts
+
+
+DIST_TIMEOUT_ENV = "ASTRORAG_DIST_TIMEOUT"   # seconds a collective may wait (default 2 h)
+
+
+def init_distributed():
+    """(rank, world_size); joins the gloo process group when launched by torchrun (WORLD_SIZE > 1)."""
+    world = int(os.environ.get("WORLD_SIZE", "1"))
+    if world <= 1:
+        return 0, 1
+    if not dist.is_initialized():
+        # explicit, so a long checkpoint save on rank 0 doesn't trip gloo's 30 min default
+        dist.init_process_group("gloo", timeout=timedelta(seconds=float(os.environ.get(DIST_TIMEOUT_ENV, 7200))))
+    return dist.get_rank(), dist.get_world_size()
+
+
+def is_main() -> bool:
+    return not dist.is_initialized() or dist.get_rank() == 0
+
+
+class PairShards:
+    def __init__(self, root, split: str = "train"):
+        self.root = Path(root)
+        self.manifest = json.loads((self.root / "manifest.json").read_text())
+        self.split = split
+        self.entries = self.manifest["splits"].get(split, [])
+        self.n_examples = sum(e["n"] for e in self.entries)
+
+    def open(self, i: int):
+        d = self.root / self.entries[i]["dir"]
+        return (RaggedTokens.open(d / "q"), RaggedTokens.open(d / "p"),
+                np.load(d / "qrow.npy", mmap_mode="r"), np.load(d / "labels.npy", mmap_mode="r"))
+
+
+class StreamingPairDataset(IterableDataset):
+    """Yields (query_ids, passage_ids, label) from shards; shuffling is bounded by shuffle_buffer."""
+
+    def __init__(self, root, split: str = "train", shuffle: bool = True, shuffle_buffer: int = 10_000,
+                 seed: int = 42):
+        self.shards = PairShards(root, split)
+        self.shuffle, self.shuffle_buffer, self.seed = shuffle, shuffle_buffer, seed
+        self.epoch = 0
+        self.rank, self.world_size = 0, 1
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.shards.n_examples
+
+    def _parts(self):
+        """(part, n_parts) of this process + DataLoader worker among everyone reading the shards."""
+        info = get_worker_info()
+        wid, nw = (info.id, info.num_workers) if info else (0, 1)
+        return self.rank * nw + wid, self.world_size * nw
+
+    def _examples(self, part: int, n_parts: int):
+        rng = np.random.default_rng([self.seed, self.epoch])     # identical in every worker
+        order = rng.permutation(len(self.shards.entries)) if self.shuffle else range(len(self.shards.entries))
+        for si in order:
+            q, p, qrow, labels = self.shards.open(int(si))
+            idx = rng.permutation(len(labels)) if self.shuffle else np.arange(len(labels))
+            for j in idx[part::n_parts]:
+                yield np.asarray(q[int(qrow[j])]), np.asarray(p[int(j)]), float(labels[j])
+
+    def __iter__(self):
+        part, n_parts = self._parts()
+        it = self._examples(part, n_parts)
+        if not self.shuffle or self.shuffle_buffer <= 1:
+            yield from it
+            return
+        rng = np.random.default_rng([self.seed, self.epoch, part])
+        buf = []
+        for ex in it:
+            if len(buf) < self.shuffle_buffer:
+                buf.append(ex)
+                continue
+            k = int(rng.integers(len(buf)))
+            yield buf[k]
+            buf[k] = ex
+        rng.shuffle(buf)
+        yield from buf
+
+
+def pair_lengths(shards: PairShards, tokenizer, max_len: int) -> np.ndarray:
+    """Model input length of every example in shards (query + passage + special tokens, truncated)."""
+    tpl = pair_template(tokenizer)
+    n_special = len(tpl["prefix"]) + len(tpl["middle"]) + len(tpl["suffix"])
+    out = []
+    for i in range(len(shards.entries)):
+        q, p, qrow, _labels = shards.open(i)
+        n = q.lengths()[np.asarray(qrow)] + p.lengths()
+        out.append(n_special + np.minimum(n, max_len - n_special))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+
+def budget_batches(lengths: np.ndarray, max_tokens: int, max_batch: int) -> list:
+    """Greedy cut of length-sorted examples: batch size * longest pair <= max_tokens."""
+    order = np.argsort(lengths, kind="stable")
+    batches, cur, width = [], [], 0
+    for i in order:
+        w = max(width, int(lengths[i]))
+        if cur and (w * (len(cur) + 1) > max_tokens or len(cur) >= max_batch):
+            batches.append(cur)
+            cur, w = [], int(lengths[i])
+        cur.append(int(i))
+        width = w
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+class TokenBudgetBatches(IterableDataset):
+    """Wraps a StreamingPairDataset and yields lists of examples (use DataLoader(batch_size=None)).
+
+    Every pool_size streamed examples are sorted by pair length and cut into token-budget batches;
+    the batches of a pool are then shuffled so consecutive steps still mix lengths.
+    """
+
+    def __init__(self, dataset: StreamingPairDataset, tokenizer, max_len: int, max_tokens: int,
+                 pool_size: int = 2000, max_batch: int = 256):
+        tpl = pair_template(tokenizer)
+        self.n_special = len(tpl["prefix"]) + len(tpl["middle"]) + len(tpl["suffix"])
+        self.dataset, self.max_len, self.max_tokens = dataset, max_len, max_tokens
+        self.pool_size, self.max_batch = pool_size, max_batch
+
+    def set_epoch(self, epoch: int):
+        self.dataset.set_epoch(epoch)
+
+    def estimate_steps(self, lengths: np.ndarray) -> int:
+        """Batches per epoch if the pools were cut like one global sort (a slight underestimate)."""
+        return len(budget_batches(lengths, self.max_tokens, self.max_batch))
+
+    def _cut(self, pool, rng):
+        lengths = np.asarray([self.n_special + min(len(q) + len(p), self.max_len - self.n_special)
+                              for q, p, _ in pool])
+        batches = budget_batches(lengths, self.max_tokens, self.max_batch)
+        for k in rng.permutation(len(batches)):
+            yield [pool[i] for i in batches[k]]
+
+    def __iter__(self):
+        part, _n_parts = self.dataset._parts()
+        rng = np.random.default_rng([self.dataset.seed, self.dataset.epoch, part, 1])
+        pool = []
+        for ex in self.dataset:
+            pool.append(ex)
+            if len(pool) >= self.pool_size:
+                yield from self._cut(pool, rng)
+                pool = []
+        if pool:
+            yield from self._cut(pool, rng)
+
+
+class PairCollator:
+    def __init__(self, tokenizer, max_len: int):
+        self.tokenizer, self.max_len = tokenizer, max_len
+
+    def __call__(self, batch):
+        feats = build_pairs_features(self.tokenizer, [b[0] for b in batch], [b[1] for b in batch], self.max_len)
+        feats = {k: torch.from_numpy(v) for k, v in feats.items()}
+        return feats, torch.tensor([b[2] for b in batch], dtype=torch.float32)
+
+
+class ThroughputLogger:
+    """Training callback: examples/sec, tokens/sec (non-pad) and padding ratio per epoch."""
+
+    def __init__(self, out_path: str = None):
+        self.out_path, self.epochs = out_path, []
+
+    def on_epoch_start(self, epoch: int):
+        self.t0, self.examples, self.tokens, self.padded = time.perf_counter(), 0, 0, 0
+        self.loss, self.batches = 0.0, 0
+
+    def on_batch(self, step: int, feats: dict, labels, loss: float):
+        mask = feats["attention_mask"]
+        self.examples += len(labels)
+        self.tokens += int(mask.sum())
+        self.padded += mask.numel()
+        self.loss += loss
+        self.batches += 1
+
+    def on_epoch_end(self, epoch: int):
+        secs = max(time.perf_counter() - self.t0, 1e-9)
+        if dist.is_initialized():  # totals over all ranks; wall time of the slowest
+            t = torch.tensor([self.examples, self.tokens, self.padded, self.loss, self.batches], dtype=torch.float64)
+            dist.all_reduce(t)
+            w = torch.tensor([secs], dtype=torch.float64)
+            dist.all_reduce(w, op=dist.ReduceOp.MAX)
+            if not is_main():
+                return
+            ex, tok, pad, loss, nb = t.tolist()
+            self.examples, self.tokens, self.padded, self.loss, self.batches = int(ex), int(tok), int(pad), loss, int(nb)
+            secs = w.item()
+        row = {"epoch": epoch + 1, "examples": self.examples, "batches": self.batches,
+               "mean_loss": round(self.loss / max(1, self.batches), 4),
+               "examples_per_sec": round(self.examples / secs, 1),
+               "tokens_per_sec": round(self.tokens / secs, 1),
+               "padding_ratio": round(1.0 - self.tokens / max(1, self.padded), 4),
+               "seconds": round(secs, 2)}
+        self.epochs.append(row)
+        print(f"[epoch {row['epoch']}] examples={row['examples']}  mean_loss={row['mean_loss']:.4f}  "
+              f"{row['examples_per_sec']:.1f} ex/s  {row['tokens_per_sec']:.0f} tok/s  "
+              f"padding={row['padding_ratio']:.1%}", flush=True)
+        if self.out_path:
+            with open(self.out_path, "w") as f:
+                json.dump(self.epochs, f, indent=2)
+
+
+class RankingEvaluator:
+    """Training callback: reranks fixed dev candidates and keeps the best checkpoint in out_dir.
+
+    cands: {qid: [docid, ...]} (e.g. a FAISS run's top-k), qrels: {qid: set(relevant docids)}.
+    Query and passage ids are tokenized once up front (passages come from a 21_pretokenize_passages
+    cache when given); every evaluation scores all pairs in length-sorted batches.
+    Evaluates before training, every eval_steps optimizer steps (0 = off) and after each epoch.
+    Under torch.distributed every rank must hold one: each scores every world-th dev query and the
+    metric sums are all-reduced, so no rank idles in a collective while another evaluates; rank 0
+    saves the checkpoint and writes eval_log.json.
+    """
+
+    def __init__(self, ce, queries: dict, cands: dict, qrels: dict, docids: list, passages: list,
+                 out_dir: str, cache: RaggedTokens = None, metric: str = "ndcg@10", k: int = 10,
+                 batch_size: int = 64, eval_steps: int = 0):
+        self.ce, self.out_dir, self.metric, self.k = ce, out_dir, metric, k
+        self.batch_size, self.eval_steps = batch_size, eval_steps
+        self.best, self.history = -1.0, []
+        self._epoch, self._step, self._last = 0, 0, None
+        tok = ce.tokenizer
+        self.max_len = max_len = ce.max_length or tok.model_max_length
+        row_of = {d: i for i, d in reversed(list(enumerate(docids)))}
+
+        self.qids = [q for q in cands if q in queries and qrels.get(q)]
+        q_ids = list(tokenize_texts(tok, [queries[q] for q in self.qids], max_len))
+        rows = sorted({row_of[d] for q in self.qids for d in cands[q] if d in row_of})
+        if cache is None:  # tokenize just the candidate passages
+            p_ids = dict(zip(rows, tokenize_texts(tok, [passages[r] for r in rows], max_len)))
+        else:
+            p_ids = {r: np.asarray(cache[r]) for r in rows}
+
+        self.pair_q, self.pair_p, self.docs, self.gold = [], [], [], []
+        for qi, q in enumerate(self.qids):
+            ds = [d for d in cands[q] if d in row_of]
+            self.docs.append(ds)
+            self.gold.append(qrels[q])
+            for d in ds:
+                self.pair_q.append(q_ids[qi])
+                self.pair_p.append(p_ids[row_of[d]])
+        lens = np.asarray([len(a) + len(b) for a, b in zip(self.pair_q, self.pair_p)], dtype=np.int64)
+        self.bounds = np.concatenate([[0], np.cumsum([len(ds) for ds in self.docs])]).astype(np.int64)
+        rank, world = (dist.get_rank(), dist.get_world_size()) if dist.is_initialized() else (0, 1)
+        self.mine = list(range(rank, len(self.qids), world))   # the dev queries this rank scores
+        idx = (np.concatenate([np.arange(self.bounds[i], self.bounds[i + 1]) for i in self.mine])
+               if self.mine else np.zeros(0, dtype=np.int64))
+        self.order = idx[np.argsort(lens[idx], kind="stable")]
+        if is_main():
+            print(f"[eval] dev queries={len(self.qids)}  pairs={len(self.pair_q)}  metric={metric}", flush=True)
+
+    def scores(self) -> np.ndarray:
+        tok, max_len, bs = self.ce.tokenizer, self.max_len, self.batch_size
+        batches = (build_pairs_features(tok, [self.pair_q[i] for i in idx], [self.pair_p[i] for i in idx], max_len)
+                   for idx in (self.order[s:s + bs] for s in range(0, len(self.order), bs)))
+        out = np.zeros(len(self.pair_q), dtype=np.float32)   # pairs of other ranks' queries stay 0
+        if len(self.order):
+            out[self.order] = np.concatenate(list(_torch_scores(self.ce, batches)))
+        return out
+
+    def evaluate(self) -> dict:
+        model = self.ce.model
+        was_training = model.training
+        t0 = time.perf_counter()
+        with perf.span("train.evaluate", items=len(self.order)):
+            scores = self.scores()
+        model.train(was_training)
+        sums = torch.zeros(3, dtype=torch.float64)   # ndcg, mrr, queries
+        for i in self.mine:
+            docs, gold = self.docs[i], self.gold[i]
+            sc = scores[self.bounds[i]:self.bounds[i + 1]]
+            ranked = [docs[j] for j in np.argsort(-sc, kind="stable")[:self.k]]
+            hits = [j for j, d in enumerate(ranked, start=1) if d in gold]
+            ideal = sum(1.0 / math.log2(j + 1) for j in range(1, min(self.k, len(gold)) + 1))
+            sums[0] += sum(1.0 / math.log2(j + 1) for j in hits) / ideal if ideal > 0 else 0.0
+            sums[1] += 1.0 / hits[0] if hits else 0.0
+            sums[2] += 1
+        if dist.is_initialized():
+            dist.all_reduce(sums)
+        n = float(sums[2])
+        return {f"ndcg@{self.k}": round(float(sums[0]) / n, 4) if n else 0.0,
+                f"mrr@{self.k}": round(float(sums[1]) / n, 4) if n else 0.0,
+                "seconds": round(time.perf_counter() - t0, 2)}
+
+    def _run(self, tag: str, epoch: int, step: int):
+        row = {"tag": tag, "epoch": epoch, "step": step, **self.evaluate()}
+        improved = row[self.metric] > self.best   # same all-reduced value on every rank
+        if improved:
+            self.best = row[self.metric]
+        row["best"] = improved
+        self.history.append(row)
+        if is_main():
+            if improved:
+                self.ce.model.save_pretrained(self.out_dir)
+                self.ce.tokenizer.save_pretrained(self.out_dir)
+            with open(os.path.join(self.out_dir, "eval_log.json"), "w") as f:
+                json.dump(self.history, f, indent=2)
+            print(f"[eval {tag}] {self.metric}={row[self.metric]:.4f}  "
+                  f"{'(best, saved)' if improved else f'(best {self.best:.4f})'}  {row['seconds']}s", flush=True)
+        if dist.is_initialized():
+            dist.barrier()   # everyone resumes training once the checkpoint is on disk
+
+    def on_train_start(self):
+        self._run("init", 0, 0)
+
+    def on_batch(self, step: int, feats: dict, labels, loss: float):
+        self._step = step
+        if self.eval_steps and step and step % self.eval_steps == 0 and step != self._last:
+            self._last = step   # on_batch repeats a step while gradients accumulate
+            self._run(f"step {step}", self._epoch + 1, step)
+
+    def on_epoch_start(self, epoch: int):
+        self._epoch = epoch
+
+    def on_epoch_end(self, epoch: int):
+        self._run(f"epoch {epoch + 1}", epoch + 1, self._step)
+
+
+def train_cross_encoder(model, loader, epochs: int, lr: float, warmup_steps: int, steps_per_epoch: int,
+                        device: str, weight_decay: float = 0.01, max_grad_norm: float = 1.0,
+                        log_every: int = 100, on_epoch_start=None, callbacks=None, grad_accum: int = 1):
+    """Fine-tune a HF sequence-classification model on (features, labels) batches.
+
+    steps_per_epoch counts loader batches (per rank); the optimizer steps every grad_accum of them.
+    Under torch.distributed the model is wrapped in DDP and ranks advance in lockstep: an epoch ends
+    for everyone as soon as one rank's loader runs dry, so all-reduces never wait on a finished rank.
+
+    callbacks: objects with any of on_train_start(), on_epoch_start(epoch),
+    on_batch(step, feats, labels, loss), on_epoch_end(epoch); defaults to a ThroughputLogger.
+    """
+    from transformers import get_linear_schedule_with_warmup
+
+    callbacks = [ThroughputLogger()] if callbacks is None else callbacks
+
+    def fire(hook, *args):
+        for cb in callbacks:
+            if hasattr(cb, hook):
+                getattr(cb, hook)(*args)
+
+    model.to(device).train()
+    distributed = dist.is_initialized()
+    net = torch.nn.parallel.DistributedDataParallel(model) if distributed else model
+    no_decay = ("bias", "LayerNorm.weight")
+    groups = [
+        {"params": [p for n, p in model.named_parameters() if not any(x in n for x in no_decay)],
+         "weight_decay": weight_decay},
+        {"params": [p for n, p in model.named_parameters() if any(x in n for x in no_decay)],
+         "weight_decay": 0.0},
+    ]
+    opt = torch.optim.AdamW(groups, lr=lr)
+    opt_steps = max(1, -(-steps_per_epoch // grad_accum) * epochs)
+    sched = get_linear_schedule_with_warmup(opt, warmup_steps, opt_steps)
+    loss_fn = torch.nn.BCEWithLogitsLoss()
+
+    def have_batches(cur, nxt):
+        flags = torch.tensor([cur is not None, nxt is not None], dtype=torch.int32)
+        if distributed:
+            dist.all_reduce(flags, op=dist.ReduceOp.MIN)
+        return bool(flags[0]), bool(flags[1])
+
+    step = 0
+    fire("on_train_start")
+    for epoch in range(epochs):
+        if on_epoch_start is not None:
+            on_epoch_start(epoch)
+        fire("on_epoch_start", epoch)
+        it = iter(loader)
+        with perf.span("train.load_batch"):
+            nxt, micro = next(it, None), 0
+        while True:
+            cur = nxt
+            with perf.span("train.load_batch"):
+                nxt = next(it, None) if cur is not None else None
+            ok, more = have_batches(cur, nxt)
+            if not ok:
+                break
+            feats, labels = cur
+            micro += 1
+            sync = micro % grad_accum == 0 or not more
+            perf.hist("train.batch_size", len(labels))
+            perf.hist("train.seq_len", int(feats["input_ids"].shape[-1]))
+            with perf.span("train.forward_backward", items=len(labels)):
+                feats = {k: v.to(device) for k, v in feats.items()}
+                with net.no_sync() if distributed and not sync else torch.enable_grad():
+                    logits = net(**feats, return_dict=True).logits
+                    logits = logits[:, 0] if logits.shape[-1] == 1 else logits
+                    loss = loss_fn(logits, labels.to(device))
+                    (loss / grad_accum).backward()
+            if sync:
+                with perf.span("train.optimizer_step"):
+                    torch.nn.utils.clip_grad_norm_(model.parameters(), max_grad_norm)
+                    opt.step(); sched.step(); opt.zero_grad()
+                step += 1
+                if log_every and step % log_every == 0 and is_main():
+                    print(f"  step {step}  loss={loss.item():.4f}", flush=True)
+            fire("on_batch", step, feats, labels, loss.item())
+        fire("on_epoch_end", epoch)
+    return step
@@ -0,0 +1,278 @@
+"""
+Minimal content-hashed DAG runner for script pipelines (used by 40_experiment_chunk_sizes.py).
+
+A Node is one script invocation. Its hash covers the command template, its params, the content of
+its input files/dirs (scripts included, with the local helper modules they import) and the hashes
+of the nodes it depends on, so a node is recomputed only when something upstream actually changed. Outputs go to a per-hash cache dir
+  <cache>/<node name>-<hash[:16]>/      (done.json marks it complete)
+and command templates refer to it as {out} and to a dependency's dir as {<dep name>}.
+
+Local mode runs independent nodes concurrently within --cpus / --mem_gb slots. SGE mode writes one
+task file per stage and submits it as an array job (sge/dag_array.sge) held on the upstream stages.
+
+  python scripts/dag.py task <tasks.jsonl> <i>   # what each SGE array task runs
+"""
+
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+_HASH_CACHE_FILE = ".file_hashes.json"
+
+
+class Node:
+    def __init__(self, name: str, cmd: Sequence[str], inputs: Sequence = (), deps: Sequence[str] = (),
+                 params: dict = None, cpus: int = 1, mem_gb: float = 1.0, stage: str = None,
+                 qsub_args: Sequence[str] = ()):
+        self.name, self.cmd = name, list(cmd)
+        self.inputs = [Path(p) for p in inputs]
+        self.deps, self.params = list(deps), dict(params or {})
+        self.cpus, self.mem_gb = cpus, mem_gb
+        self.stage = stage or name.split("_")[0]
+        self.qsub_args = list(qsub_args)
+        self.hash = None
+        self.out = None
+
+
+class FileHasher:
+    """sha256 of files / dir trees, memoized on (size, mtime) in <cache>/.file_hashes.json."""
+
+    def __init__(self, cache_dir: Path):
+        self.path = cache_dir / _HASH_CACHE_FILE
+        self.memo = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.lock = threading.Lock()
+
+    def file(self, p: Path) -> str:
+        st = p.stat()
+        key = str(p.resolve())
+        hit = self.memo.get(key)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        h = hashlib.sha256()
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        with self.lock:
+            self.memo[key] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def __call__(self, p: Path) -> str:
+        if not p.exists():
+            raise FileNotFoundError(f"DAG input missing: {p}")
+        if p.is_file():
+            return self.file(p)
+        h = hashlib.sha256()
+        for f in sorted(x for x in p.rglob("*") if x.is_file()):
+            h.update(str(f.relative_to(p)).encode()); h.update(self.file(f).encode())
+        return h.hexdigest()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.memo))
+        tmp.replace(self.path)
+
+
+def local_imports(script: Path) -> List[Path]:
+    """Modules next to `script` that it imports, directly or through each other (lazy imports too)."""
+    seen, todo = set(), [Path(script).resolve()]
+    while todo:
+        src = todo.pop()
+        try:
+            tree = ast.parse(src.read_text(), str(src))
+        except (OSError, SyntaxError, ValueError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                mod = src.parent / (name.split(".")[0] + ".py")
+                if mod.is_file() and mod not in seen and mod != Path(script).resolve():
+                    seen.add(mod)
+                    todo.append(mod)
+    return sorted(seen)
+
+
+class DAG:
+    def __init__(self, nodes: List[Node], cache_dir):
+        self.nodes = {n.name: n for n in nodes}
+        self.cache = Path(cache_dir)
+        self.order = self._toposort()
+        hasher = FileHasher(self.cache)
+        for name in self.order:
+            n = self.nodes[name]
+            h = hashlib.sha256(json.dumps({"cmd": n.cmd, "params": n.params}, sort_keys=True).encode())
+            for p in n.inputs:
+                h.update(str(p).encode()); h.update(hasher(p).encode())
+                if p.suffix == ".py":
+                    # a changed helper module (run_format.py, perf.py, ...) changes the script's results
+                    for mod in local_imports(p):
+                        h.update(mod.name.encode()); h.update(hasher(mod).encode())
+            for d in n.deps:
+                h.update(self.nodes[d].hash.encode())
+            n.hash = h.hexdigest()
+            n.out = self.cache / f"{name}-{n.hash[:16]}"
+        hasher.save()
+
+    def _toposort(self) -> List[str]:
+        order, state = [], {}
+
+        def visit(name, path=()):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "active":
+                raise ValueError(f"DAG cycle: {' -> '.join(path + (name,))}")
+            if name not in self.nodes:
+                raise KeyError(f"unknown dependency {name!r}")
+            state[name] = "active"
+            for d in self.nodes[name].deps:
+                visit(d, path + (name,))
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def command(self, n: Node) -> List[str]:
+        fmt = {"out": str(n.out), **{d: str(self.nodes[d].out) for d in n.deps}}
+        return [c.format(**fmt) for c in n.cmd]
+
+    def up_to_date(self, n: Node) -> bool:
+        done = n.out / "done.json"
+        return done.exists() and json.loads(done.read_text()).get("hash") == n.hash
+
+    def plan(self, force: bool = False) -> Dict[str, str]:
+        """name -> "cached" | "run". A changed node changes the hash of everything downstream."""
+        status = {}
+        for name in self.order:
+            n = self.nodes[name]
+            stale = force or not self.up_to_date(n)
+            status[name] = "run" if stale else "cached"
+        return status
+
+    # --- local execution ---
+    def run_local(self, cpus: int, mem_gb: float, force: bool = False, log=print) -> Dict[str, float]:
+        status = self.plan(force)
+        todo = {name for name, s in status.items() if s == "run"}
+        for name in self.order:
+            if status[name] == "cached":
+                log(f"[dag] cached  {name}  ({self.nodes[name].out})")
+        done, running, failed, secs = set(self.nodes) - todo, {}, [], {}
+        cond = threading.Condition()
+        free = {"cpus": cpus, "mem": mem_gb}
+
+        def worker(n: Node):
+            ok = False
+            t0 = time.perf_counter()
+            try:
+                ok = execute(n.name, n.hash, str(n.out), self.command(n), log)
+            finally:
+                with cond:
+                    secs[n.name] = round(time.perf_counter() - t0, 2)
+                    free["cpus"] += min(n.cpus, cpus); free["mem"] += min(n.mem_gb, mem_gb)
+                    del running[n.name]
+                    (done.add if ok else failed.append)(n.name)
+                    cond.notify_all()
+
+        with cond:
+            while todo and not failed:
+                ready = [self.nodes[x] for x in self.order if x in todo and all(d in done for d in self.nodes[x].deps)]
+                started = False
+                for n in ready:
+                    need_c, need_m = min(n.cpus, cpus), min(n.mem_gb, mem_gb)
+                    if need_c <= free["cpus"] and need_m <= free["mem"]:
+                        free["cpus"] -= need_c; free["mem"] -= need_m
+                        todo.discard(n.name)
+                        running[n.name] = threading.Thread(target=worker, args=(n,), daemon=True)
+                        running[n.name].start()
+                        started = True
+                if not started:
+                    if not running:
+                        raise RuntimeError(f"[dag] cannot schedule {sorted(todo)} (deps failed or slots too small)")
+                    cond.wait()
+            while running:
+                cond.wait()
+        if failed:
+            raise RuntimeError(f"[dag] failed: {failed}")
+        return secs
+
+    # --- SGE array submission ---
+    def submit_sge(self, template, force: bool = False, qsub: str = "qsub", dry_run: bool = False, log=print):
+        """One array job per stage (nodes of a stage are its tasks), held on upstream stages."""
+        status = self.plan(force)
+        stages: Dict[str, List[Node]] = {}
+        for name in self.order:
+            if status[name] == "run":
+                stages.setdefault(self.nodes[name].stage, []).append(self.nodes[name])
+        job_of, task_dir = {}, self.cache / "sge_tasks"
+        task_dir.mkdir(parents=True, exist_ok=True)
+        for stage, nodes in stages.items():
+            tasks = task_dir / f"{stage}-{int(time.time())}.jsonl"
+            with open(tasks, "w") as f:
+                for n in nodes:
+                    f.write(json.dumps({"name": n.name, "hash": n.hash, "out": str(n.out),
+                                        "cmd": self.command(n)}) + "\n")
+            upstream = sorted({job_of[self.nodes[d].stage] for n in nodes for d in n.deps
+                               if self.nodes[d].stage in job_of})
+            cmd = [qsub, "-terse", "-N", f"dag_{stage}", "-t", f"1-{len(nodes)}"]
+            if upstream:
+                cmd += ["-hold_jid", ",".join(upstream)]
+            cmd += nodes[0].qsub_args + [str(template), str(tasks)]
+            if dry_run:
+                log("[dag] " + " ".join(cmd))
+                job_of[stage] = f"<{stage}>"
+                continue
+            out = subprocess.check_output(cmd).decode().strip()
+            job_of[stage] = out.split(".")[0]
+            log(f"[dag] submitted {stage}: {len(nodes)} tasks as job {job_of[stage]}")
+        return job_of
+
+
+def execute(name: str, node_hash: str, out: str, cmd: List[str], log=print) -> bool:
+    """Run one node into its cache dir and stamp it; a failed run leaves no done.json."""
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    (out / "done.json").unlink(missing_ok=True)
+    log(f"[dag] run     {name}: {' '.join(cmd)}")
+    t0 = time.perf_counter()
+    with open(out / "log.txt", "w") as lf:
+        rc = subprocess.run(cmd, stdout=lf, stderr=subprocess.STDOUT).returncode
+    secs = time.perf_counter() - t0
+    if rc != 0:
+        log(f"[dag] FAILED  {name} (exit {rc}); see {out / 'log.txt'}")
+        return False
+    (out / "done.json").write_text(json.dumps({"name": name, "hash": node_hash, "cmd": cmd,
+                                               "seconds": round(secs, 2)}, indent=2) + "\n")
+    log(f"[dag] done    {name} in {secs:.1f}s")
+    return True
+
+
+def link(target: Path, link_path: Path):
+    """Point a friendly path (e.g. exp/chunk_sweep/chunk_100/index) at a cache output."""
+    link_path.parent.mkdir(parents=True, exist_ok=True)
+    if link_path.is_symlink() or link_path.is_file():
+        link_path.unlink()
+    elif link_path.is_dir():
+        raise FileExistsError(f"{link_path} is a real directory; move it away to link the cached output")
+    link_path.symlink_to(os.path.relpath(target, link_path.parent))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "task":
+        tasks = Path(sys.argv[2]).read_text().splitlines()
+        t = json.loads(tasks[int(sys.argv[3]) - 1])
+        sys.exit(0 if execute(t["name"], t["hash"], t["out"], t["cmd"]) else 1)
+    print(__doc__)
+    sys.exit(2)
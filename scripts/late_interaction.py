@@ -0,0 +1,160 @@
+"""
+Late-interaction (ColBERT-style) reranking: per-token passage embeddings computed once at index
+time, scored at query time by MaxSim:
+
+  score(q, p) = sum_i max_j  <q_i, p_j>      (token vectors L2-normalized)
+
+Checkpoint dir (52_train_late_interaction.py):
+  HF encoder + tokenizer, proj.pt (hidden -> dim linear), late.json {dim, max_len_q, max_len_p}
+
+Token store dir (22_index_token_embeddings.py), row i = meta.jsonl line i:
+  tokens.bin   [n_tokens, dim] int8 (per-token symmetric scale) or float16, memory-mapped
+  scales.bin   [n_tokens] float16 (int8 only)
+  offsets.npy  int64 [n_rows + 1]
+  store.json   {dim, dtype, n_rows, n_tokens, model}
+"""
+
+import json
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+
+class LateInteractionEncoder(torch.nn.Module):
+    def __init__(self, base: str, dim: int = 128, max_len_q: int = 32, max_len_p: int = 256):
+        super().__init__()
+        self.tokenizer = AutoTokenizer.from_pretrained(base, use_fast=True)
+        self.encoder = AutoModel.from_pretrained(base)
+        self.proj = torch.nn.Linear(self.encoder.config.hidden_size, dim, bias=False)
+        self.dim, self.max_len_q, self.max_len_p = dim, max_len_q, max_len_p
+
+    @classmethod
+    def load(cls, ckpt: str) -> "LateInteractionEncoder":
+        cfg = json.loads((Path(ckpt) / "late.json").read_text())
+        enc = cls(ckpt, cfg["dim"], cfg["max_len_q"], cfg["max_len_p"])
+        enc.proj.load_state_dict(torch.load(Path(ckpt) / "proj.pt", map_location="cpu"))
+        return enc.eval()
+
+    def save(self, out: str, extra: dict = None):
+        Path(out).mkdir(parents=True, exist_ok=True)
+        self.encoder.save_pretrained(out)
+        self.tokenizer.save_pretrained(out)
+        torch.save(self.proj.state_dict(), Path(out) / "proj.pt")
+        cfg = {"dim": self.dim, "max_len_q": self.max_len_q, "max_len_p": self.max_len_p, **(extra or {})}
+        (Path(out) / "late.json").write_text(json.dumps(cfg, indent=2) + "\n")
+
+    @property
+    def device(self):
+        return self.proj.weight.device
+
+    def forward(self, texts: List[str], is_query: bool):
+        """-> (B, L, dim) normalized token embeddings, (B, L) attention mask."""
+        enc = self.tokenizer(texts, padding=True, truncation=True, return_tensors="pt",
+                             max_length=self.max_len_q if is_query else self.max_len_p)
+        enc = {k: v.to(self.device) for k, v in enc.items()}
+        hidden = self.encoder(**enc).last_hidden_state
+        emb = torch.nn.functional.normalize(self.proj(hidden), dim=-1)
+        return emb, enc["attention_mask"]
+
+    @torch.inference_mode()
+    def encode(self, texts: List[str], is_query: bool, batch_size: int = 64) -> List[np.ndarray]:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            emb, mask = self(texts[start:start + batch_size], is_query)
+            emb, lens = emb.float().cpu().numpy(), mask.sum(1).cpu().numpy()
+            out.extend(e[:n] for e, n in zip(emb, lens))
+        return out
+
+
+def maxsim_loss(enc: LateInteractionEncoder, queries: List[str], docs: List[str], n_per_q: int):
+    """Listwise softmax loss; docs are [pos, neg, neg, ...] per query, n_per_q each."""
+    q, qm = enc(queries, is_query=True)                      # (B, Lq, d)
+    p, pm = enc(docs, is_query=False)                        # (B*n, Lp, d)
+    B = q.shape[0]
+    p = p.view(B, n_per_q, p.shape[1], -1)
+    pm = pm.view(B, n_per_q, -1)
+    sim = torch.einsum("bqd,bntd->bnqt", q, p)               # (B, n, Lq, Lp)
+    sim = sim.masked_fill(pm[:, :, None, :] == 0, -1e4)
+    scores = (sim.max(-1).values * qm[:, None, :]).sum(-1)   # (B, n)
+    target = torch.zeros(B, dtype=torch.long, device=scores.device)
+    return torch.nn.functional.cross_entropy(scores, target)
+
+
+class TokenEmbStore:
+    def __init__(self, store_dir):
+        store_dir = Path(store_dir)
+        self.info = json.loads((store_dir / "store.json").read_text())
+        self.dim, n_tok = self.info["dim"], self.info["n_tokens"]
+        self.offsets = np.load(store_dir / "offsets.npy", mmap_mode="r")
+        dtype = np.int8 if self.info["dtype"] == "int8" else np.float16
+        self.tokens = np.memmap(store_dir / "tokens.bin", dtype=dtype, mode="r", shape=(n_tok, self.dim))
+        self.scales = (np.memmap(store_dir / "scales.bin", dtype=np.float16, mode="r", shape=(n_tok,))
+                       if self.info["dtype"] == "int8" else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def gather(self, rows: List[int]):
+        """Concatenated float32 token matrix for rows, plus each row's token count."""
+        starts = np.asarray(self.offsets[rows], dtype=np.int64)
+        lens = np.asarray(self.offsets[np.asarray(rows) + 1], dtype=np.int64) - starts
+        idx = np.repeat(starts - np.cumsum(lens) + lens, lens) + np.arange(lens.sum())
+        mat = np.asarray(self.tokens[idx], dtype=np.float32)
+        if self.scales is not None:
+            mat *= np.asarray(self.scales[idx], dtype=np.float32)[:, None] / 127.0
+        return mat, lens
+
+
+def write_store(out_dir, emb_batches, dim: int, dtype: str = "int8", info: dict = None) -> int:
+    """Stream lists of per-passage (n_tok, dim) arrays into a token store."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    offsets = [0]
+    with open(out_dir / "tokens.bin", "wb") as ft, open(out_dir / "scales.bin", "wb") as fs:
+        for batch in emb_batches:
+            for e in batch:
+                if dtype == "int8":
+                    scale = np.abs(e).max(axis=1).clip(min=1e-8)
+                    ft.write(np.round(e / scale[:, None] * 127).astype(np.int8).tobytes())
+                    fs.write(scale.astype(np.float16).tobytes())
+                else:
+                    ft.write(e.astype(np.float16).tobytes())
+                offsets.append(offsets[-1] + len(e))
+    if dtype != "int8":
+        (out_dir / "scales.bin").unlink()
+    np.save(out_dir / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    meta = {"dim": dim, "dtype": dtype, "n_rows": len(offsets) - 1, "n_tokens": offsets[-1], **(info or {})}
+    (out_dir / "store.json").write_text(json.dumps(meta, indent=2) + "\n")
+    return len(offsets) - 1
+
+
+def maxsim(q: np.ndarray, mat: np.ndarray, lens: np.ndarray) -> np.ndarray:
+    """Vectorized MaxSim of one query (Lq, d) against concatenated passage tokens."""
+    scores = np.zeros(len(lens), dtype=np.float32)
+    keep = lens > 0
+    if not keep.any():
+        return scores
+    sim = mat @ q.T                                           # (T, Lq)
+    starts = np.concatenate([[0], np.cumsum(lens[keep])[:-1]])
+    scores[keep] = np.maximum.reduceat(sim, starts, axis=0).sum(axis=1)
+    return scores
+
+
+class LateInteractionReranker:
+    """Drop-in scorer for 60_rerank.py: scores FAISS rows straight from the token store."""
+
+    def __init__(self, ckpt: str, store_dir: str, threads: int = None):
+        if threads:
+            torch.set_num_threads(threads)
+        self.encoder = LateInteractionEncoder.load(ckpt)
+        self.store = TokenEmbStore(store_dir)
+        if self.store.dim != self.encoder.dim:
+            raise ValueError(f"token store dim {self.store.dim} != checkpoint dim {self.encoder.dim}")
+
+    def score_rows(self, qtext: str, rows: List[int]) -> np.ndarray:
+        q = self.encoder.encode([qtext], is_query=True)[0]
+        mat, lens = self.store.gather(rows)
+        return maxsim(q, mat, lens)
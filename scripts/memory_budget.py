@@ -0,0 +1,205 @@
+"""
+Memory-budget planner shared by the index build (20_embed_and_index.py) and the search stages
+(31_search_faiss.py, 60_rerank.py).
+
+  --memory_budget 3GB        (or ASTRORAG_MEMORY_BUDGET=3GB for every stage at once)
+
+Given the corpus size and the RSS measured once the model is loaded, plan_build() picks
+  - the index type: flat float32 → SQ8 (1 byte/dim) → PQ (dim/8 bytes/vector), first that fits,
+  - the encode batch size (activation estimate from the model config),
+  - the streaming block: passages parsed, encoded and added per step (nothing else is held),
+and plan_search() decides whether passage texts stay in memory or are read from meta.jsonl on
+demand (MetaTexts). When no choice fits, BudgetError lists every term and the budget that would.
+After the stage, check() compares the measured peak RSS against the budget and fails the same way.
+Estimates are deliberately conservative; the measured check is what is enforced.
+"""
+
+import json
+import os
+import re
+import resource
+import sys
+
+ENV_VAR = "ASTRORAG_MEMORY_BUDGET"
+INDEX_KINDS = ("flat", "sq8", "pq")
+SAFETY = 0.10            # budget share kept free for allocator slack / fragmentation
+PY_PASSAGE_BYTES = 600   # parsed dict + str headers per passage, on top of ~2x the raw JSON bytes
+PY_DOCID_BYTES = 90      # one "<paper>:<chunk>" str in a list
+TRAIN_VECTORS = {"flat": 0, "sq8": 20_000, "pq": 40_000}
+
+_UNITS = {"": 1 << 30, "b": 1, "k": 1 << 10, "kb": 1 << 10, "m": 1 << 20, "mb": 1 << 20,
+          "g": 1 << 30, "gb": 1 << 30, "t": 1 << 40, "tb": 1 << 40}
+
+
+class BudgetError(SystemExit):
+    """Raised (exit status 1) when a stage cannot run, or did not run, within the budget."""
+
+    def __init__(self, msg: str, plan: dict = None):
+        self.plan = plan
+        super().__init__(msg + ("\n" + format_plan(plan) if plan else ""))
+
+
+def parse_size(s) -> int:
+    """'3GB', '512m', '1.5g' -> bytes; a bare number means GB."""
+    m = re.fullmatch(r"\s*([0-9.]+)\s*([a-zA-Z]*)\s*", str(s))
+    if not m or m.group(2).lower() not in _UNITS:
+        raise ValueError(f"bad memory size {s!r} (e.g. 3GB, 512MB)")
+    return int(float(m.group(1)) * _UNITS[m.group(2).lower()])
+
+
+def budget_from(arg) -> int:
+    """--memory_budget, else $ASTRORAG_MEMORY_BUDGET, else None (no budget)."""
+    s = arg or os.environ.get(ENV_VAR)
+    return parse_size(s) if s else None
+
+
+def fmt(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.2f} {unit}"
+        n /= 1024
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r if sys.platform == "darwin" else r * 1024  # bytes on macOS, KiB on Linux
+
+
+def pq_subquantizers(dim: int) -> int:
+    """Largest divisor of dim that is <= dim / 8 (8-bit codes, so dim/8 bytes per vector)."""
+    return max(m for m in range(1, max(1, dim // 8) + 1) if dim % m == 0)
+
+
+def index_bytes_per_vector(kind: str, dim: int) -> int:
+    return {"flat": 4 * dim, "sq8": dim, "pq": pq_subquantizers(dim)}[kind]
+
+
+def index_factory_string(kind: str, dim: int) -> str:
+    return {"flat": "Flat", "sq8": "SQ8", "pq": f"PQ{pq_subquantizers(dim)}"}[kind]
+
+
+def encode_bytes_per_item(seq_len: int = 256, hidden: int = 384, heads: int = 12, intermediate: int = None) -> int:
+    """Peak float32 activations of one transformer layer for one input (inference, no grad)."""
+    intermediate = intermediate or 4 * hidden
+    return 4 * seq_len * (6 * hidden + intermediate) + 4 * 2 * heads * seq_len * seq_len
+
+
+def scan_jsonl(path):
+    """(rows, bytes) of a JSONL file without parsing it."""
+    n = 0
+    with open(path, "rb") as f:
+        for _ in f:
+            n += 1
+    return n, os.path.getsize(path)
+
+
+def format_plan(plan: dict) -> str:
+    lines = [f"  memory plan ({plan['stage']}): budget {fmt(plan['budget'])}"]
+    for k, v in plan["terms"].items():
+        lines.append(f"    {k:26s} {fmt(v):>10s}")
+    lines.append(f"    {'total (estimated)':26s} {fmt(sum(plan['terms'].values())):>10s}")
+    for k, v in plan["choices"].items():
+        lines.append(f"    {k:26s} {v}")
+    if plan.get("min_budget"):
+        lines.append(f"    {'smallest budget that fits':26s} {fmt(plan['min_budget'])}")
+    if plan.get("measured_peak"):
+        lines.append(f"    {'measured peak RSS':26s} {fmt(plan['measured_peak'])}")
+    return "\n".join(lines)
+
+
+def plan_build(budget: int, n: int, text_bytes: int, dim: int, baseline: int, item_bytes: int,
+               max_batch: int = 512, min_batch: int = 8) -> dict:
+    """Index type, encode batch and streaming block for embedding n passages within budget.
+
+    baseline: RSS with the model loaded; item_bytes: encode_bytes_per_item() for the model.
+    """
+    avail = budget * (1 - SAFETY) - baseline
+    per_passage = 2 * text_bytes / max(1, n) + PY_PASSAGE_BYTES + 4 * dim
+    # smallest working set: min_batch inputs + one block of min_batch passages
+    floor = min_batch * item_bytes + min_batch * per_passage
+
+    plan = {"stage": "build", "budget": budget, "n_passages": n, "dim": dim}
+    for kind in INDEX_KINDS:
+        index = n * index_bytes_per_vector(kind, dim) + min(n, TRAIN_VECTORS[kind]) * 4 * dim
+        if index + floor <= avail:
+            break
+    spare = avail - index
+    batch = max_batch
+    while batch > min_batch and batch * item_bytes > spare / 2:
+        batch //= 2
+    # the rest of the spare memory holds the block being parsed/encoded; whole multiples of batch
+    block = int((spare - batch * item_bytes) // per_passage) // batch * batch
+    block = max(batch, min(block, n))
+    plan["choices"] = {"index": kind, "faiss_factory": index_factory_string(kind, dim),
+                       "encode_batch": batch, "block_passages": block}
+    plan["terms"] = {"baseline (model loaded)": baseline, f"index ({kind})": index,
+                     "encode activations": batch * item_bytes, "passage block": int(block * per_passage)}
+    if index + floor > avail:
+        plan["min_budget"] = int((baseline + index + floor) / (1 - SAFETY))
+        raise BudgetError(f"[memory] {n:,} passages do not fit in {fmt(budget)}, even as a {kind} index "
+                          f"with batch {min_batch}", plan)
+    return plan
+
+
+def plan_search(budget: int, index_path, meta_path, baseline: int) -> dict:
+    """Check that the index + doc ids fit next to the loaded models; keep texts in memory if they fit too."""
+    n, text_bytes = scan_jsonl(meta_path)
+    avail = budget * (1 - SAFETY) - baseline
+    index = os.path.getsize(index_path)       # read_index() holds the whole file
+    ids = n * PY_DOCID_BYTES
+    texts = 2 * text_bytes + n * PY_PASSAGE_BYTES // 4
+    keep = index + ids + texts <= avail
+    plan = {"stage": "search", "budget": budget, "n_passages": n,
+            "choices": {"passage_texts": "memory" if keep else "disk (meta.jsonl offsets)"},
+            "terms": {"baseline (models loaded)": baseline, "index": index, "doc ids": ids,
+                      "passage texts" if keep else "text offsets": texts if keep else 8 * n}}
+    if index + ids + 8 * n > avail:
+        plan["min_budget"] = int((baseline + index + ids + 8 * n) / (1 - SAFETY))
+        raise BudgetError(f"[memory] index {index_path} does not fit in {fmt(budget)}; rebuild it under "
+                          f"the budget (20_embed_and_index.py --memory_budget) for a compressed index", plan)
+    return plan
+
+
+def check(plan: dict, out_path=None) -> dict:
+    """Measured peak RSS vs the budget; records it in the plan (and out_path), fails if over."""
+    plan["measured_peak"] = peak_rss()
+    if out_path:
+        with open(out_path, "w") as f:
+            json.dump(plan, f, indent=2)
+    if plan["measured_peak"] > plan["budget"]:
+        raise BudgetError(f"[memory] {plan['stage']} peaked at {fmt(plan['measured_peak'])}, over the "
+                          f"{fmt(plan['budget'])} budget", plan)
+    print(f"[memory] {plan['stage']} peak RSS {fmt(plan['measured_peak'])} within {fmt(plan['budget'])}")
+    return plan
+
+
+class MetaTexts:
+    """Passage texts read from meta.jsonl on demand: row -> text, with only byte offsets in memory.
+
+    Thread-safe (os.pread), so the pipelined scorers in 60_rerank.py can share one instance.
+    """
+
+    def __init__(self, meta_path, field: str = "passage"):
+        import numpy as np
+        offsets = [0]
+        with open(meta_path, "rb") as f:
+            for line in f:
+                offsets.append(offsets[-1] + len(line))
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.field = field
+        self.fd = os.open(meta_path, os.O_RDONLY)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(os.pread(self.fd, end - start, start)).get(self.field, "") or ""
@@ -0,0 +1,209 @@
+"""
+Lightweight per-stage instrumentation: timers, counters and histograms written to one JSON file.
+
+  import perf
+  perf.enable(args.trace)                  # no-op for None; ASTRORAG_TRACE=<path> also enables it
+  with perf.span("parse", items=n):        # wall + CPU time, items/sec
+      ...
+  with perf.span("encode") as s:           # items can be set once known
+      s.items = len(batch)
+  perf.count("skipped")                    # counters
+  perf.hist("batch_size", len(batch))      # value -> count histograms
+
+The output is a Chrome trace JSON object ({"traceEvents": [...]}, opens in chrome://tracing or
+ui.perfetto.dev) that also carries the aggregated "summary" per span name (count, wall/CPU
+seconds, items/sec, peak RSS), "counters" and "histograms". It is written at exit, or by close().
+Trace events are kept up to MAX_EVENTS per span name; "dropped_events" counts the rest by name.
+
+When tracing is off, span() hands back one shared no-op context manager and count()/hist() return
+immediately, so instrumented hot loops pay a function call per section and nothing else.
+"""
+
+import atexit
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+ENV_VAR = "ASTRORAG_TRACE"
+MAX_EVENTS = 20_000  # trace events kept per span name; aggregates are always complete
+
+
+def _peak_rss_mb() -> float:
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1 << 20) if sys.platform == "darwin" else r / 1024  # bytes on macOS, KiB on Linux
+
+
+class _NullSpan:
+    items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def __setattr__(self, *_):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class Span:
+    __slots__ = ("rec", "name", "items", "args", "t0", "c0")
+
+    def __init__(self, rec, name, items, args):
+        self.rec, self.name, self.items, self.args = rec, name, items, args
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        self.c0 = time.thread_time() if self.rec.thread_cpu else time.process_time()
+        return self
+
+    def __exit__(self, *_):
+        t1 = time.perf_counter()
+        c1 = time.thread_time() if self.rec.thread_cpu else time.process_time()
+        self.rec.add(self.name, self.t0, t1 - self.t0, c1 - self.c0, self.items, self.args)
+        return False
+
+
+class Recorder:
+    def __init__(self, path: str, process_name: str = None, thread_cpu: bool = False):
+        self.path = path
+        self.process_name = process_name or os.path.basename(sys.argv[0] or "python")
+        self.thread_cpu = thread_cpu  # per-thread CPU time when stages run on threads (60_rerank.py)
+        self.t_start = time.perf_counter()
+        self.c_start = time.process_time()
+        self.lock = threading.Lock()
+        self.agg = {}
+        self.counters = defaultdict(int)
+        self.hists = defaultdict(lambda: defaultdict(int))
+        self.events = []  # (name, t0, wall, thread, items, args); formatted in close()
+        self.dropped = defaultdict(int)  # span name -> events past MAX_EVENTS
+        self.rss_t, self.rss = float("-inf"), 0.0
+        self.closed = False
+
+    def add(self, name, t0, wall, cpu, items, args):
+        with self.lock:
+            a = self.agg.get(name)
+            if a is None:
+                a = self.agg[name] = [0, 0.0, 0.0, 0, 0.0, 0.0]  # count, wall, cpu, items, max wall, rss
+            a[0] += 1
+            a[1] += wall
+            a[2] += cpu
+            if items:
+                a[3] += items
+            if wall > a[4]:
+                a[4] = wall
+            # getrusage costs about as much as the rest of add(); sample it at most every 50 ms
+            if t0 - self.rss_t > 0.05:
+                self.rss_t, self.rss = t0, _peak_rss_mb()
+            a[5] = self.rss
+            # capped per name, so one per-line span can't crowd every other span out of the trace
+            if a[0] <= MAX_EVENTS:
+                self.events.append((name, t0, wall, threading.get_ident(), items, args))
+            else:
+                self.dropped[name] += 1
+
+    def summary(self) -> dict:
+        out = {}
+        for name, (n, wall, cpu, items, max_wall, rss) in self.agg.items():
+            s = {"count": n, "wall_s": round(wall, 6), "cpu_s": round(cpu, 6), "mean_ms": round(1000 * wall / n, 3),
+                 "max_ms": round(1000 * max_wall, 3), "peak_rss_mb": round(rss, 1)}
+            if items:
+                s["items"] = items
+                s["items_per_s"] = round(items / wall, 2) if wall > 0 else None
+            out[name] = s
+        return out
+
+    def trace_events(self) -> list:
+        pid = os.getpid()
+        tids = {}
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.process_name}}]
+        for name, t0, wall, thread, items, args in self.events:
+            ev = {"name": name, "ph": "X", "ts": round((t0 - self.t_start) * 1e6, 1), "dur": round(wall * 1e6, 1),
+                  "pid": pid, "tid": tids.setdefault(thread, len(tids))}
+            if items or args:
+                ev["args"] = dict(args or {}, **({"items": items} if items else {}))
+            events.append(ev)
+        return events
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        wall = time.perf_counter() - self.t_start
+        doc = {
+            "traceEvents": self.trace_events(),
+            "displayTimeUnit": "ms",
+            "process": {"argv": sys.argv, "pid": os.getpid(), "wall_s": round(wall, 3),
+                        "cpu_s": round(time.process_time() - self.c_start, 3), "peak_rss_mb": round(_peak_rss_mb(), 1)},
+            "summary": self.summary(),
+            "counters": dict(self.counters),
+            "histograms": {k: {str(v): n for v, n in sorted(h.items())} for k, h in self.hists.items()},
+            "dropped_events": dict(self.dropped),
+        }
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with open(self.path, "w") as f:
+            f.write(json.dumps(doc))  # json.dump() streams through the slow pure-Python encoder
+        print(f"[perf] trace → {self.path}", file=sys.stderr)
+
+
+_rec = None
+
+
+def _rank_path(path: str) -> str:
+    # one file per process under torchrun / DDP
+    rank = int(os.environ.get("RANK", "0"))
+    if rank == 0:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.rank{rank}{ext}"
+
+
+def enable(path: str = None, process_name: str = None, thread_cpu: bool = False):
+    """Start recording to path (or $ASTRORAG_TRACE); returns the recorder, or None when off."""
+    global _rec
+    path = path or os.environ.get(ENV_VAR)
+    if not path:
+        return None
+    if _rec is not None:
+        return _rec
+    _rec = Recorder(_rank_path(path), process_name, thread_cpu)
+    atexit.register(_rec.close)
+    return _rec
+
+
+def enabled() -> bool:
+    return _rec is not None
+
+
+def span(name: str, items: int = None, **args):
+    if _rec is None:
+        return _NULL
+    return Span(_rec, name, items, args)
+
+
+def count(name: str, n: int = 1):
+    if _rec is None:
+        return
+    with _rec.lock:
+        _rec.counters[name] += n
+
+
+def hist(name: str, value):
+    if _rec is None:
+        return
+    with _rec.lock:
+        _rec.hists[name][value] += 1
+
+
+def close():
+    if _rec is not None:
+        _rec.close()
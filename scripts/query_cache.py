@@ -0,0 +1,146 @@
+"""
+Semantic result cache for 60_rerank.py: near-duplicate queries reuse an earlier final top-k.
+
+  cache = SemanticCache(dim=384, threshold=0.97, capacity=10000, ttl=3600, version=cache_version(...))
+  hit = cache.lookup(qemb)                 # None, or the cached entry whose query is within threshold
+  cache.insert(qemb, results, query=...)   # after the full FAISS + cross-encoder pass
+
+Entries are (normalized query embedding, reranked [(docid, score)]). Lookup is one matmul of
+the query against the live slots of a preallocated [capacity, dim] matrix: exact cosine, and
+at cache sizes (~10^4) cheaper than maintaining an ANN index with deletes. Slots are evicted
+least-recently-used when full and ignored (then freed) once older than ttl seconds.
+
+A cache belongs to one `version` (index, meta, reranker and ranking settings, see cache_version);
+save()/load() persist it between runs and a version mismatch starts empty. stats() reports hits,
+hit rate and the latency saved, estimated as (mean full-pipeline latency - lookup latency) per hit.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+def cache_version(paths, **settings) -> str:
+    """Hash of the artefacts (path, size, mtime) and settings that determine a query's results."""
+    h = hashlib.sha1()
+    for p in paths:
+        if p is None:
+            continue
+        p = Path(p)
+        files = sorted(f for f in p.rglob("*") if f.is_file()) if p.is_dir() else [p]
+        for f in files:
+            st = f.stat()
+            h.update(f"{f.name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+class SemanticCache:
+    def __init__(self, dim: int, threshold: float = 0.97, capacity: int = 10000, ttl: float = None,
+                 version: str = ""):
+        self.dim, self.threshold, self.capacity, self.ttl, self.version = dim, threshold, capacity, ttl, version
+        self.embs = np.zeros((capacity, dim), dtype=np.float32)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.entries = [None] * capacity          # slot -> {"query", "results", "created"}
+        self.lru = OrderedDict()                  # slot -> None, least recently used first
+        self.free = list(range(capacity - 1, -1, -1))
+        self.lock = threading.Lock()
+        self.n = {"lookups": 0, "hits": 0, "inserts": 0, "evicted": 0, "expired": 0}
+        self.lookup_s = 0.0
+        self.miss_s, self.miss_n = 0.0, 0
+
+    def __len__(self) -> int:
+        return len(self.lru)
+
+    def _drop(self, slot: int):
+        self.live[slot] = False
+        self.entries[slot] = None
+        self.lru.pop(slot, None)
+        self.free.append(slot)
+
+    def lookup(self, qemb: np.ndarray, now: float = None):
+        """Cached entry for the nearest cached query with cosine >= threshold, else None."""
+        t0 = time.perf_counter()
+        now = time.time() if now is None else now
+        q = np.asarray(qemb, dtype=np.float32).reshape(-1)
+        with self.lock:
+            self.n["lookups"] += 1
+            hit = None
+            if self.lru:
+                sims = self.embs @ q
+                sims[~self.live] = -np.inf
+                while True:
+                    slot = int(np.argmax(sims))
+                    if sims[slot] < self.threshold:
+                        break
+                    entry = self.entries[slot]
+                    if self.ttl is not None and now - entry["created"] > self.ttl:
+                        self.n["expired"] += 1
+                        self._drop(slot)
+                        sims[slot] = -np.inf
+                        continue
+                    self.lru.move_to_end(slot)
+                    self.n["hits"] += 1
+                    hit = dict(entry, similarity=float(sims[slot]))
+                    break
+            self.lookup_s += time.perf_counter() - t0
+        return hit
+
+    def insert(self, qemb: np.ndarray, results, query: str = None, now: float = None):
+        with self.lock:
+            if not self.free:
+                self.n["evicted"] += 1
+                self._drop(next(iter(self.lru)))
+            slot = self.free.pop()
+            self.embs[slot] = np.asarray(qemb, dtype=np.float32).reshape(-1)
+            self.live[slot] = True
+            self.entries[slot] = {"query": query, "results": [(d, float(sc)) for d, sc in results],
+                                  "created": time.time() if now is None else now}
+            self.lru[slot] = None
+            self.n["inserts"] += 1
+
+    def record_miss(self, seconds: float):
+        """Wall time of one full (uncached) pipeline pass, for the latency-saved estimate."""
+        with self.lock:
+            self.miss_s += seconds
+            self.miss_n += 1
+
+    def stats(self) -> dict:
+        n = self.n
+        mean_miss = self.miss_s / self.miss_n if self.miss_n else None
+        mean_lookup = self.lookup_s / n["lookups"] if n["lookups"] else 0.0
+        return dict(n, size=len(self), capacity=self.capacity, threshold=self.threshold, ttl=self.ttl,
+                    version=self.version,
+                    hit_rate=round(n["hits"] / n["lookups"], 4) if n["lookups"] else 0.0,
+                    mean_lookup_ms=round(1000 * mean_lookup, 3),
+                    mean_miss_ms=round(1000 * mean_miss, 3) if mean_miss is not None else None,
+                    latency_saved_s=round(n["hits"] * (mean_miss - mean_lookup), 3) if mean_miss is not None else None)
+
+    def save(self, path):
+        with self.lock:
+            slots = list(self.lru)               # LRU order survives the round trip
+            entries = [self.entries[s] for s in slots]
+            with open(path, "wb") as f:           # np.savez(str) would append ".npz"
+                np.savez(f, embs=self.embs[slots], version=np.array(self.version),
+                         entries=np.array(json.dumps(entries)))
+
+    @classmethod
+    def load(cls, path, dim: int, version: str, **kw) -> "SemanticCache":
+        """Cache from path if it exists and was saved for `version`, else an empty one."""
+        cache = cls(dim, version=version, **kw)
+        if path and os.path.exists(path):
+            z = np.load(path)
+            if str(z["version"]) == version and z["embs"].shape[1:] == (dim,):
+                entries = json.loads(str(z["entries"]))
+                now = time.time()
+                for emb, e in list(zip(z["embs"], entries))[-cache.capacity:]:
+                    if cache.ttl is None or now - e["created"] <= cache.ttl:
+                        cache.insert(emb, [tuple(r) for r in e["results"]], e["query"], now=e["created"])
+                cache.n["inserts"] = 0
+        return cache
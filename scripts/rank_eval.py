@@ -0,0 +1,265 @@
+"""
+Vectorized ranking evaluation shared by 33_eval_runs.py, 41_eval_run.py,
+40_experiment_chunk_sizes.py and 43_compare_all_chunks.py.
+
+Runs and qrels are mapped to integer ids once and turned into a relevance tensor
+  rel[run, query, rank]  (1 if the docid at that rank is relevant)
+from which NDCG / MRR / Recall at every cutoff, for every run, come out of a few cumsums.
+Metric definitions match the old per-script loops (binary gains, ideal DCG over
+min(k, #relevant), recall over #relevant, duplicates in a run count at every position).
+
+Query sets:
+  "qrels"  every query with relevant docs; queries missing from a run score 0   (33_eval_runs.py)
+  "run"    each run's own queries that have relevant docs                     (41_eval_run.py)
+
+Tied ranks in a run file:
+  "docid"  by docid, then score, as 33_eval_runs.py sorted (rank, docid, score) tuples
+  "file"   in file order, as 40/41 stable-sorted by rank
+
+Runs are loaded as run_format.Run integer arrays (TREC text included), so only each run's docid
+table is looked up by string; per-entry work is array indexing.
+"""
+
+import json
+import re
+from collections import defaultdict
+from itertools import chain, repeat
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from run_format import Run, is_binary, read_run, read_trec
+
+METRICS = ("NDCG", "MRR", "Recall")
+DENSE_GOLD_MAX = 1 << 26     # queries x relevant docids below which relevance is a bitmap lookup
+_VERSION = re.compile(r"v\d+$")
+
+
+def norm_paper(x: str) -> str:
+    return (x or "").replace("http://arxiv.org/abs/","").replace("https://arxiv.org/abs/","").replace("arXiv:","").strip()
+
+
+def read_qrels(path) -> Dict[str, set]:
+    rels = defaultdict(set)
+    with open(path) as f:
+        for line in f:
+            qid, _, docid, rel = line.split()
+            if int(rel) > 0:
+                rels[qid].add(docid)
+    return rels
+
+
+def query_papers(queries_path) -> Dict[str, str]:
+    q2paper = {}
+    with open(queries_path) as f:
+        for line in f:
+            if line.strip():
+                o = json.loads(line)
+                # as given: baseline 40/41 matched the query's paper_id unnormalised
+                q2paper[o["qid"]] = o.get("paper_id", "")
+    return q2paper
+
+
+def read_dup_map(path) -> Dict[str, str]:
+    """removed docid -> canonical docid, from 15_dedup_passages.py's --dup_map JSONL."""
+    with open(path) as f:
+        return {d["dup"]: d["canonical"] for d in map(json.loads, filter(str.strip, f))}
+
+
+def qrels_from_meta(queries, meta_path, dup_map=None) -> Dict[str, set]:
+    """Every chunk of the query's source paper is relevant (same rule as 34_make_qrels.py).
+
+    queries: queries JSONL path, or a query_papers() dict to reuse across meta files.
+    dup_map: read_dup_map() dict or its JSONL path; a paper whose chunks were removed as duplicates
+    keeps their canonical copies as relevant, and an older arXiv version every chunk of the version
+    that was kept (34_make_qrels.py --dup_map).
+    """
+    q2paper = queries if isinstance(queries, dict) else query_papers(queries)
+    paper2docids = defaultdict(set)
+    with open(meta_path) as f:
+        for line in f:
+            m = json.loads(line)
+            pid = norm_paper(m.get("paper_id", ""))
+            paper2docids[pid].add(f"{pid}:{int(m['chunk_id'])}")
+    if dup_map is not None:
+        in_meta = {p: frozenset(d) for p, d in paper2docids.items()}
+        for dup, canonical in (dup_map if isinstance(dup_map, dict) else read_dup_map(dup_map)).items():
+            paper, kept = dup.rsplit(":", 1)[0], canonical.rsplit(":", 1)[0]
+            paper2docids[paper].add(canonical)
+            if kept != paper and _VERSION.sub("", kept) == _VERSION.sub("", paper):
+                paper2docids[paper].update(in_meta.get(kept, ()))
+    return {qid: paper2docids.get(pid, set()) for qid, pid in q2paper.items()}
+
+
+def load_run(path) -> Run:
+    """A run for evaluate_runs(): TREC text is parsed straight into run_format's integer layout."""
+    return read_run(path) if is_binary(path) else read_trec(path, scores=False)
+
+
+class RelevanceTensor:
+    """Integer-id relevance matrices for several runs over a shared query axis."""
+
+    def __init__(self, runs: Dict[str, Dict[str, List[str]]], qrels: Dict[str, set],
+                 depth: int = None, query_set: str = "qrels", ties: str = "docid"):
+        if query_set not in ("qrels", "run"):
+            raise ValueError(f"query_set must be 'qrels' or 'run', got {query_set!r}")
+        if ties not in ("docid", "file"):
+            raise ValueError(f"ties must be 'docid' or 'file', got {ties!r}")
+        self.ties = ties
+        self.names = list(runs)
+        if query_set == "qrels":
+            qids = [q for q in qrels if qrels[q]]
+        else:
+            seen = {}
+            for run in runs.values():
+                seen.update(dict.fromkeys(run.qids if isinstance(run, Run) else run))
+            qids = list(seen)
+        self.qids = qids
+        q_index = {q: i for i, q in enumerate(qids)}
+        if depth is None:
+            depth = max((int(run.rank.max(initial=1)) if isinstance(run, Run) else max(map(len, run.values()), default=1)
+                         for run in runs.values()), default=1)
+        self.depth = max(1, depth)
+
+        # integer ids for relevant docids only; anything else can never be a hit (-1)
+        vocab: Dict[str, int] = {}
+        gold_keys = []
+        self.n_rel = np.zeros(len(qids), dtype=np.int64)
+        for q, i in q_index.items():
+            gold = qrels.get(q, ())
+            self.n_rel[i] = len(gold)
+            gold_keys.extend((i, vocab.setdefault(d, len(vocab))) for d in gold)
+        n_docs = max(1, len(vocab))
+        gold = np.unique(np.asarray([qi * n_docs + di for qi, di in gold_keys], dtype=np.int64))
+        # (query, doc) -> relevant: a flat bitmap when it is small, else binary search over gold
+        self._gold_dense = None
+        if len(qids) * n_docs <= DENSE_GOLD_MAX:
+            self._gold_dense = np.zeros(len(qids) * n_docs, dtype=bool)
+            self._gold_dense[gold] = True
+
+        self.present = np.zeros((len(runs), len(qids)), dtype=bool)
+        self.rel = np.zeros((len(runs), len(qids), self.depth), dtype=np.float64)
+        vget = vocab.get
+        for r, run in enumerate(runs.values()):
+            if isinstance(run, Run):
+                self._add_binary(r, run, q_index, vocab, gold, n_docs)
+                continue
+            qi = [(q_index[q], docs[:self.depth]) for q, docs in run.items() if q in q_index]
+            if not qi:
+                continue
+            rows = np.fromiter((i for i, _ in qi), dtype=np.int64, count=len(qi))
+            lens = np.fromiter((len(d) for _, d in qi), dtype=np.int64, count=len(qi))
+            flat = chain.from_iterable(d for _, d in qi)
+            ids = np.fromiter(map(vget, flat, repeat(-1)), dtype=np.int64, count=int(lens.sum()))
+            row_of = np.repeat(rows, lens)
+            col = np.arange(len(ids)) - np.repeat(np.cumsum(lens) - lens, lens)
+            cand = np.flatnonzero(ids >= 0)
+            hit = cand[self._is_gold(gold, row_of[cand] * n_docs + ids[cand])]
+            self.rel[r, row_of[hit], col[hit]] = 1.0
+            self.present[r, rows] = True
+
+        self._finish_mask(query_set)
+
+    def _add_binary(self, r: int, run: Run, q_index: dict, vocab: dict, gold: np.ndarray, n_docs: int):
+        """Integer-array path: one dict lookup per distinct query / docid, the rest is indexing."""
+        qmap = np.asarray([q_index.get(q, -1) for q in run.qids], dtype=np.int64)
+        dmap = np.fromiter(map(vocab.get, run.docids, repeat(-1)), dtype=np.int64, count=len(run.docids))
+        n = len(run)
+        if not n:
+            return
+        rows_of, ids = qmap[run.q], dmap[run.doc]
+        # rank position inside each query (rank order, ties by self.ties); runs written by
+        # run_format.RunWriter are already grouped by query in rank order, so skip the sort.
+        # Both shortcuts need ranks strictly increasing inside each query, i.e. no ties.
+        pos = np.arange(n, dtype=np.int64)
+        dq, dr = np.diff(run.q), np.diff(run.rank)
+        if run.rank[0] == 1 and bool(np.where(dq == 0, dr == 1, (dq > 0) & (run.rank[1:] == 1)).all()):
+            col = run.rank.astype(np.int64) - 1        # ranks 1..n per query: position is rank - 1
+        elif bool(((dq > 0) | ((dq == 0) & (dr > 0))).all()):
+            col = pos - np.maximum.accumulate(np.where(np.r_[True, dq != 0], pos, 0))
+        else:
+            if self.ties == "docid":
+                docid_order = np.empty(len(run.docids), dtype=np.int64)
+                docid_order[np.argsort(np.asarray(run.docids, dtype=str), kind="stable")] = np.arange(len(run.docids))
+                order = np.lexsort((pos, run.score, docid_order[run.doc], run.rank, run.q))
+            else:
+                order = np.lexsort((pos, run.rank, run.q))
+            rq = run.q[order]
+            col = np.empty(n, dtype=np.int64)
+            col[order] = pos - np.maximum.accumulate(np.where(np.r_[True, rq[1:] != rq[:-1]], pos, 0))
+        keep = (rows_of >= 0) & (col < self.depth)
+        self.present[r, rows_of[keep]] = True
+        cand = np.flatnonzero(keep & (ids >= 0))
+        hit = cand[self._is_gold(gold, rows_of[cand] * n_docs + ids[cand])]
+        self.rel[r, rows_of[hit], col[hit]] = 1.0
+
+    def _is_gold(self, gold: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        if self._gold_dense is not None:
+            return self._gold_dense[keys]
+        if not len(gold):
+            return np.zeros(len(keys), dtype=bool)
+        return gold[np.minimum(np.searchsorted(gold, keys), len(gold) - 1)] == keys
+
+    def _finish_mask(self, query_set: str):
+        # which queries count towards each run's mean
+        self.mask = self.n_rel[None, :] > 0
+        if query_set == "run":
+            self.mask = self.mask & self.present
+        else:
+            self.mask = np.broadcast_to(self.mask, self.present.shape)
+
+    def per_query(self, ks: Sequence[int]) -> Dict[str, np.ndarray]:
+        """{"NDCG@k": [runs, queries], "MRR@k": ..., "Recall@k": ...} for every k."""
+        D = self.depth
+        disc = 1.0 / np.log2(np.arange(2, D + 2))
+        # DCG and hit count at every cutoff from one matmul: column j of W weights ranks < k_j
+        within = np.arange(D)[:, None] < np.minimum(ks, D)[None, :]          # [D, K]
+        W = np.concatenate([within * disc[:, None], within], axis=1)
+        at_k = (self.rel.reshape(-1, D) @ W).reshape(self.rel.shape[:2] + (2, len(ks)))
+        first = np.where(self.rel.any(-1), self.rel.argmax(-1) + 1, 0)  # 1-based rank of first hit
+        ideal_cum = np.concatenate([[0.0], np.cumsum(1.0 / np.log2(np.arange(2, max(ks) + 2)))])
+        out = {}
+        for j, k in enumerate(ks):
+            idcg = ideal_cum[np.minimum(k, self.n_rel)]
+            idcg = np.where(idcg > 0, idcg, 1.0)
+            out[f"NDCG@{k}"] = at_k[..., 0, j] / idcg
+            out[f"MRR@{k}"] = np.where((first > 0) & (first <= k), 1.0 / np.maximum(first, 1), 0.0)
+            out[f"Recall@{k}"] = at_k[..., 1, j] / np.maximum(1, self.n_rel)
+        return out
+
+    def summary(self, ks: Sequence[int] = (10,), per_query: Dict[str, np.ndarray] = None) -> Dict[str, dict]:
+        """{run: {"NDCG@k": mean, ...}} over each run's counted queries."""
+        per_query = per_query if per_query is not None else self.per_query(ks)
+        n = self.mask.sum(-1)
+        out = {}
+        for r, name in enumerate(self.names):
+            row = {}
+            for k in ks:
+                for m in METRICS:
+                    v = per_query[f"{m}@{k}"][r]
+                    row[f"{m}@{k}"] = float(v[self.mask[r]].sum() / n[r]) if n[r] else 0.0
+            out[name] = row
+        return out
+
+    def per_query_rows(self, per_query: Dict[str, np.ndarray]) -> List[dict]:
+        """Long-format rows {run, qid, metric@k...} for the queries each run is scored on."""
+        rows = []
+        for r, name in enumerate(self.names):
+            for i in np.flatnonzero(self.mask[r]):
+                row = {"run": name, "qid": self.qids[i]}
+                row.update({key: round(float(v[r, i]), 6) for key, v in per_query.items()})
+                rows.append(row)
+        return rows
+
+
+def evaluate_runs(runs: Dict[str, object], qrels: Dict[str, set], ks: Sequence[int] = (10,),
+                  query_set: str = "qrels", with_per_query: bool = False, ties: str = "docid"):
+    """Mean metrics per run (and optionally per-query rows) in one vectorized pass.
+
+    runs: {name: qid -> ranked docids, or a run_format.Run}.
+    """
+    ks = sorted(set(ks))
+    rt = RelevanceTensor(runs, qrels, depth=max(ks), query_set=query_set, ties=ties)
+    pq = rt.per_query(ks)
+    summary = rt.summary(ks, pq)
+    return (summary, rt.per_query_rows(pq)) if with_per_query else summary
@@ -0,0 +1,119 @@
+"""
+Pipelined execution for 60_rerank.py: stages connected by bounded queues.
+
+  queries ─▶ [encode] ─▶ [search] ─▶ [score × N] ─▶ writer (restores query order)
+
+Each stage runs in its own thread(s). The heavy work (torch forward passes, FAISS search) drops
+the GIL, so stages overlap instead of leaving the CPU idle between them. Every stage
+records how long its workers were busy; busy ≈ 1.0 marks the bottleneck.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List
+
+import perf
+
+_DONE = object()
+
+
+class Stage:
+    """fn(item) -> iterable of outputs, so a batch stage can fan out into per-query items."""
+
+    def __init__(self, name: str, fn: Callable, workers: int = 1):
+        self.name, self.fn, self.workers = name, fn, max(1, workers)
+        self.busy = 0.0
+        self.items = 0
+        self._alive = self.workers
+        self._lock = threading.Lock()
+
+    def _run(self, in_q: queue.Queue, out_q: queue.Queue, n_downstream: int, errors: list):
+        busy, items = 0.0, 0
+        try:
+            while not errors:
+                item = in_q.get()
+                if item is _DONE:
+                    break
+                t0 = time.perf_counter()
+                with perf.span(self.name):
+                    outs = list(self.fn(item))
+                busy += time.perf_counter() - t0
+                items += 1
+                for out in outs:
+                    out_q.put(out)
+        except BaseException as e:  # surface worker failures in the main thread
+            errors.append(e)
+        finally:
+            with self._lock:
+                self.busy += busy
+                self.items += items
+                self._alive -= 1
+                last = self._alive == 0
+            if last:  # the last worker out tells every downstream consumer to stop
+                for _ in range(n_downstream):
+                    out_q.put(_DONE)
+
+
+def run_pipeline(items: Iterable, stages: List[Stage], sink: Callable, queue_size: int = 8) -> dict:
+    """Push items through the stages; sink(out) runs in the caller's thread. Returns stage stats."""
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    errors: list = []
+    threads = []
+    for i, st in enumerate(stages):
+        n_down = stages[i + 1].workers if i + 1 < len(stages) else 1
+        for _ in range(st.workers):
+            t = threading.Thread(target=st._run, args=(queues[i], queues[i + 1], n_down, errors), daemon=True)
+            t.start()
+            threads.append(t)
+
+    def feed():
+        for it in items:
+            if errors:
+                break
+            queues[0].put(it)
+        for _ in range(stages[0].workers):
+            queues[0].put(_DONE)
+
+    t0 = time.perf_counter()
+    threading.Thread(target=feed, daemon=True).start()
+
+    sink_busy = 0.0
+    while True:
+        out = queues[-1].get()
+        if out is _DONE:
+            break
+        ts = time.perf_counter()
+        try:
+            with perf.span("write"):
+                sink(out)
+        except BaseException as e:
+            errors.append(e)
+            break
+        sink_busy += time.perf_counter() - ts
+    wall = time.perf_counter() - t0
+    if errors:
+        raise errors[0]
+    for t in threads:
+        t.join()
+
+    stats = {st.name: {"workers": st.workers, "items": st.items, "busy_s": round(st.busy, 3),
+                       "busy": round(st.busy / max(wall * st.workers, 1e-9), 3)}
+             for st in stages}
+    stats["writer"] = {"workers": 1, "busy_s": round(sink_busy, 3), "busy": round(sink_busy / max(wall, 1e-9), 3)}
+    stats["wall_s"] = round(wall, 3)
+    return stats
+
+
+class OrderedWriter:
+    """Buffers (seq, payload) results and emits them in seq order."""
+
+    def __init__(self, emit: Callable):
+        self.emit, self.next, self.pending = emit, 0, {}
+
+    def __call__(self, item):
+        seq, payload = item
+        self.pending[seq] = payload
+        while self.next in self.pending:
+            self.emit(self.pending.pop(self.next))
+            self.next += 1
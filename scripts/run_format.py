@@ -0,0 +1,261 @@
+"""
+Binary run files (.npz) next to the TREC text format, picked by file suffix everywhere a run is
+read or written (31 search, 32/60 rerank, 40/41 pair mining, 33/41 evaluation).
+
+A .npz run holds one entry per TREC line, in file order:
+  qids    [n_queries] str     query ids
+  q       [n] int32           index into qids
+  doc     [n] int32           index into docids
+  docids  [n_docs] str        docid table (each docid once)
+  rows    [n] int64           FAISS / meta.jsonl row of the doc, -1 if unknown (optional)
+  rank    [n] int32
+  score   [n] float32         (float64 when float32 cannot reproduce the TREC text)
+  header  JSON {"format": "astrorag-run", "version": 1, "tag": ..., "tags": [...] if mixed}
+
+TREC -> npz -> TREC reproduces the file byte for byte as long as scores are printed with %.6f,
+which is how every script here writes them.
+"""
+
+import json
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+FORMAT = "astrorag-run"
+VERSION = 1
+
+
+def is_binary(path) -> bool:
+    return str(path).endswith(".npz")
+
+
+class Run:
+    def __init__(self, qids, q, doc, docids, rank, score, tag: str = "run", rows=None, tags=None, tag_idx=None):
+        self.qids, self.docids = list(qids), list(docids)
+        self.q = np.asarray(q, dtype=np.int32)
+        self.doc = np.asarray(doc, dtype=np.int32)
+        self.rank = np.asarray(rank, dtype=np.int32)
+        self.score = np.asarray(score)
+        self.rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        self.tag, self.tags = tag, tags
+        self.tag_idx = None if tag_idx is None else np.asarray(tag_idx, dtype=np.int16)
+
+    def __len__(self):
+        return len(self.q)
+
+    def by_query(self, depth: int = None) -> Dict[str, np.ndarray]:
+        """qid -> entry indices in rank order (ties keep file order), cut at depth."""
+        order = np.lexsort((np.arange(len(self.q)), self.rank, self.q))
+        if depth is not None:
+            order = order[self.rank[order] <= depth]
+        bounds = np.searchsorted(self.q[order], np.arange(len(self.qids) + 1))
+        return {qid: order[bounds[i]:bounds[i + 1]] for i, qid in enumerate(self.qids)
+                if bounds[i + 1] > bounds[i]}
+
+    def ranked_docids(self, depth: int = None) -> Dict[str, List[str]]:
+        """qid -> docids in rank order (the shape rank_eval / pair mining expect)."""
+        table = self.docids
+        return {qid: [table[d] for d in self.doc[idx]] for qid, idx in self.by_query(depth).items()}
+
+    def ranked(self, depth: int = None) -> Dict[str, list]:
+        """qid -> [(rank, score, docid), ...] in rank order, like the old parse_trec()."""
+        table = self.docids
+        return {qid: [(int(r), float(s), table[d]) for r, s, d in
+                      zip(self.rank[idx], self.score[idx], self.doc[idx])]
+                for qid, idx in self.by_query(depth).items()}
+
+
+def _score_array(scores: Sequence[float], texts: Sequence[str] = None) -> np.ndarray:
+    s32 = np.asarray(scores, dtype=np.float32)
+    if texts is not None and any(f"{float(v):.6f}" != t for v, t in zip(s32, texts)):
+        return np.asarray(scores, dtype=np.float64)
+    return s32
+
+
+def _factorize(values: List[str]):
+    """(distinct values in first-seen order, int32 index of each value)."""
+    table = list(dict.fromkeys(values))
+    index = {v: i for i, v in enumerate(table)}
+    return table, np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+
+
+def read_trec(path, scores: bool = True) -> Run:
+    """scores=False skips parsing the score column (all 0.0): for callers that only need rank order."""
+    # whole-file split + column slices: no per-line Python objects beyond the tokens themselves
+    with open(path) as f:
+        tok = f.read().split()
+    if len(tok) % 6:
+        raise ValueError(f"{path}: TREC run lines need 6 columns (qid Q0 docid rank score tag)")
+    qids, q = _factorize(tok[0::6])
+    docids, doc = _factorize(tok[2::6])
+    rank = np.fromiter(map(int, tok[3::6]), dtype=np.int32, count=len(q))
+    if scores:
+        score_txt = tok[4::6]
+        score = _score_array(np.asarray(score_txt, dtype=np.float64), score_txt)
+    else:
+        score = np.zeros(len(q), dtype=np.float32)
+    names, tag_of = _factorize(tok[5::6])
+    names = names or ["run"]
+    mixed = len(names) > 1
+    return Run(qids, q, doc, docids, rank, score, tag=names[0], tags=names if mixed else None,
+               tag_idx=tag_of if mixed else None)
+
+
+def read_npz(path) -> Run:
+    z = np.load(path, allow_pickle=False)
+    header = json.loads(str(z["header"]))
+    if header.get("format") != FORMAT:
+        raise ValueError(f"{path}: not an {FORMAT} file")
+    return Run(z["qids"].tolist(), z["q"], z["doc"], z["docids"].tolist(), z["rank"], z["score"],
+               tag=header.get("tag", "run"), rows=z["rows"] if "rows" in z else None,
+               tags=header.get("tags"), tag_idx=z["tag_idx"] if "tag_idx" in z else None)
+
+
+def read_run(path) -> Run:
+    return read_npz(path) if is_binary(path) else read_trec(path)
+
+
+def write_npz(path, run: Run):
+    header = {"format": FORMAT, "version": VERSION, "tag": run.tag}
+    arrays = {"qids": np.asarray(run.qids, dtype=str), "q": run.q, "doc": run.doc,
+              "docids": np.asarray(run.docids, dtype=str), "rank": run.rank, "score": run.score}
+    if run.rows is not None:
+        arrays["rows"] = run.rows
+    if run.tags:
+        header["tags"] = run.tags
+        arrays["tag_idx"] = run.tag_idx
+    with open(path, "wb") as f:  # np.savez would append .npz to other suffixes
+        np.savez(f, header=np.asarray(json.dumps(header)), **arrays)
+
+
+def write_trec(path, run: Run):
+    qids, docids = run.qids, run.docids
+    tags = run.tags or [run.tag]
+    tag_idx = run.tag_idx if run.tag_idx is not None else np.zeros(len(run), dtype=np.int16)
+    with open(path, "w") as f:
+        for qi, d, r, s, t in zip(run.q.tolist(), run.doc.tolist(), run.rank.tolist(),
+                                  run.score.tolist(), tag_idx.tolist()):
+            f.write(f"{qids[qi]} Q0 {docids[d]} {r} {s:.6f} {tags[t]}\n")
+
+
+def write_run(path, run: Run):
+    write_npz(path, run) if is_binary(path) else write_trec(path, run)
+
+
+class RunWriter:
+    """Writes ranked lists per query as .npz or TREC text (by suffix).
+
+    TREC lines go to the file as add() is called, so memory stays flat and a crash keeps every
+    finished query. .npz runs keep compact per-query arrays (the docid table is the only per-string
+    state) and are written by close(), which `with RunWriter(...)` also calls when the block raises.
+    """
+
+    def __init__(self, path, tag: str):
+        self.path, self.tag = path, tag
+        self.n = 0                                  # entries added so far
+        self.binary = is_binary(path)
+        if self.binary:
+            self.qids, self.docidx, self.docids = [], {}, []
+            self.doc, self.score, self.rows = [], [], []
+            self.has_rows = True
+            self.f = None
+        else:
+            self.f = open(path, "w")
+
+    def add(self, qid: str, docids: Sequence[str], scores: Sequence[float], rows: Sequence[int] = None):
+        """One query's results, best first (ranks 1..n)."""
+        self.n += len(docids)
+        if not self.binary:
+            self.f.write("".join(f"{qid} Q0 {d} {r} {float(s):.6f} {self.tag}\n"
+                                 for r, (d, s) in enumerate(zip(docids, scores), 1)))
+            return
+        self.qids.append(qid)
+        idx = []
+        for d in docids:
+            i = self.docidx.get(d)
+            if i is None:
+                i = self.docidx[d] = len(self.docids); self.docids.append(d)
+            idx.append(i)
+        self.doc.append(np.asarray(idx, dtype=np.int32))
+        self.score.append(np.asarray(scores, dtype=np.float32).reshape(-1))
+        if rows is None:
+            self.has_rows = False
+        elif self.has_rows:
+            self.rows.append(np.asarray(rows, dtype=np.int64).reshape(-1))
+
+    def close(self):
+        if not self.binary:
+            if not self.f.closed:
+                self.f.close()
+            return
+        lens = [len(d) for d in self.doc]
+        cat = lambda parts, dtype: np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+        run = Run(self.qids, np.repeat(np.arange(len(lens), dtype=np.int32), lens), cat(self.doc, np.int32),
+                  self.docids, np.concatenate([np.arange(1, n + 1) for n in lens]) if lens else [],
+                  cat(self.score, np.float32), tag=self.tag,
+                  rows=cat(self.rows, np.int64) if self.has_rows and self.rows else None)
+        write_npz(self.path, run)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        # also on an exception: the queries finished so far are kept
+        self.close()
+
+
+def fill_rows(run: Run, meta_docids: List[str]) -> Run:
+    """Attach meta.jsonl row ids (first row per docid, like docid_rows()) to a run."""
+    row_of = {d: i for i, d in reversed(list(enumerate(meta_docids)))}
+    table = np.asarray([row_of.get(d, -1) for d in run.docids], dtype=np.int64)
+    run.rows = table[run.doc] if len(run.docids) else np.zeros(len(run), dtype=np.int64)
+    return run
+
+
+def map_docids(run: Run, mapping: Dict[str, str]) -> int:
+    """Rewrite docids through mapping (e.g. 15_dedup_passages.py's removed dup -> canonical).
+
+    A query that now lists a docid twice keeps its best-ranked entry; the entries below a dropped
+    one move up a rank. Rows of rewritten docids become -1 (fill_rows() them again). Returns the
+    number of entries dropped.
+    """
+    new_docids = [mapping.get(d, d) for d in run.docids]
+    changed = np.fromiter((a != b for a, b in zip(run.docids, new_docids)), dtype=bool, count=len(new_docids))
+    if run.rows is not None and len(changed):
+        run.rows = np.where(changed[run.doc], -1, run.rows)
+    run.docids, table = _factorize(new_docids)
+    if len(table):
+        run.doc = table[run.doc]
+    n = len(run)
+    if not n:
+        return 0
+    order = np.lexsort((np.arange(n), run.rank, run.q))
+    key = run.q[order].astype(np.int64) * len(run.docids) + run.doc[order]
+    drop = np.ones(n, dtype=bool)
+    drop[np.unique(key, return_index=True)[1]] = False
+    if not drop.any():
+        return 0
+    # ranks move up by the number of dropped entries above them in the same query
+    qs = run.q[order]
+    cum = np.cumsum(drop)
+    start = np.searchsorted(qs, qs)
+    shift = np.empty(n, dtype=np.int64)
+    shift[order] = cum - (cum[start] - drop[start])
+    keep = np.empty(n, dtype=bool)
+    keep[order] = ~drop
+    run.rank = (run.rank - shift)[keep].astype(np.int32)
+    run.q, run.doc, run.score = run.q[keep], run.doc[keep], run.score[keep]
+    if run.rows is not None:
+        run.rows = run.rows[keep]
+    if run.tag_idx is not None:
+        run.tag_idx = run.tag_idx[keep]
+    return int(drop.sum())
+
+
+def group_ranked(run: Run, depth: int = None) -> Dict[str, list]:
+    """qid -> [(rank, docid, score), ...] sorted by rank (40_make_weak_pairs.py's load_run shape)."""
+    out = defaultdict(list)
+    for qid, items in run.ranked(depth).items():
+        out[qid] = [(r, d, s) for r, s, d in items]
+    return out
@@ -0,0 +1,176 @@
+"""
+Deterministic synthetic arXiv-like data and offline stand-in models for benchmarks (70_benchmark.py).
+
+  records(n, seed)          raw records shaped like 00_download_arxiv.py output
+                            ({"id", "title", "summary", "categories", "published", "authors"})
+  queries_from_records()    title queries shaped like 30_build_queries.py output
+  queries_from_file()       the same queries, streamed from a write_records() file
+  StubEncoder               hashing bag-of-words encoder with SentenceTransformer.encode()'s signature
+  make_stub_cross_encoder() tiny randomly initialised BERT cross-encoder + WordPiece vocab saved to a
+                            directory, so ce_backend.load_reranker() runs the real torch code path
+
+Each record draws its words from one topic (a category) plus a shared background vocabulary, so
+same-paper retrieval with the stub encoder is better than chance and evaluation numbers move.
+Nothing here downloads anything; the same seed always produces the same bytes.
+"""
+
+import json
+import random
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+CATEGORIES = ["astro-ph.CO", "astro-ph.GA", "astro-ph.EP", "astro-ph.HE", "astro-ph.IM", "astro-ph.SR",
+              "gr-qc", "physics.comp-ph", "physics.space-ph"]
+
+_BASE_WORDS = (
+    "galaxy galaxies halo halos dark matter energy cosmic microwave background redshift survey "
+    "spectroscopic photometric star stars stellar cluster clusters formation evolution accretion "
+    "disk black hole neutron pulsar magnetar burst radio x-ray gamma-ray emission absorption line "
+    "lines spectrum spectra planet planets exoplanet atmosphere transit radial velocity orbit orbital "
+    "binary merger gravitational wave waves detector interferometer lensing weak strong shear mass "
+    "density profile simulation simulations hydrodynamic n-body numerical model models observation "
+    "observations telescope instrument calibration pipeline noise signal sample catalog luminosity "
+    "function metallicity dust gas molecular cloud interstellar medium supernova supernovae remnant "
+    "shock jet outflow wind magnetic field turbulence plasma solar corona flare heliosphere inflation "
+    "primordial baryon acoustic oscillation constraint constraints parameter parameters bayesian "
+    "inference likelihood posterior estimate estimates measurement measurements scale scales"
+).split()
+
+_FILLER = ("we the of and in a to for with on by from this that our is are using show find present "
+           "results study new analysis based data here these which".split())
+
+
+def _vocab(seed: int) -> Dict[str, List[str]]:
+    """Per-category topic words (base words + synthetic jargon) and a shared background list."""
+    rng = random.Random(seed)
+    topics = {}
+    for i, cat in enumerate(CATEGORIES):
+        words = rng.sample(_BASE_WORDS, 40) + [f"{cat.split('.')[-1].lower()}{i}x{j}" for j in range(60)]
+        topics[cat] = words
+    return {"topics": topics, "background": _BASE_WORDS + _FILLER}
+
+
+def _zipf_pick(rng: random.Random, words: List[str]) -> str:
+    # log-uniform rank (Zipf with s=1): early words in the list are much more frequent
+    k = int(len(words) ** rng.random()) - 1
+    return words[min(max(k, 0), len(words) - 1)]
+
+
+def records(n: int, seed: int = 13, words_mean: int = 180, words_sd: int = 40) -> Iterator[dict]:
+    """n raw arXiv-like records, streamed (scales to millions without holding them)."""
+    vocab = _vocab(seed)
+    rng = random.Random(seed + 1)
+    for i in range(n):
+        cat = CATEGORIES[rng.randrange(len(CATEGORIES))]
+        topic = vocab["topics"][cat]
+        n_words = max(20, int(rng.gauss(words_mean, words_sd)))
+        words = [_zipf_pick(rng, topic) if rng.random() < 0.45 else _zipf_pick(rng, vocab["background"])
+                 for _ in range(n_words)]
+        title_words = rng.sample(words, min(len(words), rng.randint(5, 10)))
+        yymm = f"{15 + i % 11:02d}{1 + (i // 11) % 12:02d}"
+        yield {
+            "id": f"http://arxiv.org/abs/{yymm}.{i:05d}v1",
+            "title": " ".join(title_words).capitalize(),
+            "summary": " ".join(words).capitalize() + ".",
+            "authors": [f"A. Author{rng.randrange(10000)}" for _ in range(rng.randint(1, 5))],
+            "categories": [cat] + ([CATEGORIES[rng.randrange(len(CATEGORIES))]] if rng.random() < 0.3 else []),
+            "published": f"20{yymm[:2]}-{yymm[2:]}-01T00:00:00Z",
+        }
+
+
+def write_records(path, n: int, seed: int = 13) -> int:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        for rec in records(n, seed):
+            f.write(json.dumps(rec) + "\n")
+    return n
+
+
+def _query(i: int, rec: dict) -> dict:
+    return {"qid": f"q{i:05d}", "query": rec["title"], "paper_id": rec["id"].split("/")[-1]}
+
+
+def queries_from_records(recs: List[dict], n: int, seed: int = 42) -> List[dict]:
+    """{"qid", "query", "paper_id"} rows, like 30_build_queries.py."""
+    rng = random.Random(seed)
+    picked = rng.sample(recs, min(n, len(recs)))
+    return [_query(i, r) for i, r in enumerate(picked)]
+
+
+def queries_from_file(path, n: int, seed: int = 42) -> List[dict]:
+    """queries_from_records() over a records JSONL, holding only the picked records in memory.
+
+    random.sample picks by position, so sampling range(#records) selects the same records.
+    """
+    with open(path) as f:
+        total = sum(1 for line in f if line.strip())
+    picked = random.Random(seed).sample(range(total), min(n, total))
+    slot = {j: i for i, j in enumerate(picked)}
+    out = [None] * len(picked)
+    with open(path) as f:
+        for j, line in enumerate(line for line in f if line.strip()):
+            if j in slot:
+                out[slot[j]] = _query(slot[j], json.loads(line))
+    return out
+
+
+class StubEncoder:
+    """Feature-hashing bag-of-words → fixed random projection. Deterministic, numpy-only.
+
+    encode() matches SentenceTransformer.encode(texts, batch_size, normalize_embeddings), so it can
+    stand in for the bi-encoder wherever only the embedding throughput of the surrounding code matters.
+    """
+
+    def __init__(self, dim: int = 128, buckets: int = 1 << 14, seed: int = 0):
+        self.dim, self.buckets = dim, buckets
+        rng = np.random.default_rng(seed)
+        self.proj = (rng.standard_normal((buckets, dim)) / np.sqrt(dim)).astype(np.float32)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _bucket(self, w: str) -> int:
+        return zlib.crc32(w.encode()) % self.buckets
+
+    def encode(self, texts, batch_size: int = 256, normalize_embeddings: bool = True, **_) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        bucket = self._bucket
+        for start in range(0, len(texts), batch_size):
+            chunk = texts[start:start + batch_size]
+            rows, cols = [], []
+            for i, t in enumerate(chunk):
+                ids = [bucket(w) for w in t.lower().split()]
+                rows.extend([i] * len(ids)); cols.extend(ids)
+            counts = np.zeros((len(chunk), self.buckets), dtype=np.float32)
+            np.add.at(counts, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), 1.0)
+            emb = np.log1p(counts) @ self.proj
+            if normalize_embeddings:
+                emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            out[start:start + len(chunk)] = emb
+        return out
+
+
+def make_stub_cross_encoder(out_dir, seed: int = 0, hidden: int = 64, layers: int = 2, max_len: int = 256) -> str:
+    """Save a tiny random BERT sequence classifier + tokenizer under out_dir (reused if present)."""
+    out_dir = Path(out_dir)
+    if (out_dir / "config.json").exists():
+        return str(out_dir)
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    vocab = _vocab(seed)
+    words = sorted(set(vocab["background"]) | {w for ws in vocab["topics"].values() for w in ws})
+    special = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    (out_dir / "vocab.txt").write_text("\n".join(special + words + [c for c in "abcdefghijklmnopqrstuvwxyz0123456789.-"]) + "\n")
+    tok = BertTokenizerFast(vocab_file=str(out_dir / "vocab.txt"), do_lower_case=True, model_max_length=max_len)
+    torch.manual_seed(seed)
+    cfg = BertConfig(vocab_size=len(tok), hidden_size=hidden, num_hidden_layers=layers, num_attention_heads=4,
+                     intermediate_size=4 * hidden, max_position_embeddings=max_len, num_labels=1)
+    BertForSequenceClassification(cfg).save_pretrained(out_dir)
+    tok.save_pretrained(out_dir)
+    return str(out_dir)
@@ -0,0 +1,199 @@
+"""
+Pre-tokenized passage cache for the cross-encoder.
+
+Passages are tokenized once (no special tokens) with the reranker's tokenizer and
+stored as a ragged array in a directory:
+  ids.npy      : flat int32 buffer with every passage's token ids back to back
+  offsets.npy  : int64 [n_rows + 1]; row i is ids[offsets[i]:offsets[i+1]]
+  info.json    : tokenizer name, max tokens per passage, row count
+
+Row i matches line i of the meta.jsonl the index was built from, so FAISS row ids
+index the cache directly. Both arrays are opened with mmap_mode="r".
+"""
+
+import json
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+
+class RaggedTokens:
+    """Read-only view over a flat token buffer + offsets."""
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray, info: dict = None):
+        self.ids = ids
+        self.offsets = offsets
+        self.info = info or {}
+
+    @classmethod
+    def open(cls, cache_dir, mmap: bool = True) -> "RaggedTokens":
+        cache_dir = Path(cache_dir)
+        mode = "r" if mmap else None
+        ids = np.load(cache_dir / "ids.npy", mmap_mode=mode)
+        offsets = np.load(cache_dir / "offsets.npy", mmap_mode=mode)
+        info_path = cache_dir / "info.json"
+        info = json.loads(info_path.read_text()) if info_path.exists() else {}
+        return cls(ids, offsets, info)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        return self.ids[self.offsets[row]:self.offsets[row + 1]]
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(np.asarray(self.offsets))
+
+
+def write_ragged(out_dir, seqs: Iterable[Sequence[int]], info: dict = None, dtype="int32"):
+    """Stream token id sequences into ids.npy / offsets.npy under out_dir."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp_ids = out_dir / "ids.bin"
+    offsets = [0]
+    with open(tmp_ids, "wb") as f:
+        for s in seqs:
+            arr = np.asarray(s, dtype=dtype)
+            f.write(arr.tobytes())
+            offsets.append(offsets[-1] + len(arr))
+    flat = np.fromfile(tmp_ids, dtype=dtype)
+    np.save(out_dir / "ids.npy", flat)
+    np.save(out_dir / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    tmp_ids.unlink()
+    info = dict(info or {})
+    info["n_rows"] = len(offsets) - 1
+    info["n_tokens"] = int(offsets[-1])
+    (out_dir / "info.json").write_text(json.dumps(info, indent=2) + "\n")
+    return len(offsets) - 1
+
+
+def tokenize_texts(tokenizer, texts: List[str], max_tokens: int, batch_size: int = 1024):
+    """Yield token id lists (no special tokens), batched through the fast tokenizer."""
+    for start in range(0, len(texts), batch_size):
+        enc = tokenizer(texts[start:start + batch_size], add_special_tokens=False,
+                        truncation=True, max_length=max_tokens)
+        for ids in enc["input_ids"]:
+            yield ids
+
+
+def _truncate_longest_first(n_q: int, n_p: int, budget: int):
+    """Lengths a fast tokenizer's truncation='longest_first' keeps for a (query, passage) pair."""
+    if n_q + n_p <= budget:
+        return n_q, n_p
+    # the shorter side (query on ties) keeps at most half the budget, the longer one the rest
+    if n_q <= n_p:
+        keep_q = min(n_q, budget // 2)
+        return keep_q, budget - keep_q
+    keep_p = min(n_p, budget // 2)
+    return budget - keep_p, keep_p
+
+
+def _find(seq, sub, start=0):
+    for i in range(start, len(seq) - len(sub) + 1):
+        if seq[i:i + len(sub)] == sub:
+            return i
+    raise ValueError("could not locate probe tokens in the tokenizer's pair encoding")
+
+
+def pair_template(tokenizer) -> dict:
+    """Special-token layout of a (query, passage) pair: prefix + q + middle + p + suffix.
+
+    Read off the tokenizer itself by encoding a probe pair, so it works for BERT-, RoBERTa-
+    and other layouts without relying on version-specific tokenizer helpers.
+    """
+    cached = getattr(tokenizer, "_astrorag_pair_template", None)
+    if cached is not None:
+        return cached
+    a = tokenizer("a", add_special_tokens=False)["input_ids"]
+    b = tokenizer("b", add_special_tokens=False)["input_ids"]
+    enc = tokenizer("a", "b", return_token_type_ids=True)
+    ids = list(enc["input_ids"])
+    types = list(enc.get("token_type_ids") or [0] * len(ids))
+    i = _find(ids, a)
+    j = _find(ids, b, i + len(a))
+    tpl = {
+        "prefix": ids[:i], "middle": ids[i + len(a):j], "suffix": ids[j + len(b):],
+        "prefix_t": types[:i], "middle_t": types[i + len(a):j], "suffix_t": types[j + len(b):],
+        "q_t": types[i] if a else 0, "p_t": types[j] if b else 1,
+    }
+    tokenizer._astrorag_pair_template = tpl
+    return tpl
+
+
+def build_pair_features(tokenizer, q_ids: Sequence[int], p_seqs: List[Sequence[int]], max_len: int):
+    """Join cached query + passage ids into padded model inputs (numpy int64 arrays)."""
+    return build_pairs_features(tokenizer, [q_ids] * len(p_seqs), p_seqs, max_len)
+
+
+def build_pairs_features(tokenizer, q_seqs: List[Sequence[int]], p_seqs: List[Sequence[int]], max_len: int):
+    """Same as build_pair_features, with a (possibly different) query per pair."""
+    tpl = pair_template(tokenizer)
+    pre, mid, suf = tpl["prefix"], tpl["middle"], tpl["suffix"]
+    budget = max_len - len(pre) - len(mid) - len(suf)
+    cuts = [_truncate_longest_first(len(q), len(p), budget) for q, p in zip(q_seqs, p_seqs)]
+    lens = [len(pre) + nq + len(mid) + np_ + len(suf) for nq, np_ in cuts]
+
+    width = max(lens)
+    pad_id = tokenizer.pad_token_id or 0
+    input_ids = np.full((len(p_seqs), width), pad_id, dtype=np.int64)
+    attention = np.zeros((len(p_seqs), width), dtype=np.int64)
+    token_type = np.zeros((len(p_seqs), width), dtype=np.int64)
+    for i, (q, p, (nq, np_)) in enumerate(zip(q_seqs, p_seqs, cuts)):
+        row, tt = input_ids[i], token_type[i]
+        pos = 0
+        for seg, seg_t in ((pre, tpl["prefix_t"]), (q[:nq], tpl["q_t"]),
+                           (mid, tpl["middle_t"]), (p[:np_], tpl["p_t"]), (suf, tpl["suffix_t"])):
+            row[pos:pos + len(seg)] = seg
+            tt[pos:pos + len(seg)] = seg_t
+            pos += len(seg)
+        attention[i, :pos] = 1
+    feats = {"input_ids": input_ids, "attention_mask": attention}
+    if "token_type_ids" in tokenizer.model_input_names:
+        feats["token_type_ids"] = token_type
+    return feats
+
+
+def docid_rows(ids: List[str]) -> dict:
+    """docid -> meta row (first occurrence wins)."""
+    rows = {}
+    for i, d in enumerate(ids):
+        rows.setdefault(d, i)
+    return rows
+
+
+def score_cached(ce, q_ids, rows, cache: RaggedTokens, batch_size: int = 64):
+    """Score cached passage rows for one query with a CrossEncoder (or a ce_backend scorer).
+
+    Rows < 0 (docid not in the cache) are scored as an empty passage, like the text path.
+    """
+    max_len = ce.max_length or ce.tokenizer.model_max_length
+    batches = (
+        build_pair_features(ce.tokenizer, q_ids,
+                            [cache[r] if r >= 0 else cache.ids[:0] for r in rows[start:start + batch_size]],
+                            max_len)
+        for start in range(0, len(rows), batch_size)
+    )
+    if hasattr(ce, "score_features"):   # onnx backends take numpy features directly
+        out = [ce.score_features(feats) for feats in batches]
+    else:
+        out = list(_torch_scores(ce, batches))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+
+def _torch_scores(ce, batches):
+    import torch
+
+    model = ce.model
+    device = next(model.parameters(), torch.zeros(0)).device
+    act = getattr(ce, "activation_fn", None) or getattr(ce, "default_activation_function", None)
+    model.eval()
+    with torch.inference_mode():
+        for feats in batches:
+            feats = {k: torch.from_numpy(v).to(device) for k, v in feats.items()}
+            logits = model(**feats, return_dict=True).logits
+            if logits.shape[-1] == 1:
+                logits = logits[:, 0]
+            if act is not None:
+                logits = act(logits)
+            yield logits.float().cpu().numpy()
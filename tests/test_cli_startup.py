@@ -0,0 +1,26 @@
+"""`astrorag <command> --help` must answer quickly and without torch / sentence-transformers / faiss."""
+
+import os
+import subprocess
+import sys
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+
+import astrorag  # noqa: E402
+
+
+def test_check_startup_every_command():
+    p = subprocess.run([sys.executable, os.path.join(SCRIPTS, "astrorag.py"), "check-startup", "--budget", "2.0"],
+                       capture_output=True, text=True)
+    assert p.returncode == 0, p.stdout + p.stderr
+    assert f"{len(astrorag.COMMANDS) + 1}/{len(astrorag.COMMANDS) + 1} within" in p.stdout
+
+
+def test_argument_errors_skip_heavy_imports():
+    code = ("import sys; sys.path.insert(0, {!r}); import astrorag\n"
+            "try:\n    astrorag.main(['rerank', '--no-such-flag'])\nexcept SystemExit:\n    pass\n"
+            "print(sorted(m for m in astrorag.HEAVY_MODULES if m in sys.modules))").format(SCRIPTS)
+    p = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert "unrecognized arguments" in p.stderr or "required" in p.stderr
+    assert p.stdout.strip() == "[]"
@@ -0,0 +1,21 @@
+"""15_dedup_passages.py candidate pairs."""
+
+import importlib
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+dedup = importlib.import_module("15_dedup_passages")
+
+
+def test_lsh_pairs_checks_every_member_pair():
+    # rows 0-2 share band 0; row 0 is the odd one out, so 1-2 must be a candidate of its own
+    sig = np.array([[1, 1, 5, 5], [1, 1, 2, 3], [1, 1, 2, 4], [1, 1, 2, 3], [9, 9, 9, 9]], dtype=np.uint32)
+    pairs = dedup.lsh_pairs(sig, bands=2)
+    assert (1, 2) in pairs
+    assert {(0, 1), (0, 2), (1, 3)} <= pairs
+    assert all(i < j for i, j in pairs)
+    assert not any(4 in p for p in pairs)
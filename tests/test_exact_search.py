@@ -0,0 +1,69 @@
+"""exact_search.NumpyFlatIndex against faiss.IndexFlatIP."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from exact_search import NumpyFlatIndex  # noqa: E402
+
+faiss = pytest.importorskip("faiss")
+
+
+def unit_rows(rng, n, d):
+    x = rng.standard_normal((n, d)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def assert_same_hits(D, I, Df, If):
+    np.testing.assert_allclose(D, Df, atol=1e-5)
+    # ids may only differ where BLAS and FAISS round two near-equal scores the other way
+    diff = I != If
+    assert diff.sum() <= 2 and np.all(np.abs(D[diff] - Df[diff]) < 1e-5)
+
+
+@pytest.fixture(scope="module")
+def case():
+    rng = np.random.default_rng(0)
+    X, Q = unit_rows(rng, 1000, 32), unit_rows(rng, 37, 32)
+    ref = faiss.IndexFlatIP(32)
+    ref.add(X)
+    return X, Q, ref
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+@pytest.mark.parametrize("block_rows,query_batch,k", [
+    (16384, 256, 10),      # one block
+    (128, 8, 10),          # several blocks, several query batches
+    (7, 5, 20),            # blocks smaller than k
+    (64, 256, 1000),       # k = ntotal
+])
+def test_matches_index_flat_ip(case, threads, block_rows, query_batch, k):
+    X, Q, ref = case
+    index = NumpyFlatIndex(X, block_rows=block_rows, query_batch=query_batch, threads=threads)
+    D, I = index.search(Q, k)
+    Df, If = ref.search(Q, k)
+    assert D.dtype == np.float32 and I.dtype == np.int64
+    assert_same_hits(D, I, Df, If)
+
+
+def test_memmap_and_padding(case, tmp_path):
+    X, Q, ref = case
+    np.save(tmp_path / "embeddings.npy", X[:15])
+    index = NumpyFlatIndex.open(tmp_path / "embeddings.npy", block_rows=4, threads=3)
+    small = faiss.IndexFlatIP(X.shape[1])
+    small.add(X[:15])
+    D, I = index.search(Q, 20)
+    Df, If = small.search(Q, 20)
+    assert_same_hits(D[:, :15], I[:, :15], Df[:, :15], If[:, :15])
+    assert (I[:, 15:] == -1).all() and (If[:, 15:] == -1).all()
+
+
+def test_ties_by_row_id():
+    X = np.tile(np.eye(4, dtype=np.float32), (3, 1))      # rows i, i+4, i+8 are identical
+    for threads in (1, 2):
+        D, I = NumpyFlatIndex(X, block_rows=5, threads=threads).search(X[:1], 3)
+        assert I.tolist() == [[0, 4, 8]] and D.tolist() == [[1.0, 1.0, 1.0]]
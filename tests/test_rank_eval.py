@@ -0,0 +1,114 @@
+"""rank_eval against the per-script loops it replaced (33_eval_runs.py / 41_eval_run.py at the baseline)."""
+
+import math
+import os
+import random
+import sys
+from collections import defaultdict
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from rank_eval import evaluate_runs, load_run  # noqa: E402
+from run_format import read_trec, write_run  # noqa: E402
+
+
+# --- baseline 33_eval_runs.py: every qrels query, ties sorted by (rank, docid, score) ---------------
+def read_run_33(path):
+    run = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            qid, _, docid, rank, score, _ = line.split()
+            run[qid].append((int(rank), docid, float(score)))
+    for q in run:
+        run[q].sort()
+    return run
+
+
+def eval_33(path, qrels, k):
+    run = read_run_33(path)
+    m = {"NDCG": 0.0, "MRR": 0.0, "Recall": 0.0}
+    for q, gold in qrels.items():
+        ranked = run.get(q, [])[:k]
+        dcg = sum(1.0 / math.log2(i + 1) for i, (_, d, _) in enumerate(ranked, 1) if d in gold)
+        ideal = sum(1.0 / math.log2(i + 1) for i in range(1, min(k, len(gold)) + 1))
+        m["NDCG"] += dcg / ideal if ideal > 0 else 0.0
+        m["MRR"] += next((1.0 / i for i, (_, d, _) in enumerate(ranked, 1) if d in gold), 0.0)
+        m["Recall"] += sum(1 for _, d, _ in ranked if d in gold) / max(1, len(gold))
+    return {key: v / len(qrels) for key, v in m.items()}
+
+
+# --- baseline 41_eval_run.py: the run's queries with gold, ties in file order ------------------------
+def eval_41(path, qrels, k):
+    by_q = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            qid, _, docid, rank, score, _ = line.split()
+            by_q[qid].append((int(rank), float(score), docid))
+    for q in by_q:
+        by_q[q].sort(key=lambda x: x[0])
+    dcg = lambda rels: sum(1.0 / math.log2(i + 1) for i, r in enumerate(rels[:k], 1) if r)
+    ndcg = mrr = rec = n = 0.0
+    for q, results in by_q.items():
+        gold = qrels.get(q, set())
+        if not gold:
+            continue
+        n += 1
+        rels = [1 if d in gold else 0 for _, _, d in results[:k]]
+        ndcg += dcg(rels) / (dcg([1] * min(k, len(gold))) or 1.0)
+        mrr += next((1.0 / i for i, r in enumerate(rels, 1) if r), 0.0)
+        rec += sum(rels) / max(1, len(gold))
+    return {"NDCG": ndcg / n, "MRR": mrr / n, "Recall": rec / n} if n else {"NDCG": 0, "MRR": 0, "Recall": 0}
+
+
+def make_case(tmp_path, seed):
+    """A shuffled TREC run with tied ranks, repeated docids, gaps and missing queries, plus qrels."""
+    rng = random.Random(seed)
+    docs = [f"2501.{i:05d}v1:{c}" for i in range(40) for c in range(3)]
+    qrels = {f"q{i}": set(rng.sample(docs, rng.randint(1, 6))) for i in range(30)}
+    qrels.update({f"q{i}": set() for i in range(30, 33)})        # queries without relevant docs
+    lines = []
+    for i in range(35):                                           # q33, q34 are not in the qrels
+        if rng.random() < 0.1:
+            continue                                              # query missing from the run
+        qid = f"q{i}"
+        gold = sorted(qrels.get(qid, ()))
+        ranked = [rng.choice(gold) if gold and rng.random() < 0.3 else rng.choice(docs) for _ in range(rng.randint(1, 25))]
+        rank = 0
+        for d in ranked:
+            rank += rng.choice((0, 1, 1, 1, 2)) if rank else 1     # ties (0) and gaps (2)
+            lines.append(f"{qid} Q0 {d} {rank} {rng.uniform(-5, 5):.6f} t\n")
+    rng.shuffle(lines)
+    path = tmp_path / f"run{seed}.trec"
+    path.write_text("".join(lines))
+    return path, {q: g for q, g in qrels.items()}
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("binary", [False, True])
+def test_matches_baseline_loops(tmp_path, seed, binary):
+    path, qrels = make_case(tmp_path, seed)
+    run_path = path
+    if binary:
+        run_path = tmp_path / f"run{seed}.npz"
+        write_run(run_path, read_trec(path))
+    gold = {q: g for q, g in qrels.items() if g}
+    for k in (1, 5, 10):
+        new33 = evaluate_runs({"r": load_run(run_path)}, gold, ks=[k], query_set="qrels")["r"]
+        new41 = evaluate_runs({"r": load_run(run_path)}, qrels, ks=[k], query_set="run", ties="file")["r"]
+        for metric, v in eval_33(path, gold, k).items():
+            assert new33[f"{metric}@{k}"] == pytest.approx(v, abs=1e-12), (metric, k)
+        for metric, v in eval_41(path, qrels, k).items():
+            assert new41[f"{metric}@{k}"] == pytest.approx(v, abs=1e-12), (metric, k)
+
+
+def test_tied_ranks_sort_by_docid(tmp_path):
+    # the reviewer's case: two entries at rank 2, the relevant one sorts first by docid
+    path = tmp_path / "tie.trec"
+    path.write_text("q1 Q0 b:1 1 3.0 t\nq1 Q0 z:9 2 2.0 t\nq1 Q0 a:0 2 2.0 t\n")
+    qrels = {"q1": {"a:0", "b:1"}}
+    m = evaluate_runs({"r": load_run(path)}, qrels, ks=[10])["r"]
+    assert m["MRR@10"] == pytest.approx(eval_33(path, qrels, 10)["MRR"])
+    assert m["NDCG@10"] == pytest.approx(eval_33(path, qrels, 10)["NDCG"])
+    assert m["NDCG@10"] == pytest.approx(1.0)
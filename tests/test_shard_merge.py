@@ -0,0 +1,69 @@
+"""20_embed_and_index.py --shard i/N + 23_merge_shards.py against a single-job build (offline, StubEncoder)."""
+
+import importlib
+import os
+import sys
+import types
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from synthetic import StubEncoder  # noqa: E402
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("torch")
+embed = importlib.import_module("20_embed_and_index")
+merge = importlib.import_module("23_merge_shards")
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    # 20 loads `sentence_transformers.SentenceTransformer(model, device=...)` inside main()
+    fake = types.ModuleType("sentence_transformers")
+    fake.SentenceTransformer = lambda name, device=None: StubEncoder(dim=32, buckets=1 << 10)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", fake)
+    monkeypatch.delenv("ASTRORAG_MEMORY_BUDGET", raising=False)
+    monkeypatch.delenv("ASTRORAG_TRACE", raising=False)
+
+
+def build(passages, index_dir, shard=None, batch=16):
+    embed.main(Namespace(passages=str(passages), index_dir=str(index_dir), model="stub", batch=batch,
+                         shard=shard, memory_budget=None, trace=None))
+
+
+def vectors(index_dir):
+    index = faiss.read_index(str(index_dir / "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+@pytest.mark.parametrize("n_shards", [1, 4, 7])
+def test_shards_reproduce_single_build(tmp_path, stub_model, n_shards):
+    passages = tmp_path / "passages.jsonl"
+    with open(passages, "w") as f:           # 101 passages: the shards are not all the same size
+        for i in range(101):
+            f.write('{"id": "p%d", "paper_id": "2501.%05d", "passage": "alpha beta %d gamma %d"}\n'
+                    % (i, i // 3, i, i % 7))
+    build(passages, tmp_path / "single")
+    for i in range(n_shards):
+        build(passages, tmp_path / "sharded", shard=(i, n_shards), batch=5)
+    merge.main(Namespace(index_dir=str(tmp_path / "sharded"), shards=None, factory="Flat", block=9,
+                         memory_budget=None, cleanup=False))
+
+    single, sharded = tmp_path / "single", tmp_path / "sharded"
+    assert (sharded / "meta.jsonl").read_bytes() == (single / "meta.jsonl").read_bytes()
+    assert (sharded / "model.txt").read_text() == (single / "model.txt").read_text()
+    # same rows in the same order; values only up to float32 rounding, since the encode batches differ
+    np.testing.assert_allclose(vectors(sharded), vectors(single), rtol=0, atol=1e-6)
+
+
+def test_merge_refuses_missing_shard(tmp_path, stub_model):
+    passages = tmp_path / "passages.jsonl"
+    passages.write_text("".join('{"id": "p%d", "passage": "w%d"}\n' % (i, i) for i in range(10)))
+    for i in (0, 2):
+        build(passages, tmp_path / "idx", shard=(i, 3))
+    with pytest.raises(SystemExit, match=r"missing or unfinished: \[1\]"):
+        merge.main(Namespace(index_dir=str(tmp_path / "idx"), shards=None, factory="Flat", block=9,
+                             memory_budget=None, cleanup=False))
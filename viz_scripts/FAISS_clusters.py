@@ -1,11 +1,13 @@
-import os, json, argparse, random
+import os, sys, json, argparse, random
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from collections import Counter
 
-from sentence_transformers import SentenceTransformer
-from sklearn.decomposition import PCA
+# Two modes:
+#   --data raw.jsonl                 balanced sample per tag, re-encoded with MiniLM, exact PCA, scatter
+#   --index index.faiss|embeddings.npy --meta meta.jsonl
+#                                    every row of an existing index: vectors via reconstruct_n / mmap,
+#                                    streamed PCA, density-binned image coloured by the meta.jsonl category
 
 p = argparse.ArgumentParser()
 p.add_argument("--data", default="../data/raw/arxiv_astro.jsonl",
@@ -14,40 +16,38 @@ p.add_argument("--per_tag", type=int, default=400, help="balanced sample per tag
 p.add_argument("--min_per_tag", type=int, default=150, help="drop tags with fewer than this many rows")
 p.add_argument("--seed", type=int, default=42)
 p.add_argument("--out", default="faiss_embed_pca.png")
+# index mode
+p.add_argument("--index", default=None,
+               help="index.faiss (reconstruct_n) or embeddings.npy (mmap): plot its vectors, no re-encoding")
+p.add_argument("--meta", default=None, help="meta.jsonl the index was built from (category per row)")
+p.add_argument("--pca", choices=["incremental", "randomized"], default="incremental",
+               help="incremental: exact, one streamed pass of mean/covariance; randomized: sklearn on --fit_sample rows")
+p.add_argument("--fit_sample", type=int, default=200000, help="rows sampled for --pca randomized")
+p.add_argument("--block", type=int, default=65536, help="rows read per step")
+p.add_argument("--bins", type=int, default=400, help="density image resolution (bins per axis)")
+p.add_argument("--max_rows", type=int, default=None, help="only the first N rows of the index")
 args = p.parse_args()
 
 random.seed(args.seed)
 np.random.seed(args.seed)
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_PATH = args.data if os.path.isabs(args.data) else os.path.join(SCRIPT_DIR, args.data)
 
-if not os.path.exists(DATA_PATH):
-    raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
-
-def load_records(path):
-    recs = []
-    if path.endswith(".jsonl"):
-        with open(path, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                recs.append(json.loads(line))
-    elif path.endswith(".json"):
-        with open(path, "r") as f:
-            obj = json.load(f)
-            recs = obj if isinstance(obj, list) else obj.get("data", [])
-    else:
-        raise ValueError("Expected .json or .jsonl")
-    return recs
-
-records = load_records(DATA_PATH)
-df = pd.DataFrame(records)
+TAG_LABELS = {
+    "astro-ph.CO": "Cosmology & Nongalactic Astrophysics",
+    "astro-ph.GA": "Astrophysics of Galaxies",
+    "astro-ph.EP": "Earth & Planetary Astrophysics",
+    "astro-ph.HE": "High-Energy Astrophysics",
+    "astro-ph.IM": "Instrumentation & Methods",
+    "astro-ph.SR": "Solar & Stellar Astrophysics",
+    "gr-qc":       "General Relativity & Quantum Cosmology",
+    "physics.comp-ph": "Computational Physics",
+    "physics.space-ph": "Space Physics"
+}
+KEEP = set(TAG_LABELS)
 
-# standardize fields
-if "abstract" not in df.columns and "summary" in df.columns:
-    df = df.rename(columns={"summary":"abstract"})
+def resolve(path):
+    return path if os.path.isabs(path) else os.path.join(SCRIPT_DIR, path)
 
 def normalize_cat(x):
     if isinstance(x, list):
@@ -58,67 +58,193 @@ def normalize_cat(x):
         return [x.strip()]
     return []
 
-df["categories"] = df["categories"].apply(normalize_cat)
-df = df.dropna(subset=["abstract", "title"])
-df = df[df["abstract"].str.len() > 0]
-
 def pick_primary(cats):
     if not cats: return None
     astro = [c for c in cats if c.startswith("astro-ph.")]
     return astro[0] if astro else cats[0]
 
-df["primary_tag"] = df["categories"].apply(pick_primary)
-df = df.dropna(subset=["primary_tag"])
-
-keep = {
-    "astro-ph.CO","astro-ph.GA","astro-ph.EP","astro-ph.HE",
-    "astro-ph.IM","astro-ph.SR","gr-qc","physics.comp-ph","physics.space-ph"
-}
-df = df[df["primary_tag"].isin(keep)]
-
-counts = Counter(df["primary_tag"])
-big_tags = {t for t,c in counts.items() if c >= args.min_per_tag}
-df = df[df["primary_tag"].isin(big_tags)].reset_index(drop=True)
+# ---------------------------------------------------------------- index mode
+
+class VectorSource:
+    """Row blocks of an index without loading it whole: np.load(mmap) for .npy, reconstruct_n for FAISS."""
+
+    def __init__(self, path, max_rows=None):
+        if path.endswith(".npy"):
+            self.embs = np.load(path, mmap_mode="r")
+            self.n, self.d = self.embs.shape
+            self.read = lambda s, n: np.asarray(self.embs[s:s + n], dtype=np.float32)
+        else:
+            import faiss
+            index = faiss.read_index(path)   # flat / SQ8 / PQ all decode via reconstruct_n
+            self.n, self.d = index.ntotal, index.d
+            self.read = lambda s, n: index.reconstruct_n(s, n)
+        self.n = min(self.n, max_rows or self.n)
+
+    def blocks(self, size):
+        for s in range(0, self.n, size):
+            yield s, self.read(s, min(size, self.n - s))
+
+def load_primary_tags(meta_path, n):
+    """int16 tag code per row (-1 = none / not kept) and the tag names, streamed from meta.jsonl."""
+    names, codes = sorted(KEEP), np.full(n, -1, dtype=np.int16)
+    lookup = {t: i for i, t in enumerate(names)}
+    with open(meta_path) as f:
+        for row, line in enumerate(f):
+            if row >= n:
+                break
+            o = json.loads(line)
+            tag = pick_primary(normalize_cat(o.get("category", o.get("categories"))))
+            codes[row] = lookup.get(tag, -1)
+    return codes, names
+
+def fit_pca(src, method, fit_sample, block, seed):
+    """(mean [d], components [d, 2]) over every row (incremental) or a random sample (randomized)."""
+    if method == "incremental":
+        # exact PCA from one pass: sum and X^T X in float64, then the top eigenvectors
+        total, gram = np.zeros(src.d), np.zeros((src.d, src.d))
+        for _, X in src.blocks(block):
+            X = X.astype(np.float64)
+            total += X.sum(0)
+            gram += X.T @ X
+        mean = total / src.n
+        cov = gram / src.n - np.outer(mean, mean)
+        vals, vecs = np.linalg.eigh(cov)
+        return mean, vecs[:, ::-1][:, :2].copy()
+    from sklearn.decomposition import PCA
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(src.n, size=min(fit_sample, src.n), replace=False))
+    X = np.concatenate([X[rows[(rows >= s) & (rows < s + len(X))] - s] for s, X in src.blocks(block)])
+    pca = PCA(n_components=2, svd_solver="randomized", random_state=seed).fit(X)
+    return pca.mean_, pca.components_.T
+
+def density_image(counts, colors):
+    """[tags, bx, by] counts -> RGB: hue = count-weighted tag colour, brightness = log density."""
+    total = counts.sum(0)
+    mix = np.einsum("tij,tc->ijc", counts, colors) / np.maximum(total, 1)[..., None]
+    light = np.log1p(total) / max(np.log1p(total.max()), 1e-9)
+    return 1 - light[..., None] * (1 - mix)   # white background, saturated where dense
+
+def index_mode(args):
+    index_path, meta_path = resolve(args.index), resolve(args.meta)
+    src = VectorSource(index_path, args.max_rows)
+    codes, names = load_primary_tags(meta_path, src.n)
+    print(f"{src.n:,} vectors (dim={src.d}) from {index_path}; tagged rows:",
+          dict(Counter(names[c] for c in codes[codes >= 0].tolist())))
+
+    mean, W = fit_pca(src, args.pca, args.fit_sample, args.block, args.seed)
+    X2 = np.empty((src.n, 2), dtype=np.float32)
+    for s, X in src.blocks(args.block):
+        X2[s:s + len(X)] = (X - mean) @ W
+
+    # bin range ignores the extreme 0.1% so a few outliers don't squash the image
+    lo, hi = np.percentile(X2, [0.1, 99.9], axis=0)
+    edges = [np.linspace(lo[j], hi[j], args.bins + 1) for j in range(2)]
+    present = sorted(set(codes[codes >= 0].tolist()))
+    counts = np.zeros((len(present), args.bins, args.bins))
+    for t, code in enumerate(present):
+        sel = X2[codes == code]
+        counts[t] = np.histogram2d(sel[:, 0], sel[:, 1], bins=edges)[0]
+    all_counts = np.histogram2d(X2[:, 0], X2[:, 1], bins=edges)[0]
+
+    cmap = plt.get_cmap("tab10")
+    colors = np.array([cmap(i % 10)[:3] for i in range(len(present))])
+    extent = [lo[0], hi[0], lo[1], hi[1]]
+    fig, (ax0, ax1) = plt.subplots(1, 2, figsize=(14, 6), dpi=140)
+    ax0.imshow(np.log1p(all_counts.T), origin="lower", extent=extent, aspect="auto", cmap="magma")
+    ax0.set_title(f"Density, {src.n:,} passages (log count)")
+    ax1.imshow(np.transpose(density_image(counts, colors), (1, 0, 2)), origin="lower", extent=extent, aspect="auto")
+    ax1.set_title("Coloured by arXiv tag")
+    handles = [plt.Line2D([], [], marker="s", ls="", color=colors[t], label=TAG_LABELS.get(names[c], names[c]))
+               for t, c in enumerate(present)]
+    ax1.legend(handles=handles, fontsize=7, loc="best")
+    for ax in (ax0, ax1):
+        ax.set_xlabel("PC1"); ax.set_ylabel("PC2")
+    fig.suptitle(f"AstroRAG index embeddings ({os.path.basename(index_path)}, {args.pca} PCA)")
+    fig.tight_layout()
+    fig.savefig(args.out)
+    print(f"Saved plot to {args.out}")
+
+# ---------------------------------------------------------------- sample mode
 
-parts = []
-for t, g in df.groupby("primary_tag", sort=True):
-    n = min(args.per_tag, len(g))
-    parts.append(g.sample(n, random_state=args.seed))
-dfb = pd.concat(parts).reset_index(drop=True)
-
-texts = (dfb["title"].fillna("") + " " + dfb["abstract"].fillna("")).tolist()
-labels = dfb["primary_tag"].tolist()
-
-print("Using tags:", sorted(set(labels)))
-print("Per-tag counts:", Counter(labels))
-
-TAG_LABELS = {
-    "astro-ph.CO": "Cosmology & Nongalactic Astrophysics",
-    "astro-ph.GA": "Astrophysics of Galaxies",
-    "astro-ph.EP": "Earth & Planetary Astrophysics",
-    "astro-ph.HE": "High-Energy Astrophysics",
-    "astro-ph.IM": "Instrumentation & Methods",
-    "astro-ph.SR": "Solar & Stellar Astrophysics",
-    "gr-qc":       "General Relativity & Quantum Cosmology",
-    "physics.comp-ph": "Computational Physics",
-    "physics.space-ph": "Space Physics"
-}
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
-emb = model.encode(texts, normalize_embeddings=True)
-
-X2 = PCA(n_components=2, random_state=args.seed).fit_transform(emb)
-
-plt.figure(figsize=(8,6), dpi=140)
-plt.figure(figsize=(8,6), dpi=140)
-for tag in sorted(set(labels)):
-    idx = [i for i, t in enumerate(labels) if t == tag]
-    display_label = TAG_LABELS.get(tag, tag)   # fallback to code if not in dict
-    plt.scatter(X2[idx,0], X2[idx,1], s=8, alpha=0.7, label=display_label)
+def load_records(path):
+    recs = []
+    if path.endswith(".jsonl"):
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                recs.append(json.loads(line))
+    elif path.endswith(".json"):
+        with open(path, "r") as f:
+            obj = json.load(f)
+            recs = obj if isinstance(obj, list) else obj.get("data", [])
+    else:
+        raise ValueError("Expected .json or .jsonl")
+    return recs
 
-plt.title("AstroRAG embeddings colored by arXiv tag (MiniLM, PCA)")
-plt.xlabel("PC1"); plt.ylabel("PC2")
-plt.legend(markerscale=2, fontsize=8, ncol=2, loc="best")
-plt.tight_layout()
-plt.savefig(args.out)
-print(f"Saved plot to {args.out}")
\ No newline at end of file
+def sample_mode(args):
+    import pandas as pd
+    from sentence_transformers import SentenceTransformer
+    from sklearn.decomposition import PCA
+
+    DATA_PATH = resolve(args.data)
+    if not os.path.exists(DATA_PATH):
+        raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
+
+    records = load_records(DATA_PATH)
+    df = pd.DataFrame(records)
+
+    # standardize fields
+    if "abstract" not in df.columns and "summary" in df.columns:
+        df = df.rename(columns={"summary":"abstract"})
+
+    df["categories"] = df["categories"].apply(normalize_cat)
+    df = df.dropna(subset=["abstract", "title"])
+    df = df[df["abstract"].str.len() > 0]
+
+    df["primary_tag"] = df["categories"].apply(pick_primary)
+    df = df.dropna(subset=["primary_tag"])
+    df = df[df["primary_tag"].isin(KEEP)]
+
+    counts = Counter(df["primary_tag"])
+    big_tags = {t for t,c in counts.items() if c >= args.min_per_tag}
+    df = df[df["primary_tag"].isin(big_tags)].reset_index(drop=True)
+
+    parts = []
+    for t, g in df.groupby("primary_tag", sort=True):
+        n = min(args.per_tag, len(g))
+        parts.append(g.sample(n, random_state=args.seed))
+    dfb = pd.concat(parts).reset_index(drop=True)
+
+    texts = (dfb["title"].fillna("") + " " + dfb["abstract"].fillna("")).tolist()
+    labels = dfb["primary_tag"].tolist()
+
+    print("Using tags:", sorted(set(labels)))
+    print("Per-tag counts:", Counter(labels))
+
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    emb = model.encode(texts, normalize_embeddings=True)
+
+    X2 = PCA(n_components=2, random_state=args.seed).fit_transform(emb)
+
+    plt.figure(figsize=(8,6), dpi=140)
+    plt.figure(figsize=(8,6), dpi=140)
+    for tag in sorted(set(labels)):
+        idx = [i for i, t in enumerate(labels) if t == tag]
+        display_label = TAG_LABELS.get(tag, tag)   # fallback to code if not in dict
+        plt.scatter(X2[idx,0], X2[idx,1], s=8, alpha=0.7, label=display_label)
+
+    plt.title("AstroRAG embeddings colored by arXiv tag (MiniLM, PCA)")
+    plt.xlabel("PC1"); plt.ylabel("PC2")
+    plt.legend(markerscale=2, fontsize=8, ncol=2, loc="best")
+    plt.tight_layout()
+    plt.savefig(args.out)
+    print(f"Saved plot to {args.out}")
+
+if args.index:
+    if not args.meta:
+        sys.exit("--index needs --meta (the meta.jsonl the index was built from)")
+    index_mode(args)
+else:
+    sample_mode(args)